@@ -33,10 +33,17 @@ GOOGLE_MAPS_API_KEY = env("GOOGLE_MAPS_API_KEY")
 CALENDLY_CLIENT_ID = env("CALENDLY_CLIENT_ID")
 CALENDLY_CLIENT_PASSWORD = env("CALENDLY_CLIENT_PASSWORD")
 CALENDLY_WEBHOOK_KEY = env("CALENDLY_WEBHOOK_KEY")
+# Keys the appointment confirmation numbers (appointments/confirmation.py).
+# Never change it once codes have been issued.
+CONFIRMATION_NUMBER_KEY = env("CONFIRMATION_NUMBER_KEY")
 # Stripe webhook secret for signature verification (from Stripe dashboard).
 STRIPE_WEBHOOK_SECRET = env("STRIPE_WEBHOOK_SECRET", default="")
 STRIPE_SECRET_KEY = env("STRIPE_SECRET_KEY")
 STRIPE_PUBLISHABLE_KEY = env("STRIPE_PUBLISHABLE_KEY")
+# Webhook payloads older than this are moved to compressed daily files
+# (see finances/archive.py and the archive_stripe_events command).
+STRIPE_EVENT_RETENTION_DAYS = env.int("STRIPE_EVENT_RETENTION_DAYS", default=30)
+STRIPE_EVENT_ARCHIVE_DIR = env("STRIPE_EVENT_ARCHIVE_DIR", default="")
 
 # Uncomment below if using ngrok to test webhook
 
@@ -194,6 +201,28 @@ DATABASES = {
     )
 }
 
+# Cache
+# Local memory works for a single process. With several workers, point CACHE_URL
+# at a shared cache (e.g. "redis://127.0.0.1:6379/1" or "dbcache://django_cache")
+# so cache invalidation (admin calendar, etc.) reaches every worker.
+CACHES = {
+    "default": env.cache("CACHE_URL", default="locmemcache://"),
+}
+
+# Long-lived entries that are invalidated on write (sessions, client dashboard
+# snapshots, site content) need a cache every worker shares: with a per-process
+# cache an invalidation only reaches one worker's copy. Without one, they are
+# read from the database instead.
+_PROCESS_LOCAL_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+CACHE_IS_SHARED = CACHES["default"]["BACKEND"] not in _PROCESS_LOCAL_CACHES
+
+# Sessions: read from the cache, written only when they change (core/sessions.py).
+# Run the purge_sessions command daily to delete expired rows.
+SESSION_ENGINE = "core.sessions" if CACHE_IS_SHARED else "django.contrib.sessions.backends.db"
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
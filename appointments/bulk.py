@@ -0,0 +1,142 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.concurrency import bounded_map
+from core.kpis import record_appointment_changes
+from users.dashboard import invalidate_dashboards
+
+from .models import Appointments, Invitee
+from .schedule import invalidate_months
+
+logger = logging.getLogger(__name__)
+
+# Bulk actions offered on the admin appointments list -> target status.
+BULK_ACTIONS = {
+    "cancel": Appointments.Status.CANCELLED,
+    "complete": Appointments.Status.COMPLETED,
+    "no_show": Appointments.Status.NO_SHOW,
+}
+
+
+def _calendly_max_concurrency() -> int:
+    return int(getattr(settings, "CALENDLY_MAX_CONCURRENCY", 4))
+
+
+def bulk_update_status(appointment_ids, new_status, reason=None):
+    """
+    Move a set of appointments to `new_status` using the same transition rules
+    as the single-appointment views (Appointments.ALLOWED_STATUS_TRANSITIONS).
+
+    The selected rows are locked and validated in one query and changed with one
+    UPDATE (plus one for invitees when cancelling). Calendly cancellations for
+    the cancelled rows run afterwards, outside the transaction, with bounded
+    concurrency.
+
+    Returns one result dict per requested id:
+        {"id": ..., "result": "updated" | "skipped" | "not_found",
+         "message": ..., "calendly": None | "cancelled" | "failed" | "skipped"}
+    """
+    if new_status not in Appointments.Status.values:
+        raise ValueError(f"Unknown appointment status: {new_status}")
+
+    cancelling = new_status == Appointments.Status.CANCELLED
+    reason = (reason or "").strip()
+    if cancelling and not reason:
+        raise ValueError("Cancellation reason is required.")
+
+    requested = []
+    for raw in appointment_ids:
+        try:
+            pk = int(raw)
+        except (TypeError, ValueError):
+            continue
+        if pk not in requested:
+            requested.append(pk)
+
+    results = {pk: {"id": pk, "result": "not_found", "message": "Appointment not found.", "calendly": None}
+               for pk in requested}
+    calendly_uris = {}
+
+    with transaction.atomic():
+        rows = (
+            Appointments.objects.select_for_update()
+            .filter(pk__in=requested)
+            .values_list("pk", "status", "calendly_event_uri", "start_time", "user_id")
+        )
+
+        eligible = []
+        start_times = []
+        user_ids = set()
+        changes = []
+        for pk, status, event_uri, start_time, user_id in rows:
+            if status == new_status:
+                results[pk].update(result="skipped", message="Status unchanged.")
+            elif not Appointments.can_transition_status(status, new_status):
+                results[pk].update(result="skipped", message=f"Cannot change {status} to {new_status}.")
+            else:
+                eligible.append(pk)
+                start_times.append(start_time)
+                user_ids.add(user_id)
+                changes.append((start_time, status, start_time, new_status))
+                results[pk].update(result="updated", message="Status updated.")
+                if cancelling and event_uri:
+                    calendly_uris[pk] = event_uri
+
+        if eligible:
+            fields = {"status": new_status}
+            if cancelling:
+                fields.update(cancellation_reason=reason, cancelled_at=timezone.now())
+            Appointments.objects.filter(pk__in=eligible).update(**fields)
+
+            if cancelling:
+                # Mirror cancellation info onto invitees (if present)
+                Invitee.objects.filter(appointment_id__in=eligible).update(
+                    canceled=True, cancellation_reason=reason
+                )
+
+            invalidate_months(start_times)
+            invalidate_dashboards(user_ids)
+            record_appointment_changes(changes)
+
+    if calendly_uris:
+        for pk, outcome in _cancel_calendly_events(calendly_uris, reason).items():
+            results[pk]["calendly"] = outcome
+
+    return [results[pk] for pk in requested]
+
+
+def _cancel_calendly_events(event_uris_by_pk, reason):
+    """
+    Best-effort Calendly cancellation for many events. Offline-safe: when the
+    Calendly API is disabled nothing is called and every row reports "skipped".
+
+    The access token is resolved (and refreshed if expired) once, here, so the
+    worker threads only make HTTP calls and never touch the database.
+    """
+    from .calendly import calendly_api_enabled, get_access_token, post_event_cancellation
+
+    if not calendly_api_enabled():
+        return {pk: "skipped" for pk in event_uris_by_pk}
+
+    access_token = get_access_token()
+    if not access_token:
+        logger.warning("Calendly API enabled but no access token configured; skipping bulk cancellation.")
+        return {pk: "failed" for pk in event_uris_by_pk}
+
+    def _cancel(item):
+        _, event_uri = item
+        return post_event_cancellation(
+            access_token=access_token, calendly_event_uri=event_uri, cancellation_reason=reason
+        )
+
+    outcomes = {}
+    for (pk, event_uri), ok, error in bounded_map(
+        _cancel, event_uris_by_pk.items(), max_workers=_calendly_max_concurrency()
+    ):
+        if error is not None:
+            logger.warning("Calendly bulk cancel error. appointment_id=%s event_uri=%s", pk, event_uri)
+        outcomes[pk] = "cancelled" if ok and error is None else "failed"
+    return outcomes
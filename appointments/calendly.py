@@ -165,6 +165,18 @@ def cancel_scheduled_event(*, calendly_event_uri: str, cancellation_reason: str)
         )
         return False
 
+    return post_event_cancellation(
+        access_token=access_token,
+        calendly_event_uri=calendly_event_uri,
+        cancellation_reason=cancellation_reason,
+    )
+
+
+def post_event_cancellation(*, access_token: str, calendly_event_uri: str, cancellation_reason: str) -> bool:
+    """
+    POST the cancellation of one Calendly event with an already resolved access
+    token. HTTP only, no database access, so it is safe in worker threads.
+    """
     cancel_url = calendly_event_uri.rstrip("/") + "/cancellation"
     payload = {"reason": cancellation_reason or "Cancelled by admin"}
     req = Request(
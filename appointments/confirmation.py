@@ -0,0 +1,127 @@
+"""
+Confirmation number generation.
+
+Codes are 8 characters from A-Z0-9 (the same alphabet the old random codes
+used). Instead of drawing random strings and hoping the unique constraint never
+fires, each code is a keyed permutation of a sequence number:
+
+    sequence number -> Feistel permutation over [0, 36**8) -> base-36, 8 chars
+
+A permutation never maps two inputs to the same output, so codes are unique
+as long as sequence numbers are, and they still look random to clients.
+
+Sequence numbers are handed out in blocks. Leasing a block inserts one
+ConfirmationNumberBlock row and its auto-increment id picks the block (block N
+starts at (N - 1) * BLOCK_STRIDE), so a confirmation number normally costs no
+extra queries at all: one INSERT per CONFIRMATION_NUMBER_BLOCK_SIZE
+appointments, per process. (Creating an appointment is still two queries, the
+INSERT and the dashboard KPI UPDATE from core/kpis.py.)
+
+CONFIRMATION_NUMBER_KEY must be set explicitly and must not change once codes
+have been issued, or new codes may repeat old ones. It is deliberately not
+derived from SECRET_KEY, which gets rotated.
+"""
+import hashlib
+import hmac
+import os
+import string
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+ALPHABET = string.ascii_uppercase + string.digits
+CODE_LENGTH = 8
+DOMAIN = len(ALPHABET) ** CODE_LENGTH  # 36**8 ~= 2**41.4
+
+_HALF_BITS = 21  # Feistel works on 42 bits, cycle-walked down to DOMAIN
+_HALF_MASK = (1 << _HALF_BITS) - 1
+_ROUNDS = 4
+
+# Spacing between block starts. Fixed so changing the block size setting can
+# never make two blocks overlap; the block size defaults to and is capped at this.
+BLOCK_STRIDE = 1000
+
+
+def _key() -> bytes:
+    key = getattr(settings, "CONFIRMATION_NUMBER_KEY", "")
+    if not key:
+        raise ImproperlyConfigured("CONFIRMATION_NUMBER_KEY must be set to generate confirmation numbers.")
+    return key.encode("utf-8")
+
+
+def _round(key: bytes, i: int, value: int) -> int:
+    digest = hmac.new(key, f"{i}:{value}".encode("ascii"), hashlib.sha256).digest()
+    return int.from_bytes(digest[:4], "big") & _HALF_MASK
+
+
+def permute(n: int, key: bytes = None) -> int:
+    """Bijection on [0, DOMAIN)."""
+    if not 0 <= n < DOMAIN:
+        raise ValueError("Sequence number out of range for 8-character codes.")
+    key = key or _key()
+    while True:
+        left, right = n >> _HALF_BITS, n & _HALF_MASK
+        for i in range(_ROUNDS):
+            left, right = right, left ^ _round(key, i, right)
+        n = (left << _HALF_BITS) | right
+        # Cycle-walking: re-apply until we land back inside the domain.
+        if n < DOMAIN:
+            return n
+
+
+def encode(n: int) -> str:
+    chars = []
+    for _ in range(CODE_LENGTH):
+        n, rem = divmod(n, len(ALPHABET))
+        chars.append(ALPHABET[rem])
+    return "".join(reversed(chars))
+
+
+def code_for_sequence(n: int) -> str:
+    return encode(permute(n))
+
+
+def block_size() -> int:
+    size = int(getattr(settings, "CONFIRMATION_NUMBER_BLOCK_SIZE", BLOCK_STRIDE))
+    return max(1, min(size, BLOCK_STRIDE))
+
+
+class _BlockAllocator:
+    """Per-process cursor over the currently leased block of sequence numbers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._next = 0
+        self._end = 0
+
+    def _lease(self):
+        from .models import ConfirmationNumberBlock
+
+        block = ConfirmationNumberBlock.objects.create()
+        # Block ids start at 1; block 1 covers [0, block_size()).
+        self._next = (block.pk - 1) * BLOCK_STRIDE
+        self._end = self._next + block_size()
+        self._pid = os.getpid()
+
+    def next_value(self) -> int:
+        with self._lock:
+            # A forked worker must not keep using its parent's block.
+            if self._pid != os.getpid() or self._next >= self._end:
+                self._lease()
+            value = self._next
+            self._next += 1
+            return value
+
+    def reset(self):
+        with self._lock:
+            self._pid = None
+            self._next = self._end = 0
+
+
+_allocator = _BlockAllocator()
+
+
+def next_confirmation_number() -> str:
+    return code_for_sequence(_allocator.next_value())
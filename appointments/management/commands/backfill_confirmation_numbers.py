@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from appointments.confirmation import next_confirmation_number
+from appointments.models import Appointments
+
+
+class Command(BaseCommand):
+    help = (
+        "Give appointments sequence-based confirmation numbers. By default only rows "
+        "with no number are filled in; --all also reissues legacy random codes so every "
+        "code in the table is collision-free by construction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Reissue every confirmation number, not just missing ones (changes codes clients may have).",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        qs = Appointments.objects.order_by("pk")
+        if not options["all"]:
+            qs = qs.filter(Q(confirmation_number__isnull=True) | Q(confirmation_number=""))
+
+        # Legacy random codes could coincide with a newly generated one; skip
+        # any such value instead of tripping the unique constraint mid-run.
+        legacy_codes = set(
+            Appointments.objects.exclude(confirmation_number__isnull=True)
+            .exclude(confirmation_number="")
+            .values_list("confirmation_number", flat=True)
+        )
+
+        def fresh_code():
+            code = next_confirmation_number()
+            while code in legacy_codes:
+                code = next_confirmation_number()
+            return code
+
+        batch_size = options["batch_size"]
+        last_pk = 0
+        updated = 0
+        while True:
+            batch = list(qs.filter(pk__gt=last_pk).only("pk", "confirmation_number")[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            for appt in batch:
+                appt.confirmation_number = fresh_code()
+            if not options["dry_run"]:
+                with transaction.atomic():
+                    Appointments.objects.bulk_update(batch, ["confirmation_number"])
+            updated += len(batch)
+
+        prefix = "Would update" if options["dry_run"] else "Updated"
+        self.stdout.write(f"{prefix} {updated} appointment(s).")
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from appointments.confirmation import code_for_sequence, _allocator
+from appointments.models import Appointments
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark confirmation number generation: pure generation speed and queries "
+        "per appointment insert. Runs inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = options["count"]
+
+        started = time.perf_counter()
+        for n in range(count):
+            code_for_sequence(n)
+        per_code_us = (time.perf_counter() - started) / count * 1e6
+        self.stdout.write(f"Generation: {per_code_us:.1f} µs per code")
+
+        with transaction.atomic():
+            user = User.objects.create_user(email="confirmation-bench@example.invalid", password=None)
+            now = timezone.now()
+            # Warm up: lease the first block outside the measurement.
+            Appointments.objects.create(user_id=user, start_time=now)
+
+            with CaptureQueriesContext(connection) as ctx:
+                for _ in range(count):
+                    Appointments.objects.create(user_id=user, start_time=now)
+
+            leases = sum(1 for q in ctx.captured_queries if "confirmationnumberblock" in q["sql"].lower())
+            extra = len(ctx.captured_queries) - count
+            self.stdout.write(
+                f"Inserts: {count}, queries: {len(ctx.captured_queries)}, "
+                f"block leases: {leases}, extra queries per insert: {extra / count:.4f}"
+            )
+            transaction.set_rollback(True)
+
+        # The leased blocks were rolled back with everything else.
+        _allocator.reset()
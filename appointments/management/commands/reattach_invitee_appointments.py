@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from appointments.models import Invitee
+from appointments.reattach import host_owned_appointments, reattach_invitee_appointments
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Move appointments booked before a client registered from the host account "
+        "onto the client's (verified, active) account."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        # Only emails that actually have host-owned appointments are worth a look.
+        emails = set(
+            Invitee.objects
+            .filter(appointment__in=host_owned_appointments())
+            .exclude(email_normalized="")
+            .values_list("email_normalized", flat=True)
+            .distinct()
+        )
+        if not emails:
+            self.stdout.write("Nothing to reattach.")
+            return
+
+        # Probes of the unique email_normalized index, one per email.
+        matched = list(
+            User.objects
+            .filter(email_normalized__in=emails)
+            .filter(is_active=True, is_staff=False, is_superuser=False, emailaddress__verified=True)
+            .distinct()
+        )
+
+        moved = 0
+        for user in matched:
+            if options["dry_run"]:
+                moved += host_owned_appointments().filter(
+                    pk__in=Invitee.objects.filter(email_normalized=user.email_normalized).values("appointment_id")
+                ).count()
+            else:
+                moved += reattach_invitee_appointments(user)
+
+        prefix = "Would move" if options["dry_run"] else "Moved"
+        self.stdout.write(f"{prefix} {moved} appointment(s) to {len(matched)} user(s).")
+
@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from appointments.sweeper import sweep_finished_appointments
+
+
+class Command(BaseCommand):
+    help = (
+        "Mark finished CONFIRMED appointments as COMPLETED (or NO_SHOW). "
+        "Idempotent and cheap; intended to run every minute from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-minutes",
+            type=int,
+            default=None,
+            help="Minutes after an appointment ends before it is swept (default: APPOINTMENT_SWEEP_GRACE_MINUTES).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Rows per UPDATE (default: APPOINTMENT_SWEEP_BATCH_SIZE).",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Report what would change without updating.")
+
+    def handle(self, *args, **options):
+        grace = None
+        if options["grace_minutes"] is not None:
+            grace = timedelta(minutes=options["grace_minutes"])
+
+        totals = sweep_finished_appointments(
+            grace=grace,
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+        )
+        prefix = "Would mark" if options["dry_run"] else "Marked"
+        self.stdout.write(f"{prefix} {totals['completed']} completed, {totals['no_show']} no-show.")
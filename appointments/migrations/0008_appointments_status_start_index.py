@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0007_calendly_oauth_token'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointments',
+            index=models.Index(fields=['status', 'start_time'], name='appt_status_start_idx'),
+        ),
+    ]
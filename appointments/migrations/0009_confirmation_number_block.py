@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0008_appointments_status_start_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConfirmationNumberBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('leased_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:08
+
+from django.db import migrations, models
+
+
+def backfill_email_normalized(apps, schema_editor):
+    Invitee = apps.get_model("appointments", "Invitee")
+    batch = []
+    for invitee in Invitee.objects.only("pk", "email").iterator(chunk_size=1000):
+        invitee.email_normalized = (invitee.email or "").strip().lower()
+        batch.append(invitee)
+        if len(batch) >= 1000:
+            Invitee.objects.bulk_update(batch, ["email_normalized"])
+            batch = []
+    if batch:
+        Invitee.objects.bulk_update(batch, ["email_normalized"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0009_confirmation_number_block'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invitee',
+            name='email_normalized',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=254),
+        ),
+        migrations.RunPython(backfill_email_normalized, migrations.RunPython.noop),
+    ]
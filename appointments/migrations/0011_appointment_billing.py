@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0010_invitee_email_normalized'),
+        ('finances', '0014_checkout_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointments',
+            name='billed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='appointments',
+            name='invoice_draft',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='appointments', to='finances.invoicedraft'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0011_appointment_billing'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='type',
+            field=models.CharField(choices=[('APPT_CONFIRM', 'Appointment Confirmation'), ('APPT_REMINDER', 'Appointment Reminder'), ('INVOICE_ISSUED', 'Invoice Issued'), ('INVOICE_REMINDER', 'Invoice Reminder'), ('PAYMENT_RECEIPT', 'Payment Receipt'), ('PASSWORD_RESET', 'Password Reset')], db_index=True, max_length=30),
+        ),
+    ]
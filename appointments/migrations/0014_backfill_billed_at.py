@@ -0,0 +1,22 @@
+from django.db import migrations
+from django.utils import timezone
+
+
+def backfill_billed_at(apps, schema_editor):
+    # Completed appointments from before batch billing were billed by hand
+    # (create_invoice), so the first bill_appointments run must not pick them up.
+    Appointments = apps.get_model("appointments", "Appointments")
+    Appointments.objects.filter(
+        status="COMPLETED", invoice_draft__isnull=True, billed_at__isnull=True,
+    ).update(billed_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0013_notification_email_confirm'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_billed_at, migrations.RunPython.noop),
+    ]
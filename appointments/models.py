@@ -2,7 +2,6 @@
 from django.conf import settings
 from django.db import models
 
-import random, string # to generate confirmation numbers
 from datetime import timedelta
 
 # Notifications model
@@ -32,8 +31,10 @@ class Notification(models.Model):
         APPT_CONFIRM = "APPT_CONFIRM", "Appointment Confirmation"
         APPT_REMINDER = "APPT_REMINDER", "Appointment Reminder"
         INVOICE_ISSUED = "INVOICE_ISSUED", "Invoice Issued"
+        INVOICE_REMINDER = "INVOICE_REMINDER", "Invoice Reminder"
         PAYMENT_RECEIPT = "PAYMENT_RECEIPT", "Payment Receipt"
         PASSWORD_RESET = "PASSWORD_RESET", "Password Reset"
+        EMAIL_CONFIRM = "EMAIL_CONFIRM", "Email Confirmation"
 
     type = models.CharField(
         max_length=30,
@@ -100,6 +101,18 @@ class Appointments(models.Model):
     cancellation_reason = models.TextField(blank=True, null=True)
     cancelled_at = models.DateTimeField(blank=True, null=True)
 
+    # Batch billing: the invoice draft that bills this appointment, set when
+    # the draft is created so a rerun can't bill it twice (finances/billing.py).
+    invoice_draft = models.ForeignKey(
+        "finances.InvoiceDraft",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="appointments",
+    )
+    # Set once that draft's invoice exists in Stripe.
+    billed_at = models.DateTimeField(blank=True, null=True)
+
     # Valid status transitions (LLW-64)
     ALLOWED_STATUS_TRANSITIONS = {
         Status.PENDING: {Status.CONFIRMED, Status.CANCELLED},
@@ -115,9 +128,10 @@ class Appointments(models.Model):
 
 
     # Creating confirmation numbers function
+    # Unique by construction (keyed permutation of a sequence), see appointments/confirmation.py
     def create_confirmation_number():
-        confirmation_number = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
-        return(confirmation_number.upper())
+        from .confirmation import next_confirmation_number
+        return next_confirmation_number()
 
     # Calendly Appointment extensions:
     calendly_event_uri = models.URLField(unique=True, null=True, blank=True,)
@@ -132,6 +146,26 @@ class Appointments(models.Model):
     confirmation_number = models.CharField(max_length=8, unique=True, null=True, blank=True, default=create_confirmation_number)
     
 
+    # Remember the stored start time, owner and status so moving an
+    # appointment can also invalidate the calendar month and the dashboard it
+    # moved out of (appointments/signals.py), and the admin KPIs can count
+    # the change (core/signals.py).
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_stored()
+        return instance
+
+    def _remember_stored(self):
+        self._loaded_start_time = self.__dict__.get("start_time")
+        self._loaded_user_id = self.__dict__.get("user_id_id")
+        self._loaded_status = self.__dict__.get("status")
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # post_save receivers have run; the row now holds these values.
+        self._remember_stored()
+
     # To-string method that converts it to smt like "Appointment: (Nov 11, 2025 - 9:00 PM) - CONFIRMED"
     # If you want to change formatting, use this: 
     # https://docs.python.org/3/library/datetime.html#strftime-and-strptime-format-codes
@@ -142,6 +176,10 @@ class Appointments(models.Model):
     # Ordered by newest first
     class Meta:
         ordering = ["-start_time"]
+        indexes = [
+            # Status filters and the completion sweeper (status + time range).
+            models.Index(fields=["status", "start_time"], name="appt_status_start_idx"),
+        ]
 
 
 # ------- Invitee model ---------
@@ -153,6 +191,8 @@ class Invitee(models.Model):
     calendly_invitee_uri = models.URLField(unique=True, null=True, blank=True)
     name = models.CharField(max_length=255)
     email = models.EmailField()
+    # Trimmed, lower-cased copy of email for indexed matching against users (kept in sync in save()).
+    email_normalized = models.CharField(max_length=254, blank=True, default="", db_index=True, editable=False)
     phone_number = models.CharField(max_length=15, blank=True, null=True)  # US numbers only
     status = models.CharField(max_length=50, default="active")
     canceled = models.BooleanField(default=False)
@@ -161,10 +201,28 @@ class Invitee(models.Model):
     calendly_created_at = models.DateTimeField(null=True, blank=True) # added again in case of Calendly event change (reschedule)
     calendly_updated_at = models.DateTimeField(null=True, blank=True) # added again in case of Calendly event change
 
+    def save(self, *args, **kwargs):
+        from users.emails import normalize_email
+
+        self.email_normalized = normalize_email(self.email)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "email" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "email_normalized"}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.name} ({self.email})"
 
 
+class ConfirmationNumberBlock(models.Model):
+    """
+    One row per block of confirmation-number sequence values leased by a process.
+    Only the auto-increment id matters; see appointments/confirmation.py.
+    """
+
+    leased_at = models.DateTimeField(auto_now_add=True)
+
+
 class CalendlyOAuthToken(models.Model):
     """
     Stores Calendly OAuth tokens for server-to-server API usage.
@@ -0,0 +1,47 @@
+import logging
+
+from django.db.models import Q
+
+from users.dashboard import invalidate_dashboards
+from users.emails import normalize_email
+
+from .models import Appointments, Invitee
+from .schedule import invalidate_months
+
+logger = logging.getLogger(__name__)
+
+
+def host_owned_appointments():
+    """
+    Appointments still attached to a host/admin account. calendly_webhook falls
+    back to the host when the invitee had no account at booking time.
+    """
+    return Appointments.objects.filter(Q(user_id__is_staff=True) | Q(user_id__is_superuser=True))
+
+
+def reattach_invitee_appointments(user):
+    """
+    Move appointments booked under `user`'s email (while they had no account)
+    from the host onto `user`, with one set-based UPDATE.
+    Only call this once the user's email address is verified.
+
+    Returns the number of appointments moved.
+    """
+    if user.is_staff or user.is_superuser:
+        return 0
+    email = normalize_email(user.email)
+    if not email:
+        return 0
+
+    qs = host_owned_appointments().filter(
+        pk__in=Invitee.objects.filter(email_normalized=email).values("appointment_id")
+    )
+    rows = list(qs.values_list("start_time", "user_id"))
+    if not rows:
+        return 0
+
+    moved = qs.update(user_id=user)
+    invalidate_months([start_time for start_time, _ in rows])
+    invalidate_dashboards({user.pk} | {host_id for _, host_id in rows})
+    logger.info("Reattached invitee appointments. user_id=%s count=%s", user.pk, moved)
+    return moved
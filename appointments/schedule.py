@@ -0,0 +1,142 @@
+"""
+Month-bucketed appointment data for the admin schedule calendar.
+
+Each calendar month is cached on its own under a per-month version token.
+Any change to an appointment in that month replaces the token, so only the
+affected month is rebuilt and navigating between untouched months never
+reaches the database. Months missing from the cache are filled with a single
+range query on start_time.
+"""
+import uuid
+from datetime import date, datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .models import Appointments, Invitee
+
+CACHE_PREFIX = "appointments:schedule"
+CACHE_TIMEOUT = 60 * 60 * 24
+# Longest range one request may ask for.
+MAX_RANGE_DAYS = 93
+
+
+def month_key(value) -> str:
+    """Bucket key ("YYYY-MM") for a date or datetime, in the site timezone."""
+    if isinstance(value, datetime):
+        value = timezone.localtime(value).date()
+    return f"{value.year:04d}-{value.month:02d}"
+
+
+def _months_between(start: date, end: date):
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        yield date(year, month, 1)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _next_month(first: date) -> date:
+    return date(first.year + 1, 1, 1) if first.month == 12 else date(first.year, first.month + 1, 1)
+
+
+def _version_key(bucket: str) -> str:
+    return f"{CACHE_PREFIX}:ver:{bucket}"
+
+
+def _bump_versions(buckets):
+    cache.set_many({_version_key(b): uuid.uuid4().hex for b in buckets}, CACHE_TIMEOUT)
+
+
+def invalidate_months(values):
+    """Drop the cached buckets covering these dates/datetimes (None is ignored)."""
+    buckets = {month_key(v) for v in values if v is not None}
+    if not buckets:
+        return
+    _bump_versions(buckets)
+    # A reader between this write and COMMIT could re-cache the old rows under
+    # the new token, so bump again once the transaction commits.
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _bump_versions(buckets))
+
+
+def _bucket_versions(buckets):
+    keys = {_version_key(b): b for b in buckets}
+    found = cache.get_many(keys.keys())
+    versions, fresh = {}, {}
+    for key, bucket in keys.items():
+        if key in found:
+            versions[bucket] = found[key]
+        else:
+            versions[bucket] = fresh[key] = uuid.uuid4().hex
+    if fresh:
+        cache.set_many(fresh, CACHE_TIMEOUT)
+    return versions
+
+
+def _query_days(start: date, end_exclusive: date):
+    """One indexed range query -> {"YYYY-MM-DD": [[id, "HH:MM", minutes, status, name], ...]}."""
+    first_invitee = Invitee.objects.filter(appointment=OuterRef("pk")).order_by("pk").values("name")[:1]
+    rows = (
+        Appointments.objects
+        .filter(
+            start_time__gte=timezone.make_aware(datetime.combine(start, time.min)),
+            start_time__lt=timezone.make_aware(datetime.combine(end_exclusive, time.min)),
+        )
+        .annotate(invitee_name=Subquery(first_invitee))
+        .order_by("start_time")
+        .values_list("pk", "start_time", "duration", "status", "invitee_name",
+                     "user_id__first_name", "user_id__last_name")
+    )
+
+    days = {}
+    for pk, start_time, duration, status, invitee_name, first, last in rows:
+        local = timezone.localtime(start_time)
+        name = invitee_name or f"{first} {last}".strip()
+        days.setdefault(local.date().isoformat(), []).append(
+            [pk, local.strftime("%H:%M"), int(duration.total_seconds() // 60), status, name]
+        )
+    return days
+
+
+def get_schedule_days(start: date, end: date):
+    """
+    Per-day appointment data for start..end (inclusive), assembled from cached
+    month buckets. Returns {"YYYY-MM-DD": [[id, "HH:MM", minutes, status, name], ...]}.
+    """
+    months = list(_months_between(start, end))
+    buckets = [month_key(m) for m in months]
+    versions = _bucket_versions(buckets)
+    data_keys = {f"{CACHE_PREFIX}:{b}:{versions[b]}": b for b in buckets}
+    cached = cache.get_many(data_keys.keys())
+
+    by_bucket = {data_keys[k]: v for k, v in cached.items()}
+    missing = [m for m in months if month_key(m) not in by_bucket]
+    if missing:
+        days = _query_days(missing[0], _next_month(missing[-1]))
+        to_cache = {}
+        for m in missing:
+            bucket = month_key(m)
+            by_bucket[bucket] = {d: appts for d, appts in days.items() if d.startswith(bucket)}
+            to_cache[f"{CACHE_PREFIX}:{bucket}:{versions[bucket]}"] = by_bucket[bucket]
+        cache.set_many(to_cache, CACHE_TIMEOUT)
+
+    start_iso, end_iso = start.isoformat(), end.isoformat()
+    result = {}
+    for bucket in buckets:
+        for day, appts in by_bucket[bucket].items():
+            if start_iso <= day <= end_iso:
+                result[day] = appts
+    return dict(sorted(result.items()))
+
+
+def parse_range(start_raw, end_raw):
+    """Validate ?start=YYYY-MM-DD&end=YYYY-MM-DD. Raises ValueError."""
+    start = date.fromisoformat(start_raw or "")
+    end = date.fromisoformat(end_raw or "")
+    if end < start:
+        raise ValueError("end is before start")
+    if end - start > timedelta(days=MAX_RANGE_DAYS):
+        raise ValueError(f"range is longer than {MAX_RANGE_DAYS} days")
+    return start, end
@@ -0,0 +1,51 @@
+from allauth.account.models import EmailAddress
+from allauth.account.signals import email_confirmed, user_signed_up
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.dashboard import invalidate_dashboards
+from users.emails import normalize_email
+
+from .models import Appointments, Invitee
+from .reattach import reattach_invitee_appointments
+from .schedule import invalidate_months
+
+
+# Keep the admin calendar's cached months and the owners' dashboard snapshots
+# in sync with appointment changes.
+# Set-based .update() calls bypass these signals and invalidate explicitly.
+@receiver(post_save, sender=Appointments)
+@receiver(post_delete, sender=Appointments)
+def invalidate_schedule_for_appointment(sender, instance, **kwargs):
+    invalidate_months([instance.start_time, getattr(instance, "_loaded_start_time", None)])
+    invalidate_dashboards([instance.user_id_id, getattr(instance, "_loaded_user_id", None)])
+
+
+@receiver(post_save, sender=Invitee)
+@receiver(post_delete, sender=Invitee)
+def invalidate_schedule_for_invitee(sender, instance, **kwargs):
+    # The calendar shows the invitee's name.
+    if Invitee.appointment.is_cached(instance):
+        invalidate_months([instance.appointment.start_time])
+        return
+    start_time = (
+        Appointments.objects.filter(pk=instance.appointment_id).values_list("start_time", flat=True).first()
+    )
+    invalidate_months([start_time])
+
+
+# Once a client proves they own an email address, give them the appointments
+# that were booked under it before they had an account.
+@receiver(email_confirmed)
+def reattach_on_email_confirmed(sender, request, email_address, **kwargs):
+    user = email_address.user
+    if normalize_email(email_address.email) == normalize_email(user.email):
+        reattach_invitee_appointments(user)
+
+
+@receiver(user_signed_up)
+def reattach_on_verified_signup(sender, request, user, **kwargs):
+    # Social signups (Google) arrive with an already-verified address and
+    # never send email_confirmed.
+    if EmailAddress.objects.filter(user=user, email__iexact=user.email, verified=True).exists():
+        reattach_invitee_appointments(user)
@@ -0,0 +1,148 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DateTimeField, ExpressionWrapper, F
+from django.utils import timezone
+
+from core.kpis import record_appointment_changes
+
+from .models import Appointments, Invitee
+from .schedule import invalidate_months
+
+logger = logging.getLogger(__name__)
+
+# Invitee.status values that mean the client never showed up
+# (set from Calendly's invitee_no_show.created webhook).
+NO_SHOW_INVITEE_STATUSES = ("no_show",)
+
+
+def sweep_grace() -> timedelta:
+    return timedelta(minutes=int(getattr(settings, "APPOINTMENT_SWEEP_GRACE_MINUTES", 15)))
+
+
+def sweep_batch_size() -> int:
+    return int(getattr(settings, "APPOINTMENT_SWEEP_BATCH_SIZE", 500))
+
+
+def finished_confirmed_appointments(now=None, grace=None):
+    """
+    CONFIRMED appointments whose start_time + duration + grace has passed.
+
+    The start_time bound is redundant with the end-time check (duration is never
+    negative) but lets the (status, start_time) index narrow the scan before the
+    computed end time is compared.
+    """
+    now = now or timezone.now()
+    cutoff = now - (sweep_grace() if grace is None else grace)
+    return (
+        Appointments.objects
+        .filter(status=Appointments.Status.CONFIRMED, start_time__lte=cutoff)
+        .annotate(end_time=ExpressionWrapper(F("start_time") + F("duration"), output_field=DateTimeField()))
+        .filter(end_time__lte=cutoff)
+    )
+
+
+def sweep_finished_appointments(now=None, grace=None, batch_size=None, dry_run=False):
+    """
+    Move finished CONFIRMED appointments to COMPLETED, or NO_SHOW when an
+    invitee was marked as a no-show, in batches of `batch_size`.
+
+    Safe to run every minute: the UPDATEs are guarded on status=CONFIRMED so
+    re-runs (or overlapping runs) never touch a row twice, and when nothing is
+    due the cost is a single indexed range query.
+
+    Returns {"completed": n, "no_show": n}.
+    """
+    batch_size = batch_size or sweep_batch_size()
+    qs = finished_confirmed_appointments(now=now, grace=grace).order_by("start_time")
+    totals = {"completed": 0, "no_show": 0}
+    seen = set()
+
+    while True:
+        rows = list(qs.exclude(pk__in=seen).values_list("pk", "start_time")[:batch_size])
+        if not rows:
+            break
+        ids = [pk for pk, _ in rows]
+
+        no_show_ids = set(
+            Invitee.objects
+            .filter(appointment_id__in=ids, status__in=NO_SHOW_INVITEE_STATUSES)
+            .values_list("appointment_id", flat=True)
+        )
+        completed_ids = [pk for pk in ids if pk not in no_show_ids]
+
+        if dry_run:
+            # Nothing is updated, so remember what we've counted to move on.
+            seen.update(ids)
+            totals["no_show"] += len(no_show_ids)
+            totals["completed"] += len(completed_ids)
+        else:
+            moved = {Appointments.Status.NO_SHOW: 0, Appointments.Status.COMPLETED: 0}
+            if no_show_ids:
+                moved[Appointments.Status.NO_SHOW] = Appointments.objects.filter(
+                    pk__in=no_show_ids, status=Appointments.Status.CONFIRMED
+                ).update(status=Appointments.Status.NO_SHOW)
+            if completed_ids:
+                moved[Appointments.Status.COMPLETED] = Appointments.objects.filter(
+                    pk__in=completed_ids, status=Appointments.Status.CONFIRMED
+                ).update(status=Appointments.Status.COMPLETED)
+            totals["no_show"] += moved[Appointments.Status.NO_SHOW]
+            totals["completed"] += moved[Appointments.Status.COMPLETED]
+            # Neither status leaves the schedule, so no start times are needed.
+            record_appointment_changes(
+                (None, Appointments.Status.CONFIRMED, None, status)
+                for status, count in moved.items()
+                for _ in range(count)
+            )
+            # Dashboard snapshots only list appointments that haven't started,
+            # so they don't need invalidating here.
+            invalidate_months([start_time for _, start_time in rows])
+
+        if len(rows) < batch_size:
+            break
+
+    if totals["completed"] or totals["no_show"]:
+        logger.info(
+            "Appointment sweep finished. completed=%s no_show=%s dry_run=%s",
+            totals["completed"],
+            totals["no_show"],
+            dry_run,
+        )
+    return totals
+
+
+def mark_late_no_shows(appointment_ids):
+    """
+    Move appointments the sweeper already COMPLETED to NO_SHOW, for a Calendly
+    no-show mark that arrived after the grace period. Only rows not yet on an
+    invoice draft or billed are moved; billed ones are logged for follow-up.
+
+    Returns the number of appointments moved.
+    """
+    with transaction.atomic():
+        rows = list(
+            Appointments.objects.select_for_update()
+            .filter(pk__in=list(appointment_ids), status=Appointments.Status.COMPLETED)
+            .values_list("pk", "start_time", "invoice_draft_id", "billed_at")
+        )
+        movable = [(pk, start_time) for pk, start_time, draft_id, billed_at in rows if not (draft_id or billed_at)]
+        for pk, _, draft_id, billed_at in rows:
+            if draft_id or billed_at:
+                logger.warning(
+                    "No-show reported for an appointment already billed. appointment_id=%s invoice_draft_id=%s",
+                    pk,
+                    draft_id,
+                )
+        if not movable:
+            return 0
+
+        Appointments.objects.filter(pk__in=[pk for pk, _ in movable]).update(status=Appointments.Status.NO_SHOW)
+        record_appointment_changes(
+            (None, Appointments.Status.COMPLETED, None, Appointments.Status.NO_SHOW) for _ in movable
+        )
+        invalidate_months([start_time for _, start_time in movable])
+
+    logger.info("Late no-shows applied. moved=%s", len(movable))
+    return len(movable)
@@ -1,3 +1,216 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from appointments.models import Appointments, Invitee
+from appointments.sweeper import sweep_finished_appointments
+from users.models import User
+
+
+@override_settings(APPOINTMENT_SWEEP_GRACE_MINUTES=15)
+class AppointmentSweeperTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="client@example.com", password="pw", is_active=True)
+        self.now = timezone.now()
+
+    def _appt(self, starts_ago, status=Appointments.Status.CONFIRMED, minutes=30):
+        return Appointments.objects.create(
+            user_id=self.user,
+            start_time=self.now - starts_ago,
+            duration=timedelta(minutes=minutes),
+            status=status,
+        )
+
+    def test_sweeps_only_finished_confirmed_past_grace(self):
+        finished = self._appt(timedelta(hours=2))
+        in_grace = self._appt(timedelta(minutes=40))  # ended 10 minutes ago
+        running = self._appt(timedelta(minutes=10))
+        pending = self._appt(timedelta(hours=2), status=Appointments.Status.PENDING)
+
+        totals = sweep_finished_appointments(now=self.now)
+
+        self.assertEqual(totals, {"completed": 1, "no_show": 0})
+        for appt in (finished, in_grace, running, pending):
+            appt.refresh_from_db()
+        self.assertEqual(finished.status, Appointments.Status.COMPLETED)
+        self.assertEqual(in_grace.status, Appointments.Status.CONFIRMED)
+        self.assertEqual(running.status, Appointments.Status.CONFIRMED)
+        self.assertEqual(pending.status, Appointments.Status.PENDING)
+
+    def test_no_show_invitee_marks_no_show(self):
+        appt = self._appt(timedelta(hours=2))
+        Invitee.objects.create(appointment=appt, name="A", email="a@example.com", status="no_show")
+
+        sweep_finished_appointments(now=self.now)
+
+        appt.refresh_from_db()
+        self.assertEqual(appt.status, Appointments.Status.NO_SHOW)
+
+    def test_late_no_show_webhook_corrects_an_unbilled_swept_appointment(self):
+        swept = self._appt(timedelta(hours=2))
+        billed = self._appt(timedelta(hours=3))
+        Invitee.objects.create(appointment=swept, name="A", email="a@example.com", calendly_invitee_uri="https://calendly.test/i/1")
+        Invitee.objects.create(appointment=billed, name="B", email="b@example.com", calendly_invitee_uri="https://calendly.test/i/2")
+        sweep_finished_appointments(now=self.now)
+        Appointments.objects.filter(pk=billed.pk).update(billed_at=self.now)
+
+        for uri in ("https://calendly.test/i/1", "https://calendly.test/i/2"):
+            response = self.client.post(
+                reverse("calendly_webhook"),
+                json.dumps({"event": "invitee_no_show.created", "payload": {"invitee": uri}}),
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 200)
+
+        swept.refresh_from_db()
+        billed.refresh_from_db()
+        self.assertEqual(swept.status, Appointments.Status.NO_SHOW)
+        # Already invoiced: left for the attorney to credit by hand.
+        self.assertEqual(billed.status, Appointments.Status.COMPLETED)
+
+    def test_batches_and_is_idempotent(self):
+        for i in range(5):
+            self._appt(timedelta(hours=3 + i))
+
+        self.assertEqual(sweep_finished_appointments(now=self.now, batch_size=2)["completed"], 5)
+        with self.assertNumQueries(1):
+            self.assertEqual(sweep_finished_appointments(now=self.now, batch_size=2)["completed"], 0)
+
+    def test_dry_run_changes_nothing(self):
+        appt = self._appt(timedelta(hours=2))
+        call_command("sweep_appointments", "--dry-run", stdout=StringIO())
+        appt.refresh_from_db()
+        self.assertEqual(appt.status, Appointments.Status.CONFIRMED)
+
+    def test_sweep_query_uses_status_start_index(self):
+        from appointments.sweeper import finished_confirmed_appointments
+
+        plan = finished_confirmed_appointments(now=self.now).values("pk").explain()
+        self.assertIn("appt_status_start_idx", plan)
+
+
+class ConfirmationNumberTests(TestCase):
+    def setUp(self):
+        from appointments.confirmation import _allocator
+
+        _allocator.reset()
+        self.user = User.objects.create_user(email="client@example.com", password="pw", is_active=True)
+
+    def test_codes_are_unique_and_use_existing_format(self):
+        from appointments.confirmation import ALPHABET, code_for_sequence
+
+        codes = [code_for_sequence(n) for n in range(20000)]
+        self.assertEqual(len(set(codes)), len(codes))
+        for code in codes[:100]:
+            self.assertEqual(len(code), 8)
+            self.assertTrue(set(code) <= set(ALPHABET))
+
+    def test_permutation_stays_in_domain(self):
+        from appointments.confirmation import DOMAIN, permute
+
+        for n in (0, 1, DOMAIN - 2, DOMAIN - 1):
+            self.assertLess(permute(n), DOMAIN)
+        with self.assertRaises(ValueError):
+            permute(DOMAIN)
+
+    @override_settings(CONFIRMATION_NUMBER_KEY="")
+    def test_key_must_be_configured(self):
+        from appointments.confirmation import code_for_sequence
+
+        with self.assertRaises(ImproperlyConfigured):
+            code_for_sequence(1)
+
+    @override_settings(CONFIRMATION_NUMBER_BLOCK_SIZE=10)
+    def test_insert_makes_no_extra_queries_within_a_block(self):
+        # First insert leases a block: lease INSERT + appointment INSERT.
+        Appointments.objects.create(user_id=self.user, start_time=timezone.now())
+        # Each insert is the appointment INSERT plus the dashboard KPI UPDATE
+        # (core/kpis.py); the confirmation number itself costs nothing.
+        for _ in range(9):
+            with self.assertNumQueries(2):
+                Appointments.objects.create(user_id=self.user, start_time=timezone.now())
+        # Block exhausted: exactly one extra query to lease the next one.
+        with self.assertNumQueries(3):
+            appt = Appointments.objects.create(user_id=self.user, start_time=timezone.now())
+        self.assertEqual(Appointments.objects.values("confirmation_number").distinct().count(), 11)
+        self.assertEqual(len(appt.confirmation_number), 8)
+
+    def test_backfill_fills_missing_and_reissues_with_all(self):
+        missing = Appointments.objects.create(user_id=self.user, start_time=timezone.now())
+        Appointments.objects.filter(pk=missing.pk).update(confirmation_number=None)
+        legacy = Appointments.objects.create(user_id=self.user, start_time=timezone.now())
+        Appointments.objects.filter(pk=legacy.pk).update(confirmation_number="LEGACY01")
+
+        call_command("backfill_confirmation_numbers", stdout=StringIO())
+        missing.refresh_from_db()
+        legacy.refresh_from_db()
+        self.assertEqual(len(missing.confirmation_number), 8)
+        self.assertEqual(legacy.confirmation_number, "LEGACY01")
+
+        call_command("backfill_confirmation_numbers", "--all", stdout=StringIO())
+        legacy.refresh_from_db()
+        self.assertNotEqual(legacy.confirmation_number, "LEGACY01")
+
+
+class InviteeReattachTests(TestCase):
+    def setUp(self):
+        self.host = User.objects.create_user(email="host@example.com", password="pw", is_staff=True, is_active=True)
+        self.appt = Appointments.objects.create(user_id=self.host, start_time=timezone.now() + timedelta(days=1))
+        self.other = Appointments.objects.create(user_id=self.host, start_time=timezone.now() + timedelta(days=2))
+        Invitee.objects.create(appointment=self.appt, name="Client", email="  Client@Example.COM ")
+        Invitee.objects.create(appointment=self.other, name="Someone", email="someone@example.com")
+
+    def _client(self, **extra):
+        return User.objects.create_user(email="client@example.com", password="pw", **extra)
+
+    def test_invitee_email_is_normalized_on_save(self):
+        self.assertEqual(
+            Invitee.objects.get(appointment=self.appt).email_normalized, "client@example.com"
+        )
+
+    def test_reattach_moves_matching_appointments_in_one_update(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from appointments.reattach import reattach_invitee_appointments
+
+        user = self._client(is_active=True)
+        with CaptureQueriesContext(connection) as ctx:
+            moved = reattach_invitee_appointments(user)
+        self.assertEqual(moved, 1)
+        updates = [q for q in ctx.captured_queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        self.appt.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(self.appt.user_id, user)
+        self.assertEqual(self.other.user_id, self.host)
+
+    def test_email_confirmed_signal_triggers_reattach(self):
+        from allauth.account.models import EmailAddress
+        from allauth.account.signals import email_confirmed
+
+        user = self._client()
+        address = EmailAddress.objects.create(user=user, email=user.email, primary=True, verified=True)
+        email_confirmed.send(sender=EmailAddress, request=None, email_address=address)
+
+        self.appt.refresh_from_db()
+        self.assertEqual(self.appt.user_id, user)
+
+    def test_backfill_command_only_moves_verified_users(self):
+        from allauth.account.models import EmailAddress
+
+        user = self._client(is_active=True)
+        EmailAddress.objects.create(user=user, email=user.email, primary=True, verified=False)
+        call_command("reattach_invitee_appointments", stdout=StringIO())
+        self.appt.refresh_from_db()
+        self.assertEqual(self.appt.user_id, self.host)
+
+        EmailAddress.objects.filter(user=user).update(verified=True)
+        call_command("reattach_invitee_appointments", stdout=StringIO())
+        self.appt.refresh_from_db()
+        self.assertEqual(self.appt.user_id, user)
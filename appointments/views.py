@@ -8,6 +8,8 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 
 from .models import Appointments, Invitee
+from .sweeper import mark_late_no_shows
+from users.emails import users_by_email
 from users.models import User
 from users.views import is_admin_user
 import json
@@ -30,6 +32,19 @@ def calendly_webhook(request):
     event_type = payload.get("event")  # e.g. "invitee.created"
     data = payload.get("payload") or {}
 
+    # Host marked the invitee as a no-show; the appointment sweeper picks this up.
+    if event_type in ("invitee_no_show.created", "invitee_no_show.deleted"):
+        invitee_uri = data.get("invitee")
+        if not invitee_uri:
+            return HttpResponseBadRequest("Missing invitee uri")
+        new_status = "no_show" if event_type == "invitee_no_show.created" else "active"
+        invitees = Invitee.objects.filter(calendly_invitee_uri=invitee_uri)
+        invitees.update(status=new_status)
+        if event_type == "invitee_no_show.created":
+            # Marked after the sweeper already completed the appointment.
+            mark_late_no_shows(invitees.values_list("appointment_id", flat=True))
+        return JsonResponse({"status": "ok"})
+
     if event_type != "invitee.created":
         return JsonResponse({"status": "ignored", "reason": "unsupported event"})
 
@@ -72,7 +87,7 @@ def calendly_webhook(request):
 
     host_user = None
     if host_email:
-        host_user = User.objects.filter(email=host_email).first()
+        host_user = users_by_email(host_email).first()
 
     # Fallback: first superuser (e.g., Lydia/admin)
     if host_user is None:
@@ -87,7 +102,7 @@ def calendly_webhook(request):
     invitee_email = data.get("email")  # this is the client's email from Calendly
     client_user = None
     if invitee_email:
-        client_user = User.objects.filter(email=invitee_email).first()
+        client_user = users_by_email(invitee_email).first()
 
     # If matching client exists, associate appointment with them; otherwise with host
     appointment_user = client_user or host_user
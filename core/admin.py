@@ -3,4 +3,13 @@
 
 from django.contrib import admin
 
+from .models import OutboundEmail
+
 # Register your models here.
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ("id", "subject", "status", "attempts", "next_attempt_at", "sent_at", "created_at")
+    list_filter = ("status", "notification_type")
+    search_fields = ("subject", "to")
+    readonly_fields = [field.name for field in OutboundEmail._meta.fields]
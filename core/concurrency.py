@@ -0,0 +1,31 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+def bounded_map(func, items, max_workers=4):
+    """
+    Call func(item) for each item using at most max_workers threads.
+
+    Meant for slow outbound API calls (Calendly, Stripe). The worker threads
+    should not touch the database; do DB writes with the returned results in
+    the calling thread instead.
+
+    Returns a list of (item, result, error) tuples in input order. An
+    exception raised for one item is captured in `error` and does not stop
+    the others.
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    def _call(item):
+        try:
+            return item, func(item), None
+        except Exception as exc:
+            return item, None, exc
+
+    workers = max(1, min(int(max_workers or 1), len(items)))
+    if workers == 1:
+        return [_call(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_call, items))
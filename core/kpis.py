@@ -0,0 +1,211 @@
+"""
+Admin dashboard KPIs, kept in one DashboardKPI row.
+
+Each change that moves a counter adjusts the row with one UPDATE of F()
+expressions, inside the transaction that made the change:
+
+- appointments: the receivers in core/signals.py, plus the set-based
+  updates in appointments/bulk.py and appointments/sweeper.py;
+- client accounts: the User receivers in core/signals.py.
+
+Receivables are not kept here: the invoice rollups (finances/rollups.py)
+already maintain them.
+
+The dated counters (today's schedule, new clients this week) only move when
+the change falls on the day or week the row covers, which a CASE in the same
+UPDATE checks. dashboard_kpis() rolls them forward on the first read of a new
+day or week, recounting just those two under a row lock.
+
+Changes that skip these paths (manual SQL, queryset updates, an account
+gaining or losing staff status) leave the row off until
+recompute_kpis() (the recompute_dashboard_kpis command, run nightly)
+rebuilds it from the tables.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Value, When
+from django.utils import timezone
+
+from appointments.models import Appointments
+from users.models import User
+
+from .models import DashboardKPI
+
+logger = logging.getLogger(__name__)
+
+KPI_ROW = 1
+
+APPOINTMENT_STATUS_FIELDS = {
+    Appointments.Status.PENDING: "appointments_pending",
+    Appointments.Status.CONFIRMED: "appointments_confirmed",
+    Appointments.Status.CANCELLED: "appointments_cancelled",
+    Appointments.Status.NO_SHOW: "appointments_no_show",
+    Appointments.Status.COMPLETED: "appointments_completed",
+}
+
+
+def week_start(day):
+    """The Monday on or before `day`."""
+    return day - timedelta(days=day.weekday())
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def is_client(user) -> bool:
+    return not (user.is_staff or user.is_superuser)
+
+
+def _schedule_day(start_time, status):
+    """The day an appointment counts toward on the schedule, or None."""
+    if start_time is None or status in (None, Appointments.Status.CANCELLED):
+        return None
+    return timezone.localdate(start_time)
+
+
+def _dated(field, date_field, deltas):
+    return F(field) + Case(
+        *[When(**{date_field: day}, then=Value(delta)) for day, delta in deltas.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def _apply(counts=None, schedule=None, new_clients=None):
+    """
+    Add `counts` ({field: delta}) to the KPI row, plus `schedule` ({day: delta})
+    and `new_clients` ({week start: delta}) where the row covers that day or
+    week. One UPDATE.
+    """
+    counts = {field: delta for field, delta in (counts or {}).items() if delta}
+    schedule = {day: delta for day, delta in (schedule or {}).items() if delta}
+    new_clients = {week: delta for week, delta in (new_clients or {}).items() if delta}
+
+    updates = {field: F(field) + delta for field, delta in counts.items()}
+    if schedule:
+        updates["schedule_day_count"] = _dated("schedule_day_count", "schedule_day", schedule)
+    if new_clients:
+        updates["new_clients_week"] = _dated("new_clients_week", "week_start", new_clients)
+    if not updates:
+        return
+
+    if not DashboardKPI.objects.filter(pk=KPI_ROW).update(**updates):
+        # No row yet. The change is already written, so counting includes it.
+        recompute_kpis()
+
+
+def record_appointment_changes(changes):
+    """
+    Apply appointment changes to the KPIs.
+
+    `changes` is an iterable of (old_start, old_status, new_start, new_status).
+    The old pair is (None, None) for a new appointment and the new pair for a
+    deleted one. A start of None leaves the schedule count alone, for status
+    moves between non-cancelled statuses.
+    """
+    counts = defaultdict(int)
+    schedule = defaultdict(int)
+    for old_start, old_status, new_start, new_status in changes:
+        if old_status is not None:
+            counts[APPOINTMENT_STATUS_FIELDS[old_status]] -= 1
+        if new_status is not None:
+            counts[APPOINTMENT_STATUS_FIELDS[new_status]] += 1
+        for start, status, sign in ((old_start, old_status, -1), (new_start, new_status, 1)):
+            day = _schedule_day(start, status)
+            if day is not None:
+                schedule[day] += sign
+    _apply(counts, schedule)
+
+
+def record_client_change(user, delta):
+    """Count a client account created (delta=1) or deleted (delta=-1)."""
+    if is_client(user) and user.date_joined:
+        _apply(new_clients={week_start(timezone.localdate(user.date_joined)): delta})
+
+
+def _dated_counts(today):
+    week = week_start(today)
+    return {
+        "schedule_day": today,
+        "schedule_day_count": (
+            Appointments.objects
+            .filter(start_time__gte=_day_start(today), start_time__lt=_day_start(today + timedelta(days=1)))
+            .exclude(status=Appointments.Status.CANCELLED)
+            .count()
+        ),
+        "week_start": week,
+        "new_clients_week": (
+            User.objects.filter(is_staff=False, is_superuser=False, date_joined__gte=_day_start(week)).count()
+        ),
+    }
+
+
+def _expected(today):
+    by_status = dict(
+        Appointments.objects.order_by().values("status").annotate(n=Count("pk")).values_list("status", "n")
+    )
+    values = {field: by_status.get(status, 0) for status, field in APPOINTMENT_STATUS_FIELDS.items()}
+    values.update(_dated_counts(today))
+    return values
+
+
+def recompute_kpis(today=None):
+    """
+    Rebuild the KPI row from the tables, under a row lock so concurrent
+    changes are neither lost nor counted twice.
+
+    Returns {field: (stored, expected)} for the counters that had drifted.
+    """
+    today = today or timezone.localdate()
+    with transaction.atomic():
+        row = DashboardKPI.objects.select_for_update().filter(pk=KPI_ROW).first()
+        expected = _expected(today)
+
+        drift = {}
+        if row is not None:
+            skip = {"schedule_day", "week_start"}
+            if row.schedule_day != today:
+                skip.add("schedule_day_count")
+            if row.week_start != expected["week_start"]:
+                skip.add("new_clients_week")
+            drift = {
+                field: (getattr(row, field), value)
+                for field, value in expected.items()
+                if field not in skip and getattr(row, field) != value
+            }
+
+        DashboardKPI.objects.update_or_create(
+            pk=KPI_ROW, defaults={**expected, "recomputed_at": timezone.now()}
+        )
+
+    for field, (stored, value) in drift.items():
+        logger.warning("Repaired dashboard KPI drift. field=%s stored=%s expected=%s", field, stored, value)
+    return drift
+
+
+def _roll_over(today):
+    with transaction.atomic():
+        row = DashboardKPI.objects.select_for_update().get(pk=KPI_ROW)
+        if row.schedule_day == today and row.week_start == week_start(today):
+            return row  # Another request got here first.
+        values = _dated_counts(today)
+        for field, value in values.items():
+            setattr(row, field, value)
+        row.save(update_fields=list(values))
+    return row
+
+
+def dashboard_kpis(today=None):
+    """The KPI row, covering `today` (default: the current local date). Usually one SELECT."""
+    today = today or timezone.localdate()
+    row = DashboardKPI.objects.filter(pk=KPI_ROW).first()
+    if row is None:
+        recompute_kpis(today)
+        return DashboardKPI.objects.get(pk=KPI_ROW)
+    if row.schedule_day != today or row.week_start != week_start(today):
+        row = _roll_over(today)
+    return row
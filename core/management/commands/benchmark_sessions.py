@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from users.models import User
+
+ENGINES = (
+    ("db", "django.contrib.sessions.backends.db"),
+    ("core.sessions", "core.sessions"),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark session backends on the dashboard pages: django_session queries "
+        "and time per request for the stock DB backend and core.sessions. "
+        "Runs inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+
+    def _run(self, engine, user, url, count):
+        with override_settings(SESSION_ENGINE=engine, ALLOWED_HOSTS=["testserver"]):
+            client = Client()
+            client.force_login(user)
+            client.get(url)  # Warm up: first read fills the cache.
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                for _ in range(count):
+                    client.get(url)
+                elapsed = time.perf_counter() - started
+            client.logout()
+
+        session_sql = [q["sql"] for q in ctx.captured_queries if "django_session" in q["sql"]]
+        reads = sum(1 for sql in session_sql if sql.startswith("SELECT"))
+        writes = len(session_sql) - reads
+        return reads, writes, len(ctx.captured_queries), elapsed
+
+    def handle(self, *args, **options):
+        count = options["requests"]
+        with transaction.atomic():
+            client_user = User.objects.create_user(email="session-bench@example.invalid", is_active=True)
+            admin_user = User.objects.create_user(email="session-bench-admin@example.invalid", is_active=True, is_staff=True)
+            pages = (
+                ("client dashboard", client_user, reverse("client_dashboard")),
+                ("admin dashboard", admin_user, reverse("admin_dashboard")),
+            )
+
+            for label, user, url in pages:
+                for name, engine in ENGINES:
+                    reads, writes, queries, elapsed = self._run(engine, user, url, count)
+                    self.stdout.write(
+                        f"{label:<16} {name:<14} session reads/request {reads / count:.2f}, "
+                        f"writes/request {writes / count:.2f}, queries/request {queries / count:.1f}, "
+                        f"{elapsed / count * 1000:.2f} ms/request"
+                    )
+            transaction.set_rollback(True)
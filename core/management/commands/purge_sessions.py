@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.sessions import purge_expired_sessions
+
+
+class Command(BaseCommand):
+    help = "Delete expired sessions from django_session in batches. Safe to run daily."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_sessions(batch_size=options["batch_size"])
+        self.stdout.write(f"Deleted {deleted} expired session(s).")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from core.kpis import recompute_kpis
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the admin dashboard KPI row from the appointment and user "
+        "tables, and report any counters that had drifted. Run nightly."
+    )
+
+    def handle(self, *args, **options):
+        drift = recompute_kpis()
+        for field, (stored, expected) in sorted(drift.items()):
+            self.stdout.write(f"{field}: stored={stored} expected={expected}")
+
+        if drift:
+            self.stdout.write(f"Repaired {len(drift)} drifted KPI(s).")
+        else:
+            self.stdout.write("All KPIs match.")
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.outbox import deliver_queued_email
+
+
+class Command(BaseCommand):
+    help = (
+        "Send queued outbound email over one SMTP connection, retrying failures "
+        "with backoff. Run from cron every minute, or keep it running with --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--loop", action="store_true", help="Keep polling for new mail.")
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds between polls with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            totals = deliver_queued_email(batch_size=options["batch_size"])
+            if any(totals.values()) or not options["loop"]:
+                self.stdout.write(
+                    f"Sent {totals['sent']}; {totals['retrying']} will be retried; {totals['failed']} failed."
+                )
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
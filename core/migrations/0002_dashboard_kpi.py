@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-19 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_outbound_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardKPI',
+            fields=[
+                ('id', models.PositiveSmallIntegerField(default=1, primary_key=True, serialize=False)),
+                ('appointments_pending', models.IntegerField(default=0)),
+                ('appointments_confirmed', models.IntegerField(default=0)),
+                ('appointments_cancelled', models.IntegerField(default=0)),
+                ('appointments_no_show', models.IntegerField(default=0)),
+                ('appointments_completed', models.IntegerField(default=0)),
+                ('schedule_day', models.DateField(blank=True, null=True)),
+                ('schedule_day_count', models.IntegerField(default=0)),
+                ('outstanding_count', models.IntegerField(default=0)),
+                ('outstanding_amount', models.BigIntegerField(default=0, help_text='minor units (cents)')),
+                ('week_start', models.DateField(blank=True, null=True)),
+                ('new_clients_week', models.IntegerField(default=0)),
+                ('recomputed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'dashboard_kpis',
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:06
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_dashboard_kpi'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='dashboardkpi',
+            name='outstanding_amount',
+        ),
+        migrations.RemoveField(
+            model_name='dashboardkpi',
+            name='outstanding_count',
+        ),
+    ]
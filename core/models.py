@@ -1,6 +1,90 @@
 # models.py is where we define tables within the database
 # we use Django's ORM to have each model class represent a table in the database
 
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class OutboundEmail(models.Model):
+    """
+    An email waiting to be sent, or the record of one that was.
+
+    Requests only write this row; the send_queued_email worker delivers it
+    (see core/outbox.py). When notification_type is set, the outcome is also
+    recorded as a Notification.
+    """
+    class Status(models.TextChoices):
+        QUEUED = "QUEUED", "Queued"
+        SENT = "SENT", "Sent"
+        FAILED = "FAILED", "Failed"
+
+    id = models.BigAutoField(primary_key=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    subject = models.CharField(max_length=998)
+    body = models.TextField(blank=True, default="")
+    html_body = models.TextField(blank=True, default="")
+    from_email = models.CharField(max_length=254, blank=True, default="")
+    to = models.JSONField(default=list)
+    reply_to = models.JSONField(default=list, blank=True)
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    # A Notification.Type; blank for mail that isn't tracked as a notification.
+    notification_type = models.CharField(max_length=30, blank=True, default="")
+    payload = models.JSONField(default=dict, blank=True)
+
+    attempts = models.PositiveIntegerField(default=0)
+    # When the worker may (next) pick this up. Claiming a row pushes it out by
+    # a lease, so a worker that dies mid-batch only delays its messages.
+    next_attempt_at = models.DateTimeField()
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "outbound_emails"
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbound_email_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.to)} [{self.status}]"
+
+
+class DashboardKPI(models.Model):
+    """
+    Headline numbers for the admin dashboard, kept in a single row (pk=1).
+
+    Appointment, invoice and user changes adjust the counters as they happen
+    (see core/kpis.py), so the dashboard reads this row instead of running
+    aggregates. schedule_day and week_start record which day and week the
+    dated counters cover; they are rolled forward on the first read after
+    midnight or after the week turns.
+    """
+    id = models.PositiveSmallIntegerField(primary_key=True, default=1)
+
+    # Appointments by status.
+    appointments_pending = models.IntegerField(default=0)
+    appointments_confirmed = models.IntegerField(default=0)
+    appointments_cancelled = models.IntegerField(default=0)
+    appointments_no_show = models.IntegerField(default=0)
+    appointments_completed = models.IntegerField(default=0)
+
+    # Non-cancelled appointments starting on schedule_day (site timezone).
+    schedule_day = models.DateField(null=True, blank=True)
+    schedule_day_count = models.IntegerField(default=0)
+
+    # Client accounts created since week_start (a Monday).
+    week_start = models.DateField(null=True, blank=True)
+    new_clients_week = models.IntegerField(default=0)
+
+    # Last full recompute (recompute_dashboard_kpis).
+    recomputed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "dashboard_kpis"
+
+    def __str__(self):
+        return f"Dashboard KPIs ({self.schedule_day})"
@@ -0,0 +1,221 @@
+"""
+Outbound email queue.
+
+Code that handles a request doesn't talk to SMTP. enqueue_email() (or
+QueuedEmailBackend, for code that calls Django's send_mail) only writes an
+OutboundEmail row, so a signup waits on one INSERT instead of a TLS handshake
+with the mail server.
+
+deliver_queued_email() (the send_queued_email worker) sends what is due over
+one authenticated connection that stays open for the whole run:
+
+1. Claim a batch of due rows and push their next_attempt_at out by LEASE, so
+   two workers never send the same message and a crashed worker's batch
+   comes back on its own.
+2. Send them one message per call, so a rejected address only fails its own
+   row. After an error the connection is reopened for the rest.
+3. Record the batch: one UPDATE for what was sent and one bulk update for
+   what will be retried with exponential backoff. A message fails for good
+   after OUTBOUND_EMAIL_MAX_ATTEMPTS tries (default 5). Rows with a
+   notification_type also get a Notification (SENT or FAILED) once their
+   outcome is final.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from appointments.models import Notification
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+LEASE = timedelta(minutes=10)
+RETRY_BASE = timedelta(minutes=1)
+RETRY_MAX = timedelta(hours=1)
+
+
+def max_attempts() -> int:
+    return int(getattr(settings, "OUTBOUND_EMAIL_MAX_ATTEMPTS", 5))
+
+
+def retry_delay(attempts):
+    """1, 2, 4, ... minutes after the n-th failed attempt, capped at an hour."""
+    return min(RETRY_BASE * 2 ** max(attempts - 1, 0), RETRY_MAX)
+
+
+def _html(message):
+    for content, mimetype in getattr(message, "alternatives", None) or []:
+        if mimetype == "text/html":
+            return content
+    if getattr(message, "content_subtype", "") == "html":
+        return message.body
+    return ""
+
+
+def enqueue_email(message, user=None, notification_type="", payload=None):
+    """
+    Queue an EmailMessage (or EmailMultiAlternatives) for the worker to send.
+    Attachments and custom headers aren't carried over.
+    """
+    html = _html(message)
+    return OutboundEmail.objects.create(
+        subject=message.subject,
+        body="" if html and html == message.body else message.body,
+        html_body=html,
+        from_email=message.from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(message.to),
+        reply_to=list(message.reply_to),
+        user=user,
+        notification_type=notification_type,
+        payload=payload or {},
+        next_attempt_at=timezone.now(),
+    )
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """Email backend that queues instead of sending: get_connection("core.outbox.QueuedEmailBackend")."""
+
+    def send_messages(self, email_messages):
+        for message in email_messages:
+            enqueue_email(message)
+        return len(email_messages)
+
+
+def _message(row, connection):
+    message = EmailMultiAlternatives(
+        row.subject,
+        row.body,
+        row.from_email or None,
+        row.to,
+        reply_to=row.reply_to or None,
+        connection=connection,
+    )
+    if row.html_body:
+        message.attach_alternative(row.html_body, "text/html")
+    return message
+
+
+def _claim(batch_size, now):
+    with transaction.atomic():
+        rows = list(
+            OutboundEmail.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=OutboundEmail.Status.QUEUED, next_attempt_at__lte=now)
+            .order_by("next_attempt_at", "pk")[:batch_size]
+        )
+        if rows:
+            OutboundEmail.objects.filter(pk__in=[row.pk for row in rows]).update(next_attempt_at=now + LEASE)
+    return rows
+
+
+def _notifications(rows, status, errors=None):
+    return [
+        Notification(
+            user_id=row.user_id,
+            channel=Notification.Channel.EMAIL,
+            type=row.notification_type,
+            status=status,
+            error_message=(errors or {}).get(row.pk),
+            target_email=row.to[0] if row.to else None,
+            payload={**row.payload, "outbound_email_id": row.pk},
+        )
+        for row in rows
+        if row.notification_type
+    ]
+
+
+def _record(rows, sent, errors, now):
+    limit = max_attempts()
+    retry, failed = [], []
+    for row in rows:
+        if row.pk not in errors:
+            continue
+        row.attempts += 1
+        row.last_error = errors[row.pk][:2000]
+        if row.attempts >= limit:
+            row.status = OutboundEmail.Status.FAILED
+            failed.append(row)
+        else:
+            row.next_attempt_at = now + retry_delay(row.attempts)
+            retry.append(row)
+
+    with transaction.atomic():
+        if sent:
+            OutboundEmail.objects.filter(pk__in=[row.pk for row in sent]).update(
+                status=OutboundEmail.Status.SENT, sent_at=now, last_error="", attempts=F("attempts") + 1,
+            )
+        if retry or failed:
+            OutboundEmail.objects.bulk_update(
+                retry + failed, ["status", "attempts", "last_error", "next_attempt_at"]
+            )
+        Notification.objects.bulk_create(
+            _notifications(sent, Notification.Status.SENT)
+            + _notifications(failed, Notification.Status.FAILED, errors)
+        )
+    return len(retry), len(failed)
+
+
+def deliver_queued_email(batch_size=50, now=None):
+    """
+    Send every message that is due. Returns {"sent": n, "retrying": n, "failed": n}.
+    """
+    now = now or timezone.now()
+    totals = {"sent": 0, "retrying": 0, "failed": 0}
+
+    rows = _claim(batch_size, now)
+    if not rows:
+        return totals
+
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as exc:
+        # Can't reach the server at all: the whole batch retries later.
+        logger.warning("Outbound email connection failed. error=%s", exc)
+        retrying, failed = _record(rows, [], {row.pk: str(exc) for row in rows}, now)
+        totals.update(retrying=retrying, failed=failed)
+        return totals
+
+    try:
+        while rows:
+            sent, errors = [], {}
+            for row in rows:
+                try:
+                    connection.send_messages([_message(row, connection)])
+                except Exception as exc:
+                    errors[row.pk] = str(exc) or exc.__class__.__name__
+                    logger.warning("Outbound email failed. email_id=%s error=%s", row.pk, exc)
+                    # The connection may be unusable now; start a fresh one.
+                    connection.close()
+                    try:
+                        connection.open()
+                    except Exception:
+                        pass
+                else:
+                    sent.append(row)
+
+            retrying, failed = _record(rows, sent, errors, now)
+            totals["sent"] += len(sent)
+            totals["retrying"] += retrying
+            totals["failed"] += failed
+
+            if len(rows) < batch_size:
+                break
+            rows = _claim(batch_size, now)
+    finally:
+        connection.close()
+
+    logger.info(
+        "Outbound email delivered. sent=%s retrying=%s failed=%s",
+        totals["sent"],
+        totals["retrying"],
+        totals["failed"],
+    )
+    return totals
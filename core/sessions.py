@@ -0,0 +1,126 @@
+"""
+Session backend (SESSION_ENGINE = "core.sessions").
+
+Django's cached_db backend with two changes:
+
+- Reads come from the cache and fall back to django_session, which then
+  refills the cache. A page view by a signed-in user usually runs no session
+  query at all.
+- A save whose data matches what was loaded is skipped, as long as the stored
+  expiry is within SESSION_REFRESH_INTERVAL (seconds, default 3600) of the one
+  the save would write. Requests that mark the session modified without
+  changing it no longer rewrite the row, while active sessions still slide
+  forward about once an interval.
+
+purge_expired_sessions() (the purge_sessions command; clearsessions calls it
+too) deletes expired rows in primary-key batches, so no single DELETE holds
+locks on a big table.
+
+Like cached_db, this needs a cache shared by every worker (CACHE_URL). With a
+per-process cache, a session logged out in one worker could still be read
+from another worker's cache until it expires there, so settings only select
+this backend when CACHE_URL is not a local-memory or dummy cache.
+"""
+import logging
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.contrib.sessions.models import Session
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "core.sessions."
+
+
+def refresh_interval() -> timedelta:
+    return timedelta(seconds=int(getattr(settings, "SESSION_REFRESH_INTERVAL", 3600)))
+
+
+class SessionStore(CachedDBStore):
+    # Cache entries are (data, expire_date), not cached_db's bare dict.
+    cache_key_prefix = KEY_PREFIX
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        # (serialized data, expire_date) as last read or written; None for a new session.
+        self._stored = None
+
+    def _serialized(self, data):
+        return self.serializer().dumps(data)
+
+    def load(self):
+        try:
+            cached = self._cache.get(self.cache_key)
+        except Exception:
+            # Invalid cache keys raise on some backends; treat as a miss.
+            cached = None
+
+        if cached is None:
+            s = self._get_session_from_db()
+            if s is None:
+                self._stored = None
+                return {}
+            data, expire_date = self.decode(s.session_data), s.expire_date
+            self._cache_set(data, expire_date)
+        else:
+            data, expire_date = cached
+
+        self._stored = (self._serialized(data), expire_date)
+        return data
+
+    async def aload(self):
+        return await sync_to_async(self.load)()
+
+    def _unchanged(self):
+        if self._stored is None or self.session_key is None:
+            return False
+        serialized, expire_date = self._stored
+        return (
+            serialized == self._serialized(self._session)
+            and abs(self.get_expiry_date() - expire_date) < refresh_interval()
+        )
+
+    def _cache_set(self, data, expire_date):
+        try:
+            self._cache.set(self.cache_key, (data, expire_date), self.get_expiry_age(expiry=expire_date))
+        except Exception:
+            logger.exception("Error saving session to cache (%s)", self._cache)
+
+    def save(self, must_create=False):
+        if not must_create and self._unchanged():
+            return
+        DBStore.save(self, must_create)
+        expire_date = self.get_expiry_date()
+        self._cache_set(self._session, expire_date)
+        self._stored = (self._serialized(self._session), expire_date)
+
+    async def asave(self, must_create=False):
+        await sync_to_async(self.save)(must_create)
+
+    @classmethod
+    def clear_expired(cls):
+        purge_expired_sessions()
+
+
+def purge_expired_sessions(batch_size=1000, now=None):
+    """Delete expired sessions, `batch_size` rows per DELETE. Returns the number deleted."""
+    now = now or timezone.now()
+    deleted = 0
+    while True:
+        keys = list(
+            Session.objects.filter(expire_date__lt=now)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not keys:
+            break
+        deleted += Session.objects.filter(pk__in=keys).delete()[0]
+        if len(keys) < batch_size:
+            break
+    if deleted:
+        logger.info("Purged expired sessions. deleted=%s", deleted)
+    return deleted
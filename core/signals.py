@@ -0,0 +1,43 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from appointments.models import Appointments
+from users.models import User
+
+from .kpis import record_appointment_changes, record_client_change
+
+
+# Keep the admin dashboard KPIs (core/kpis.py) in step with single-row
+# changes. Set-based .update() calls bypass these and record their own.
+@receiver(post_save, sender=Appointments)
+def count_saved_appointment(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        record_appointment_changes([(None, None, instance.start_time, instance.status)])
+    elif getattr(instance, "_loaded_status", None) is not None:
+        record_appointment_changes([
+            (instance._loaded_start_time, instance._loaded_status, instance.start_time, instance.status)
+        ])
+    # Otherwise the stored values aren't known; the nightly recompute catches up.
+
+
+@receiver(post_delete, sender=Appointments)
+def count_deleted_appointment(sender, instance, **kwargs):
+    record_appointment_changes([(
+        getattr(instance, "_loaded_start_time", None) or instance.start_time,
+        getattr(instance, "_loaded_status", None) or instance.status,
+        None,
+        None,
+    )])
+
+
+@receiver(post_save, sender=User)
+def count_new_client(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        record_client_change(instance, 1)
+
+
+@receiver(post_delete, sender=User)
+def count_deleted_client(sender, instance, **kwargs):
+    record_client_change(instance, -1)
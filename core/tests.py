@@ -1,13 +1,37 @@
-from datetime import timedelta
+import socketserver
+import threading
+from datetime import datetime, time, timedelta
+from io import StringIO
+from unittest import mock
 
 from django.contrib.messages import get_messages
-from django.test import TestCase
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.mail import EmailMessage, get_connection, send_mail
+from django.db import connection
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
-from appointments.models import Appointments, Invitee
+from appointments.bulk import bulk_update_status
+from appointments.models import Appointments, Invitee, Notification
+from appointments.sweeper import sweep_finished_appointments
+from finances.ledger import create_invoice_record, set_invoice_status, set_invoice_statuses
+from finances.models import Invoice
 from users.models import User
 
+from users.directory import SORTS, client_directory_page
+
+from .kpis import dashboard_kpis, recompute_kpis
+from .views import client_invoice_rows
+from .models import DashboardKPI, OutboundEmail
+from .outbox import deliver_queued_email, enqueue_email
+from .sessions import SessionStore, purge_expired_sessions
+
 
 class AdminAppointmentActionsTests(TestCase):
     def setUp(self):
@@ -168,3 +192,712 @@ class AdminAppointmentActionsTests(TestCase):
         appt.refresh_from_db()
         self.assertEqual(appt.status, Appointments.Status.CANCELLED)
         self.assertIn("That status change isn’t allowed.", self._messages(resp))
+
+
+class AdminAppointmentBulkActionsTests(TestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            email="admin@example.com",
+            password="pw",
+            first_name="Admin",
+            last_name="User",
+            is_staff=True,
+            is_active=True,
+        )
+        self.client_user = User.objects.create_user(
+            email="client@example.com",
+            password="pw",
+            first_name="Client",
+            last_name="User",
+            is_active=True,
+        )
+        start = timezone.now() + timedelta(days=1)
+        self.pending = Appointments.objects.create(
+            user_id=self.client_user, start_time=start, status=Appointments.Status.PENDING,
+            calendly_event_uri="https://api.calendly.com/scheduled_events/A",
+        )
+        self.confirmed = Appointments.objects.create(
+            user_id=self.client_user, start_time=start, status=Appointments.Status.CONFIRMED,
+        )
+        self.completed = Appointments.objects.create(
+            user_id=self.client_user, start_time=start, status=Appointments.Status.COMPLETED,
+        )
+        self.invitee = Invitee.objects.create(
+            appointment=self.pending, name="Invitee", email="invitee@example.com",
+        )
+        self.url = reverse("admin_appointments_bulk")
+
+    def _messages(self, response):
+        return [m.message for m in get_messages(response.wsgi_request)]
+
+    def test_bulk_requires_staff(self):
+        self.client.force_login(self.client_user)
+        resp = self.client.post(self.url, data={"action": "complete", "appointment_ids": [self.confirmed.pk]})
+        self.assertEqual(resp.status_code, 403)
+
+    def test_bulk_cancel_requires_reason(self):
+        self.client.force_login(self.admin_user)
+        resp = self.client.post(
+            self.url, data={"action": "cancel", "appointment_ids": [self.pending.pk]}, follow=True
+        )
+        self.pending.refresh_from_db()
+        self.assertEqual(self.pending.status, Appointments.Status.PENDING)
+        self.assertIn("Cancellation reason is required.", self._messages(resp))
+
+    def test_bulk_cancel_updates_valid_rows_and_reports_invalid(self):
+        self.client.force_login(self.admin_user)
+        resp = self.client.post(
+            self.url,
+            data={
+                "action": "cancel",
+                "reason": "Office closed",
+                "appointment_ids": [self.pending.pk, self.confirmed.pk, self.completed.pk],
+            },
+            follow=True,
+        )
+
+        for appt in (self.pending, self.confirmed, self.completed):
+            appt.refresh_from_db()
+        self.invitee.refresh_from_db()
+
+        self.assertEqual(self.pending.status, Appointments.Status.CANCELLED)
+        self.assertEqual(self.confirmed.status, Appointments.Status.CANCELLED)
+        self.assertEqual(self.confirmed.cancellation_reason, "Office closed")
+        self.assertIsNotNone(self.confirmed.cancelled_at)
+        self.assertEqual(self.completed.status, Appointments.Status.COMPLETED)
+        self.assertTrue(self.invitee.canceled)
+
+        msgs = self._messages(resp)
+        self.assertIn("2 appointment(s) updated.", msgs)
+        self.assertIn(f"Appointment #{self.completed.pk}: Cannot change COMPLETED to CANCELLED.", msgs)
+        self.assertIn("Calendly cancellation skipped (site not live yet — expected).", msgs)
+
+    def test_bulk_select_all_matching_uses_list_filters(self):
+        self.client.force_login(self.admin_user)
+        self.client.post(
+            self.url,
+            data={"action": "complete", "select_all_matching": "1", "status": Appointments.Status.CONFIRMED},
+        )
+        self.confirmed.refresh_from_db()
+        self.pending.refresh_from_db()
+        self.assertEqual(self.confirmed.status, Appointments.Status.COMPLETED)
+        self.assertEqual(self.pending.status, Appointments.Status.PENDING)
+
+    def test_bulk_select_all_matching_needs_a_filter(self):
+        self.client.force_login(self.admin_user)
+        resp = self.client.post(self.url, data={"action": "complete", "select_all_matching": "1"})
+        self.assertIn("Set at least one filter before applying an action to all matching appointments.", self._messages(resp))
+        self.confirmed.refresh_from_db()
+        self.assertEqual(self.confirmed.status, Appointments.Status.CONFIRMED)
+
+    def test_bulk_calendly_cancellations_report_per_row(self):
+        from unittest import mock
+        from appointments.bulk import bulk_update_status
+
+        with mock.patch("appointments.calendly.calendly_api_enabled", return_value=True), \
+                mock.patch("appointments.calendly.get_access_token", return_value="tok") as get_token, \
+                mock.patch("appointments.calendly.post_event_cancellation", return_value=False) as post:
+            results = bulk_update_status([self.pending.pk, self.confirmed.pk], Appointments.Status.CANCELLED, "Closed")
+
+        # The token is resolved once, outside the worker threads.
+        get_token.assert_called_once_with()
+        self.assertEqual(post.call_args.kwargs["access_token"], "tok")
+        by_id = {r["id"]: r for r in results}
+        self.assertEqual(by_id[self.pending.pk]["calendly"], "failed")
+        self.assertIsNone(by_id[self.confirmed.pk]["calendly"])
+
+
+class AdminScheduleCalendarTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.admin_user = User.objects.create_user(
+            email="admin@example.com", password="pw", is_staff=True, is_active=True,
+        )
+        self.client_user = User.objects.create_user(
+            email="client@example.com", password="pw", first_name="Client", last_name="User", is_active=True,
+        )
+        self.start = timezone.make_aware(timezone.datetime(2026, 3, 10, 9, 30))
+        self.appt = Appointments.objects.create(
+            user_id=self.client_user, start_time=self.start, status=Appointments.Status.CONFIRMED,
+        )
+        Invitee.objects.create(appointment=self.appt, name="Jane Invitee", email="jane@example.com")
+
+    def test_endpoint_returns_compact_days(self):
+        self.client.force_login(self.admin_user)
+        resp = self.client.get(reverse("admin_schedule_calendar"), {"start": "2026-03-01", "end": "2026-03-31"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            resp.json()["days"],
+            {"2026-03-10": [[self.appt.pk, "09:30", 15, "CONFIRMED", "Jane Invitee"]]},
+        )
+
+    def test_endpoint_rejects_bad_range(self):
+        self.client.force_login(self.admin_user)
+        resp = self.client.get(reverse("admin_schedule_calendar"), {"start": "2026-03-01", "end": "2026-09-01"})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_cached_months_are_not_requeried(self):
+        from datetime import date
+        from appointments.schedule import get_schedule_days
+
+        get_schedule_days(date(2026, 2, 1), date(2026, 4, 30))
+        with self.assertNumQueries(0):
+            days = get_schedule_days(date(2026, 3, 1), date(2026, 3, 31))
+        self.assertIn("2026-03-10", days)
+
+    def test_change_invalidates_only_its_month(self):
+        from datetime import date
+        from appointments.schedule import get_schedule_days
+
+        get_schedule_days(date(2026, 3, 1), date(2026, 4, 30))
+        self.appt.status = Appointments.Status.CANCELLED
+        self.appt.save()
+
+        with self.assertNumQueries(0):
+            get_schedule_days(date(2026, 4, 1), date(2026, 4, 30))
+        with self.assertNumQueries(1):
+            days = get_schedule_days(date(2026, 3, 1), date(2026, 3, 31))
+        self.assertEqual(days["2026-03-10"][0][3], "CANCELLED")
+
+    def test_moving_appointment_invalidates_old_month(self):
+        from datetime import date
+        from appointments.schedule import get_schedule_days
+
+        get_schedule_days(date(2026, 3, 1), date(2026, 3, 31))
+        appt = Appointments.objects.get(pk=self.appt.pk)
+        appt.start_time = self.start + timedelta(days=30)
+        appt.save()
+
+        self.assertEqual(get_schedule_days(date(2026, 3, 1), date(2026, 3, 31)), {})
+
+
+class ClientInvoicesPageTests(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user(
+            email="client@example.com", password="pw", first_name="Client", last_name="User", is_active=True,
+        )
+        self.other = User.objects.create_user(email="other@example.com", password="pw", is_active=True)
+        self.now = timezone.now()
+
+    def _invoice(self, days_ago, status=Invoice.Status.PAID, user=None, amount=1000):
+        invoice = Invoice.objects.create(user=user or self.client_user, amount=amount, status=status)
+        Invoice.objects.filter(pk=invoice.pk).update(created_at=self.now - timedelta(days=days_ago))
+        return invoice
+
+    def test_current_and_past_invoices_from_one_query(self):
+        oldest_pending = self._invoice(90, Invoice.Status.PENDING, amount=4200)
+        self._invoice(1, Invoice.Status.PENDING)
+        paid = [self._invoice(days) for days in range(2, 16)]
+        self._invoice(0, Invoice.Status.PENDING, user=self.other)
+        self.client.force_login(self.client_user)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("client_invoices"))
+
+        invoice_queries = [q["sql"] for q in ctx.captured_queries if Invoice._meta.db_table in q["sql"]]
+        self.assertEqual(len(invoice_queries), 1)
+
+        self.assertEqual(response.context["current_invoice"], oldest_pending)
+        self.assertEqual(response.context["current_invoice"].display_amount, 42)
+        past = response.context["past_invoices"]
+        self.assertEqual(len(past), 10)
+        self.assertNotIn(oldest_pending, past)
+        # Newest first: the newer pending invoice, then paid ones by age.
+        self.assertEqual([inv.pk for inv in past[1:]], [inv.pk for inv in paid[:9]])
+        self.assertNotContains(response, "No past invoices.")
+
+    def test_no_pending_invoice(self):
+        self._invoice(3)
+        self.client.force_login(self.client_user)
+        response = self.client.get(reverse("client_invoices"))
+        self.assertIsNone(response.context["current_invoice"])
+        self.assertEqual(len(response.context["past_invoices"]), 1)
+
+    def test_newest_invoice_can_be_the_current_one(self):
+        self._invoice(5)
+        pending = self._invoice(0, Invoice.Status.PENDING)
+        current, past = client_invoice_rows(self.client_user.pk)
+        self.assertEqual(current, pending)
+        self.assertNotIn(pending, past)
+        self.assertEqual(len(past), 1)
+
+    def test_client_invoice_query_reads_the_composite_indexes_in_order(self):
+        for days in range(20):
+            self._invoice(days, Invoice.Status.PENDING if days % 3 else Invoice.Status.PAID)
+
+        with CaptureQueriesContext(connection) as ctx:
+            client_invoice_rows(self.client_user.pk)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        # EXPLAIN the statement the page actually ran.
+        with connection.cursor() as cursor:
+            cursor.execute(connection.ops.explain_query_prefix() + " " + ctx.captured_queries[0]["sql"])
+            plan = "\n".join(" ".join(str(col) for col in row) for row in cursor.fetchall())
+        self.assertIn("invoice_user_status_idx", plan)
+        self.assertIn("invoice_user_created_idx", plan)
+        # Both halves come off their index already ordered: no sort step.
+        self.assertNotIn("TEMP B-TREE", plan.upper())
+
+
+
+class SMTPSink:
+    """
+    Minimal local SMTP server for delivery tests. Accepts AUTH PLAIN,
+    refuses recipients in `reject`, and records connections, logins and
+    messages.
+    """
+
+    def __init__(self, reject=()):
+        self.reject = set(reject)
+        self.connections = 0
+        self.logins = 0
+        self.messages = []
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode() + b"\r\n")
+
+            def handle(self):
+                sink.connections += 1
+                self.reply("220 sink ESMTP")
+                recipients = []
+                while True:
+                    line = self.rfile.readline().decode().rstrip("\r\n")
+                    if not line:
+                        return
+                    command = line.split(" ", 1)[0].upper()
+                    if command == "EHLO":
+                        self.reply("250-sink")
+                        self.reply("250 AUTH PLAIN")
+                    elif command == "AUTH":
+                        sink.logins += 1
+                        self.reply("235 Authenticated")
+                    elif command == "MAIL":
+                        recipients = []
+                        self.reply("250 OK")
+                    elif command == "RCPT":
+                        address = line.split(":", 1)[1].strip().strip("<>")
+                        if address in sink.reject:
+                            self.reply("550 No such user")
+                        else:
+                            recipients.append(address)
+                            self.reply("250 OK")
+                    elif command == "DATA":
+                        self.reply("354 End with .")
+                        data = []
+                        while (chunk := self.rfile.readline()) not in (b".\r\n", b""):
+                            data.append(chunk)
+                        sink.messages.append((recipients, b"".join(data).decode()))
+                        self.reply("250 Queued")
+                    elif command == "QUIT":
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        self.reply("250 OK")
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def settings(self):
+        return override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+            EMAIL_HOST="127.0.0.1",
+            EMAIL_PORT=self.port,
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER="noreply@example.com",
+            EMAIL_HOST_PASSWORD="app-password",
+        )
+
+
+class OutboundEmailQueueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def _queue(self, count, to="client{n}@example.com", **kwargs):
+        return [
+            enqueue_email(EmailMessage(f"Hello {n}", "Body", to=[to.format(n=n)]), **kwargs)
+            for n in range(count)
+        ]
+
+    def test_signup_queues_the_confirmation_and_the_worker_delivers_it(self):
+        # The signup template needs the Google SocialApp configured; only the flow matters here.
+        with mock.patch("users.views.render", return_value=HttpResponse()):
+            self.client.post(reverse("signup"), {
+                "first-name": "Ada", "last-name": "L", "email": "ada@example.com",
+                "password1": "long-enough-pw-1", "password2": "long-enough-pw-1",
+            })
+
+        # Nothing was sent during the request.
+        self.assertEqual(mail.outbox, [])
+        queued = OutboundEmail.objects.get()
+        self.assertEqual((queued.status, queued.to), (OutboundEmail.Status.QUEUED, ["ada@example.com"]))
+        self.assertEqual(queued.notification_type, Notification.Type.EMAIL_CONFIRM)
+
+        with SMTPSink() as sink, sink.settings():
+            self.assertEqual(deliver_queued_email(), {"sent": 1, "retrying": 0, "failed": 0})
+
+        self.assertEqual(len(sink.messages), 1)
+        self.assertEqual(sink.messages[0][0], ["ada@example.com"])
+        self.assertIn("/accounts/confirm-email/", sink.messages[0][1])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (OutboundEmail.Status.SENT, 1))
+        notification = Notification.objects.get()
+        self.assertEqual(
+            (notification.type, notification.status, notification.user.email),
+            (Notification.Type.EMAIL_CONFIRM, Notification.Status.SENT, "ada@example.com"),
+        )
+
+    def test_batches_share_one_authenticated_connection(self):
+        self._queue(7)
+        with SMTPSink() as sink, sink.settings(), CaptureQueriesContext(connection) as queries:
+            totals = deliver_queued_email(batch_size=3)
+
+        self.assertEqual(totals, {"sent": 7, "retrying": 0, "failed": 0})
+        self.assertEqual((sink.connections, sink.logins, len(sink.messages)), (1, 1, 7))
+        # Per batch: claim (select + lease update) and one UPDATE for the sent rows.
+        sent_updates = [q for q in queries.captured_queries if q["sql"].startswith("UPDATE") and "sent_at" in q["sql"]]
+        self.assertEqual(len(sent_updates), 3)
+
+    @override_settings(OUTBOUND_EMAIL_MAX_ATTEMPTS=2)
+    def test_rejected_message_is_retried_with_backoff_then_failed(self):
+        self._queue(3)
+        bad = self._queue(1, to="nobody@example.com", notification_type=Notification.Type.INVOICE_ISSUED)[0]
+        now = timezone.now()
+
+        with SMTPSink(reject={"nobody@example.com"}) as sink, sink.settings():
+            self.assertEqual(deliver_queued_email(now=now), {"sent": 3, "retrying": 1, "failed": 0})
+            bad.refresh_from_db()
+            self.assertEqual(bad.attempts, 1)
+            self.assertEqual(bad.next_attempt_at, now + timedelta(minutes=1))
+            self.assertIn("nobody@example.com", bad.last_error)
+            # Not due yet.
+            self.assertEqual(deliver_queued_email(now=now + timedelta(seconds=30)), {"sent": 0, "retrying": 0, "failed": 0})
+            self.assertEqual(
+                deliver_queued_email(now=now + timedelta(minutes=2)), {"sent": 0, "retrying": 0, "failed": 1}
+            )
+
+        self.assertEqual(len(sink.messages), 3)
+        bad.refresh_from_db()
+        self.assertEqual(bad.status, OutboundEmail.Status.FAILED)
+        notification = Notification.objects.get()
+        self.assertEqual((notification.status, notification.target_email), (Notification.Status.FAILED, "nobody@example.com"))
+
+    def test_unreachable_server_leaves_everything_queued(self):
+        self._queue(2)
+        with SMTPSink() as sink:
+            settings_ = sink.settings()
+        # The sink is shut down; nothing listens on its port any more.
+        with settings_:
+            self.assertEqual(deliver_queued_email(), {"sent": 0, "retrying": 2, "failed": 0})
+        self.assertEqual(
+            list(OutboundEmail.objects.values_list("status", "attempts")),
+            [(OutboundEmail.Status.QUEUED, 1)] * 2,
+        )
+
+    def test_send_mail_through_the_queued_backend(self):
+        send_mail(
+            "Subject", "Body", None, ["client@example.com"],
+            connection=get_connection("core.outbox.QueuedEmailBackend"),
+        )
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(OutboundEmail.objects.get().to, ["client@example.com"])
+
+
+class SessionStoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def _session_queries(self, queries):
+        return [q["sql"] for q in queries.captured_queries if "django_session" in q["sql"]]
+
+    def _saved(self, **data):
+        store = SessionStore()
+        store.update(data)
+        store.save()
+        return store.session_key
+
+    def test_reads_come_from_the_cache_and_fall_back_to_the_db(self):
+        key = self._saved(cart=[1, 2])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(SessionStore(key)["cart"], [1, 2])
+        self.assertEqual(self._session_queries(queries), [])
+
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(SessionStore(key)["cart"], [1, 2])
+            self.assertEqual(SessionStore(key)["cart"], [1, 2])
+        # One DB read refills the cache for the next request.
+        self.assertEqual(len(self._session_queries(queries)), 1)
+
+    def test_unchanged_session_is_not_written(self):
+        key = self._saved(cart=[1, 2])
+        store = SessionStore(key)
+        store["cart"] = [1, 2]
+        with CaptureQueriesContext(connection) as queries:
+            store.save()
+        self.assertEqual(self._session_queries(queries), [])
+
+        store["cart"].append(3)
+        with CaptureQueriesContext(connection) as queries:
+            store.save()
+        self.assertEqual(len([sql for sql in self._session_queries(queries) if sql.startswith("UPDATE")]), 1)
+        cache.clear()
+        self.assertEqual(SessionStore(key)["cart"], [1, 2, 3])
+
+    @override_settings(SESSION_REFRESH_INTERVAL=0)
+    def test_unchanged_session_still_refreshes_its_expiry(self):
+        key = self._saved(cart=[1])
+        store = SessionStore(key)
+        store["cart"] = [1]
+        with CaptureQueriesContext(connection) as queries:
+            store.save()
+        self.assertTrue(any(sql.startswith("UPDATE") for sql in self._session_queries(queries)))
+
+    # Settings pick core.sessions only with a shared cache; locmem stands in here.
+    @override_settings(SESSION_ENGINE="core.sessions", CACHE_IS_SHARED=True)
+    def test_signed_in_dashboard_runs_no_session_queries(self):
+        user = User.objects.create_user(email="client@example.com", password="pw", is_active=True)
+        self.client.force_login(user)
+        self.client.get(reverse("client_dashboard"))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("client_dashboard"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._session_queries(queries), [])
+
+    def test_logout_removes_the_cached_session(self):
+        user = User.objects.create_user(email="client@example.com", password="pw", is_active=True)
+        self.client.force_login(user)
+        key = self.client.session.session_key
+        self.client.logout()
+        self.assertFalse(SessionStore().exists(key))
+        self.assertEqual(SessionStore(key).load(), {})
+
+    def test_purge_deletes_expired_sessions_in_batches(self):
+        now = timezone.now()
+        Session.objects.bulk_create(
+            [Session(session_key=f"expired{n}", session_data="", expire_date=now - timedelta(days=1)) for n in range(5)]
+            + [Session(session_key=f"live{n}", session_data="", expire_date=now + timedelta(days=1)) for n in range(2)]
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(purge_expired_sessions(batch_size=2, now=now), 5)
+        deletes = [sql for sql in self._session_queries(queries) if sql.startswith("DELETE")]
+        self.assertEqual(len(deletes), 3)
+        self.assertEqual(sorted(Session.objects.values_list("session_key", flat=True)), ["live0", "live1"])
+
+
+class DashboardKPITests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.noon = timezone.make_aware(datetime.combine(self.today, time(12)))
+        self.client_user = User.objects.create_user(email="client@example.com", is_active=True)
+        self.admin = User.objects.create_user(
+            email="admin@example.com", is_active=True, is_staff=True, role=User.Role.ADMIN
+        )
+
+    def _appointment(self, start_time=None, **fields):
+        return Appointments.objects.create(user_id=self.client_user, start_time=start_time or self.noon, **fields)
+
+    def _row(self):
+        return DashboardKPI.objects.get()
+
+    def test_counters_follow_changes_and_match_a_full_recompute(self):
+        dashboard_kpis()
+        today = self._appointment(status=Appointments.Status.CONFIRMED)
+        self._appointment(start_time=self.noon + timedelta(days=1))
+        cancelled = self._appointment()
+        past = self._appointment(start_time=self.noon - timedelta(days=3), status=Appointments.Status.CONFIRMED)
+        User.objects.create_user(email="new@example.com", is_active=True)
+
+        moved = Appointments.objects.get(pk=today.pk)
+        moved.start_time = self.noon + timedelta(days=2)
+        moved.save()
+        moved.start_time = self.noon
+        moved.save()
+        bulk_update_status([cancelled.pk], Appointments.Status.CANCELLED, reason="Conflict")
+        sweep_finished_appointments(now=self.noon - timedelta(days=1))
+        Appointments.objects.get(pk=past.pk).delete()
+
+        first = create_invoice_record(user=self.client_user, amount=5000, stripe_invoice_id="in_1")
+        second = create_invoice_record(user=self.client_user, amount=700, stripe_invoice_id="in_2")
+        third = create_invoice_record(user=self.client_user, amount=300, stripe_invoice_id="in_3")
+        set_invoice_status(first, Invoice.Status.PAID)
+        set_invoice_statuses({second.pk: Invoice.Status.PAYMENT_FAILED, third.pk: Invoice.Status.VOIDED})
+
+        row = self._row()
+        self.assertEqual(
+            (row.appointments_pending, row.appointments_confirmed, row.appointments_cancelled,
+             row.appointments_completed, row.appointments_no_show),
+            (1, 1, 1, 0, 0),
+        )
+        self.assertEqual(row.schedule_day_count, 1)
+        self.assertEqual(row.new_clients_week, 2)
+        self.assertEqual(recompute_kpis(), {})
+
+    def test_sweeper_moves_status_counts(self):
+        self._appointment(start_time=self.noon - timedelta(days=2), status=Appointments.Status.CONFIRMED)
+        dashboard_kpis()
+
+        sweep_finished_appointments(now=self.noon)
+
+        row = self._row()
+        self.assertEqual((row.appointments_confirmed, row.appointments_completed), (0, 1))
+
+    def test_dashboard_reads_one_row(self):
+        self._appointment()
+        dashboard_kpis()
+
+        with self.assertNumQueries(1):
+            row = dashboard_kpis()
+        self.assertEqual(row.schedule_day_count, 1)
+
+    def test_new_day_rolls_the_dated_counters_forward(self):
+        self._appointment()
+        self._appointment(start_time=self.noon + timedelta(days=1))
+        self._appointment(start_time=self.noon + timedelta(days=1), status=Appointments.Status.CANCELLED)
+        self.assertEqual(dashboard_kpis(self.today).schedule_day_count, 1)
+
+        row = dashboard_kpis(self.today + timedelta(days=1))
+        self.assertEqual((row.schedule_day, row.schedule_day_count), (self.today + timedelta(days=1), 1))
+        self.assertEqual(row.appointments_pending, 2)
+
+        # Changes on other days leave the count alone.
+        self._appointment(start_time=self.noon + timedelta(days=5))
+        self.assertEqual(self._row().schedule_day_count, 1)
+
+    def test_recompute_repairs_changes_made_behind_the_signals(self):
+        appt = self._appointment()
+        dashboard_kpis()
+        Appointments.objects.filter(pk=appt.pk).update(status=Appointments.Status.CONFIRMED)
+
+        out = StringIO()
+        call_command("recompute_dashboard_kpis", stdout=out)
+
+        self.assertIn("appointments_confirmed: stored=0 expected=1", out.getvalue())
+        self.assertEqual((self._row().appointments_pending, self._row().appointments_confirmed), (0, 1))
+        self.assertEqual(recompute_kpis(), {})
+
+    def test_invoices_leave_the_kpi_row_alone(self):
+        dashboard_kpis()
+        with CaptureQueriesContext(connection) as ctx:
+            invoice = create_invoice_record(user=self.client_user, amount=250)
+            set_invoice_status(invoice, Invoice.Status.PAID)
+        self.assertFalse([q for q in ctx.captured_queries if "dashboard_kpis" in q["sql"]])
+
+    def test_admin_dashboard_shows_the_kpis(self):
+        self._appointment()
+        self.client.force_login(self.admin)
+
+        response = self.client.get(reverse("admin_dashboard"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["kpis"].schedule_day_count, 1)
+        self.assertContains(response, "New clients this week")
+
+        create_invoice_record(user=self.client_user, amount=250)
+        response = self.client.get(reverse("admin_dashboard"))
+        self.assertContains(response, "1 open invoice")
+
+
+class AdminClientDirectoryTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.admin = User.objects.create_user(email="admin@example.com", is_active=True, is_staff=True)
+        self.ada = User.objects.create_user(
+            email="ada@example.com", first_name="Ada", last_name="Lovelace", is_active=True
+        )
+        self.grace = User.objects.create_user(email="grace@example.com", first_name="Grace", last_name="Hopper")
+
+    def _all(self, sort, page_size):
+        seen = []
+        page = client_directory_page(sort, page_size=page_size)
+        seen.extend(page)
+        while page.has_next:
+            page = client_directory_page(sort, after=page.next_cursor, page_size=page_size)
+            seen.extend(page)
+        return seen
+
+    def test_rows_carry_appointment_and_invoice_figures(self):
+        Appointments.objects.create(user_id=self.ada, start_time=self.now - timedelta(days=3))
+        Appointments.objects.create(
+            user_id=self.ada, start_time=self.now + timedelta(days=1), status=Appointments.Status.CANCELLED
+        )
+        upcoming = Appointments.objects.create(user_id=self.ada, start_time=self.now + timedelta(days=2))
+        Appointments.objects.create(user_id=self.ada, start_time=self.now + timedelta(days=9))
+        create_invoice_record(user=self.ada, amount=1250, stripe_invoice_id="in_1")
+        paid = create_invoice_record(user=self.ada, amount=900, stripe_invoice_id="in_2")
+        set_invoice_status(paid, Invoice.Status.PAID)
+
+        rows = {client.pk: client for client in client_directory_page(now=self.now)}
+
+        self.assertNotIn(self.admin.pk, rows)
+        ada, grace = rows[self.ada.pk], rows[self.grace.pk]
+        self.assertEqual(ada.appointment_count, 4)
+        self.assertEqual(ada.next_appointment, upcoming.start_time)
+        self.assertEqual(ada.open_invoice_count, 1)
+        self.assertEqual(ada.balance_dollars * 100, 1250)
+        self.assertEqual((grace.appointment_count, grace.next_appointment, grace.open_invoice_count), (0, None, 0))
+
+    def test_a_page_is_one_query(self):
+        for n in range(30):
+            user = User.objects.create_user(email=f"client{n}@example.com", last_name=f"Client {n:02d}")
+            Appointments.objects.create(user_id=user, start_time=self.now + timedelta(days=1))
+
+        with self.assertNumQueries(1):
+            page = client_directory_page("name", page_size=10)
+            [
+                (c.email, c.last_name, c.phone_number, c.appointment_count, c.next_appointment,
+                 c.open_invoice_count, c.balance_dollars, c.date_joined)
+                for c in page
+            ]
+        self.assertEqual(len(page), 10)
+
+    def test_keyset_paging_visits_every_client_once_in_each_sort(self):
+        for n in range(11):
+            user = User.objects.create_user(email=f"c{n:02d}@example.com", last_name="Same")
+            User.objects.filter(pk=user.pk).update(balance_due=n % 3 * 100)
+        expected = set(User.objects.filter(is_staff=False).values_list("pk", flat=True))
+
+        for sort in SORTS:
+            seen = [client.pk for client in self._all(sort, page_size=4)]
+            self.assertEqual(len(seen), len(expected), sort)
+            self.assertEqual(set(seen), expected, sort)
+
+        balances = [client.balance_due for client in self._all("balance", page_size=4)]
+        self.assertEqual(balances, sorted(balances, reverse=True))
+
+        first = client_directory_page("name", page_size=4)
+        second = client_directory_page("name", after=first.next_cursor, page_size=4)
+        back = client_directory_page("name", before=second.previous_cursor, page_size=4)
+        self.assertEqual([c.pk for c in back], [c.pk for c in first])
+
+    def test_search_matches_email_or_last_name_prefix(self):
+        self.assertEqual([c.pk for c in client_directory_page(search="ADA@")], [self.ada.pk])
+        self.assertEqual([c.pk for c in client_directory_page(search="hop")], [self.grace.pk])
+
+    def test_page_is_admin_only_and_renders(self):
+        self.client.force_login(self.ada)
+        self.assertEqual(self.client.get(reverse("admin_clients")).status_code, 403)
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("admin_clients"), {"sort": "balance", "q": "grace"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["sort"], "balance")
+        self.assertContains(response, "grace@example.com")
+        self.assertNotContains(response, "ada@example.com")
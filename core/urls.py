@@ -43,11 +43,14 @@ urlpatterns = [
     path("administrator/", users_admin_dashboard, name="admin_dashboard"),
     path("administrator/dashboard/", users_admin_dashboard, name="admin_dashboard"),
     path("administrator/schedule/", views.admin_schedule, name="admin_schedule"),
+    path("administrator/schedule/calendar/", views.admin_schedule_calendar, name="admin_schedule_calendar"),
     path("administrator/transactions/", finance_views.admin_transactions, name="admin_transactions"),
+    path("administrator/transactions/bulk/", finance_views.admin_transactions_bulk, name="admin_transactions_bulk"),
     path("administrator/clients/", views.admin_clients, name="admin_clients"),
     path("administrator/editor/", views.admin_editor, name="admin_editor"),
     path("administrator/history/", views.admin_history, name="admin_history"),
     path("administrator/appointments/", views.admin_appointments, name="admin_appointments"),
+    path("administrator/appointments/bulk/", views.admin_appointments_bulk, name="admin_appointments_bulk"),
     path("administrator/appointments/<int:pk>/", views.admin_appointment_detail, name="admin_appointment_detail"),
     path("administrator/appointments/<int:pk>/cancel/", views.admin_appointment_cancel, name="admin_appointment_cancel"),
     path("administrator/appointments/<int:pk>/status/", views.admin_appointment_update_status, name="admin_appointment_update_status"),
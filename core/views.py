@@ -2,11 +2,14 @@
 # essentialy: user interactions -> tangible responses
 
 from django.shortcuts import render, HttpResponse, redirect, get_object_or_404
+from django.http import JsonResponse
 from django.urls import reverse
+from django.utils.http import urlencode
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth import get_user_model, logout
 from django.core.paginator import Paginator
+from django.db.models import BooleanField, Value
 from allauth.account.utils import complete_signup
 from allauth.account import app_settings as allauth_settings
 from allauth.account.adapter import get_adapter
@@ -18,6 +21,7 @@ from django.conf import settings
 from finances.models import Invoice
 from appointments.models import Appointments, Invitee
 from users.views import is_admin_user
+from users.directory import DEFAULT_SORT, SORTS, client_directory_page
 from django.utils import timezone
 
 
@@ -57,8 +61,56 @@ def login(r):
 #def admin_dashboard(r): return render(r, "admin/dashboard.html")
 # @login_required
 def admin_schedule(r): return render(r, "admin/schedule.html")
-# @login_required
-def admin_clients(r): return render(r, "admin/clients.html")
+@login_required
+def admin_schedule_calendar(request):
+    """
+    JSON for the admin schedule calendar: appointments per day between
+    ?start=YYYY-MM-DD and ?end=YYYY-MM-DD (inclusive), each as
+    [id, "HH:MM", duration_minutes, status, name].
+    """
+    is_admin_user(request.user)
+
+    from appointments.schedule import get_schedule_days, parse_range
+
+    try:
+        start, end = parse_range(request.GET.get("start"), request.GET.get("end"))
+    except ValueError as e:
+        return JsonResponse({"error": f"Invalid range: {e}"}, status=400)
+
+    return JsonResponse({
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "days": get_schedule_days(start, end),
+    })
+@login_required
+def admin_clients(request):
+    """
+    Client directory: one keyset-paged query per page, sortable by name,
+    email, balance or join date, with an optional email/last name prefix search.
+    """
+    is_admin_user(request.user)
+
+    sort = request.GET.get("sort", DEFAULT_SORT)
+    if sort not in SORTS:
+        sort = DEFAULT_SORT
+    search = (request.GET.get("q") or "").strip()
+
+    page = client_directory_page(
+        sort,
+        search,
+        after=request.GET.get("after"),
+        before=request.GET.get("before"),
+    )
+
+    return render(request, "admin/clients.html", {
+        "clients": page,
+        "page": page,
+        "sort": sort,
+        "sorts": [(key, label) for key, (label, _) in SORTS.items()],
+        "search": search,
+        "filter_query": urlencode({k: v for k, v in (("q", search), ("sort", sort)) if v}),
+        "search_query": urlencode({"q": search} if search else {}),
+    })
 # @login_required
 def admin_editor(request):
     """
@@ -98,24 +150,33 @@ def admin_appointment_confirmation(r): return render(r, "admin/appointment_confi
 # @login_required
 def admin_create_invoices(r): return render(r, "admin/create_invoice.html")
 
-@login_required
-def admin_appointments(request):
-    is_admin_user(request.user)
-
-    qs = Appointments.objects.select_related('user_id').prefetch_related('invitees').all()
-
+# Shared by the appointments list and its bulk actions so "all matching"
+# applies exactly the filters the admin is looking at.
+def _filter_admin_appointments(qs, params):
     # Filter by status
-    status_filter = request.GET.get('status', '')
+    status_filter = params.get('status', '')
     if status_filter and status_filter in Appointments.Status.values:
         qs = qs.filter(status=status_filter)
 
     # Filter by date range
-    date_from = request.GET.get('date_from', '')
-    date_to = request.GET.get('date_to', '')
+    date_from = params.get('date_from', '')
+    date_to = params.get('date_to', '')
     if date_from:
         qs = qs.filter(start_time__date__gte=date_from)
     if date_to:
         qs = qs.filter(start_time__date__lte=date_to)
+    return qs
+
+@login_required
+def admin_appointments(request):
+    is_admin_user(request.user)
+
+    qs = Appointments.objects.select_related('user_id').prefetch_related('invitees').all()
+    qs = _filter_admin_appointments(qs, request.GET)
+
+    status_filter = request.GET.get('status', '')
+    date_from = request.GET.get('date_from', '')
+    date_to = request.GET.get('date_to', '')
 
     paginator = Paginator(qs, 15)
     page_number = request.GET.get('page')
@@ -270,6 +331,64 @@ def admin_appointment_update_status(request, pk):
     messages.success(request, "Status updated.")
     return redirect(next_url)
 
+@require_POST
+@login_required
+def admin_appointments_bulk(request):
+    """
+    Apply one status action (cancel / complete / no-show) to many appointments.
+    Either the checked rows or, with select_all_matching, every appointment
+    matching the list filters (e.g. clearing a whole day) in one request.
+    """
+    is_admin_user(request.user)
+
+    from appointments.bulk import BULK_ACTIONS, bulk_update_status
+
+    next_url = request.POST.get("next") or reverse("admin_appointments")
+
+    new_status = BULK_ACTIONS.get(request.POST.get("action", ""))
+    if new_status is None:
+        messages.error(request, "Choose a bulk action.")
+        return redirect(next_url)
+
+    reason = (request.POST.get("reason") or "").strip()
+    if new_status == Appointments.Status.CANCELLED and not reason:
+        messages.error(request, "Cancellation reason is required.")
+        return redirect(next_url)
+
+    if request.POST.get("select_all_matching"):
+        # Without a filter "all matching" is every appointment ever booked.
+        if not any((request.POST.get(key) or "").strip() for key in ("status", "date_from", "date_to")):
+            messages.error(request, "Set at least one filter before applying an action to all matching appointments.")
+            return redirect(next_url)
+        ids = list(
+            _filter_admin_appointments(Appointments.objects.all(), request.POST)
+            .values_list("pk", flat=True)
+        )
+    else:
+        ids = request.POST.getlist("appointment_ids")
+
+    if not ids:
+        messages.warning(request, "No appointments selected.")
+        return redirect(next_url)
+
+    results = bulk_update_status(ids, new_status, reason=reason)
+
+    updated = [r for r in results if r["result"] == "updated"]
+    if updated:
+        messages.success(request, f"{len(updated)} appointment(s) updated.")
+    for r in results:
+        if r["result"] != "updated":
+            messages.warning(request, f"Appointment #{r['id']}: {r['message']}")
+        elif r["calendly"] == "failed":
+            messages.warning(
+                request,
+                f"Appointment #{r['id']}: cancelled locally. Calendly cancellation failed (best effort).",
+            )
+    if any(r["calendly"] == "skipped" for r in updated):
+        messages.info(request, "Calendly cancellation skipped (site not live yet — expected).")
+
+    return redirect(next_url)
+
 # Client Views
 #@login_required
 def client_about(r): return render(r, "client/about.html")
@@ -286,29 +405,71 @@ def client_practice_areas(r):
 #@login_required
 def client_schedule(r): return render(r, "client/schedule.html")
 
-#@login_required
-def client_invoices(r): 
-    user = r.user
+CLIENT_PAST_INVOICES = 10
 
-   # Current invoice to pay (pending)
-    current_invoice = Invoice.objects.filter(user=user, status=Invoice.Status.PENDING).order_by('created_at').first()
-    
-    # Convert amount to dollars for display
-    if current_invoice:
-        current_invoice.display_amount = current_invoice.amount / 100
-        stripe_url = current_invoice.hosted_invoice_url
-    else:
-        stripe_url = None
 
-    # Past invoices (paid or failed), newest first, limit 10
-    past_invoices = Invoice.objects.filter(user=user)
-    if current_invoice:
-        past_invoices = past_invoices.exclude(id=current_invoice.id)
-    past_invoices = past_invoices.order_by('-created_at')[:10]
+def client_invoice_queryset(user_id):
+    """
+    The one query behind the client invoices page: the oldest PENDING invoice
+    (the one to pay now) and the newest CLIENT_PAST_INVOICES + 1 invoices
+    (one extra in case the current invoice is among them).
+
+    Each half is an index-ordered LIMIT on its own composite index,
+    (user, status, created_at) and (user, created_at), joined with UNION ALL,
+    so the database reads at most CLIENT_PAST_INVOICES + 2 index entries
+    however many invoices the client has. `current` marks the first half.
+
+    The halves are wrapped as derived tables rather than combined with
+    QuerySet.union(), which refuses LIMIT inside a compound on SQLite.
+    """
+    pending = (
+        Invoice.objects
+        .filter(user_id=user_id, status=Invoice.Status.PENDING)
+        .annotate(current=Value(True, output_field=BooleanField()))
+        .order_by("created_at", "id")[:1]
+    )
+    recent = (
+        Invoice.objects
+        .filter(user_id=user_id)
+        .annotate(current=Value(False, output_field=BooleanField()))
+        .order_by("-created_at", "-id")[:CLIENT_PAST_INVOICES + 1]
+    )
+    pending_sql, pending_params = pending.query.sql_with_params()
+    recent_sql, recent_params = recent.query.sql_with_params()
+    return Invoice.objects.raw(
+        f"SELECT * FROM ({pending_sql}) AS pending_invoice"
+        f" UNION ALL SELECT * FROM ({recent_sql}) AS recent_invoice",
+        pending_params + recent_params,
+    )
+
 
-    # Convert past invoice amounts to dollars
-    for inv in past_invoices:
+def client_invoice_rows(user_id):
+    """
+    Everything the client invoices page shows, from one bounded query (see
+    client_invoice_queryset). Returns (current_invoice or None, past_invoices).
+    """
+    rows = list(client_invoice_queryset(user_id))
+
+    current = next((inv for inv in rows if inv.current), None)
+    past = sorted(
+        (inv for inv in rows if not inv.current and (current is None or inv.pk != current.pk)),
+        key=lambda inv: (inv.created_at, inv.pk),
+        reverse=True,
+    )[:CLIENT_PAST_INVOICES]
+
+    # Convert amounts to dollars for display
+    for inv in rows:
         inv.display_amount = inv.amount / 100
+    return current, past
+
+
+#@login_required
+def client_invoices(r): 
+    user = r.user
+
+    # Current invoice to pay (pending) and past invoices, newest first, limit 10
+    current_invoice, past_invoices = client_invoice_rows(user.id)
+    stripe_url = current_invoice.hosted_invoice_url if current_invoice else None
 
     return render(r, "client/invoices.html", {
         "current_invoice": current_invoice,
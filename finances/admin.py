@@ -1,5 +1,19 @@
-from django.contrib import admin
-from .models import Payment, Invoice, StripeWebhookEvent
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib import admin, messages
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html
+
+from .archive import load_archived_payload, search_archive
+from .billing import create_billing_drafts, default_through, parse_hourly_rate, preview_billing
+from .ledger import recalculate_balance
+from .rollups import invoice_day, rebuild_rollups
+from .models import Payment, Invoice, InvoiceDraft, StripeWebhookEvent
 
 # Register your models here.
 
@@ -9,13 +23,164 @@ admin.site.register(Payment)
 # Invoice Table
 @admin.register(Invoice)
 class InvoiceAdmin(admin.ModelAdmin):
-    list_display = ("id", "user", "amount", "status", "paid", "created_at")
+    list_display = ("id", "user", "amount", "status", "paid", "due_date", "created_at")
     list_filter = ("status", "paid", "created_at")
     search_fields = ("email", "first_name", "last_name")
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Edits here bypass finances.ledger, so recompute the owner's balance.
+        if not change or {"status", "amount", "user"} & set(form.changed_data):
+            recalculate_balance(obj.user_id)
+            if "user" in form.changed_data and form.initial.get("user"):
+                recalculate_balance(form.initial["user"])
+        if not change or {"status", "amount"} & set(form.changed_data):
+            day = invoice_day(obj.created_at)
+            rebuild_rollups(day, day)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        recalculate_balance(obj.user_id)
+        day = invoice_day(obj.created_at)
+        rebuild_rollups(day, day)
+
+    def delete_queryset(self, request, queryset):
+        affected = list(queryset.values_list("user_id", "created_at"))
+        super().delete_queryset(request, queryset)
+        for user_id in sorted({user_id for user_id, _ in affected}):
+            recalculate_balance(user_id)
+        # rebuild_rollups() redoes whole months, so one day per month will do.
+        months = {}
+        for _, created_at in affected:
+            day = invoice_day(created_at)
+            months.setdefault(day.replace(day=1), day)
+        for day in months.values():
+            rebuild_rollups(day, day)
+
+
+@admin.register(InvoiceDraft)
+class InvoiceDraftAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "status", "stripe_invoice_id", "attempts", "created_at")
+    list_filter = ("status", "created_at")
+    search_fields = ("stripe_invoice_id", "user__email")
+    readonly_fields = ("stripe_item_ids", "last_error", "attempts", "invoice")
+    change_list_template = "admin/finances/invoicedraft/change_list.html"
+
+    def get_urls(self):
+        urls = [
+            path(
+                "billing/",
+                self.admin_site.admin_view(self.billing_view),
+                name="finances_invoicedraft_billing",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def billing_view(self, request):
+        """
+        Preview month-end billing of completed appointments and create the
+        invoice drafts (see finances/billing.py). Sending them to Stripe is
+        left to the bill_appointments command, so a large month never runs
+        inside an admin request.
+        """
+        params = request.POST if request.method == "POST" else request.GET
+        through = _parse_day(params.get("through")) or default_through()
+        try:
+            due_days = int(params.get("due_days") or 30)
+        except ValueError:
+            due_days = 30
+        try:
+            rate = parse_hourly_rate(params["rate"]) if params.get("rate") else None
+        except ValueError as exc:
+            messages.error(request, str(exc))
+            if request.method == "POST":
+                return redirect(reverse("admin:finances_invoicedraft_billing"))
+            rate = None
+
+        if request.method == "POST":
+            due_date = timezone.localdate() + timedelta(days=due_days)
+            drafts, skipped = create_billing_drafts(through, due_date, rate=rate)
+            messages.info(
+                request,
+                f"{len(drafts)} invoice draft(s) pending for billing through {through}; "
+                f"{len(skipped)} client(s) skipped. Run "
+                f"\"manage.py bill_appointments --through {through.isoformat()}\" to send them to Stripe.",
+            )
+            return redirect(reverse("admin:finances_invoicedraft_changelist"))
+
+        bills = preview_billing(through, rate=rate)
+        for bill in bills:
+            bill.amount_dollars = Decimal(bill.amount) / 100
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Month-end billing",
+            "through": through,
+            "due_days": due_days,
+            "rate": params.get("rate", ""),
+            "bills": bills,
+            "billable_count": sum(1 for bill in bills if bill.billable),
+            "total_dollars": sum((bill.amount_dollars for bill in bills if bill.billable), Decimal(0)),
+        }
+        return TemplateResponse(request, "admin/finances/invoicedraft/billing.html", context)
+
+
+def _parse_day(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
 
 @admin.register(StripeWebhookEvent)
 class StripeWebhookEventAdmin(admin.ModelAdmin):
-    list_display = ("event_id", "event_type", "received_at")
-    list_filter = ("event_type", "received_at")
+    list_display = ("event_id", "event_type", "received_at", "archived_at")
+    list_filter = ("event_type", "received_at", "archived_at")
     search_fields = ("event_id", "event_type")
+    readonly_fields = ("archived_payload",)
+    change_list_template = "admin/finances/stripewebhookevent/change_list.html"
+
+    @admin.display(description="Payload (from archive)")
+    def archived_payload(self, obj):
+        if obj is None or obj.archived_at is None:
+            return "-"
+        payload = load_archived_payload(obj)
+        if payload is None:
+            return "Not found in archive."
+        return format_html("<pre>{}</pre>", json.dumps(payload, indent=2, sort_keys=True))
+
+    def get_urls(self):
+        urls = [
+            path(
+                "archive/",
+                self.admin_site.admin_view(self.archive_search_view),
+                name="finances_stripewebhookevent_archive",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def archive_search_view(self, request):
+        params = request.GET
+        searched = any(params.get(k) for k in ("event_id", "event_type", "since", "until", "q"))
+        results = []
+        if searched:
+            results = search_archive(
+                event_id=params.get("event_id", "").strip() or None,
+                event_type=params.get("event_type", "").strip() or None,
+                since=_parse_day(params.get("since")),
+                until=_parse_day(params.get("until")),
+                text=params.get("q", "").strip() or None,
+                limit=100,
+            )
+            for record in results:
+                record["payload_json"] = json.dumps(record["payload"], indent=2, sort_keys=True)
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Search archived Stripe events",
+            "params": params,
+            "searched": searched,
+            "results": results,
+        }
+        return TemplateResponse(request, "admin/finances/stripewebhookevent/archive_search.html", context)
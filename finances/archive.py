@@ -0,0 +1,150 @@
+"""
+Retention for StripeWebhookEvent payloads.
+
+Events older than STRIPE_EVENT_RETENTION_DAYS have their payload moved into
+gzip-compressed JSON Lines files, one per day:
+
+    <STRIPE_EVENT_ARCHIVE_DIR>/YYYY/MM/YYYY-MM-DD.jsonl.gz
+
+The database row keeps event_id, event_type and received_at so webhook
+de-duplication still works. Each run appends a new gzip member to the day's
+file, which gzip readers treat as one continuous stream.
+"""
+import gzip
+import json
+import logging
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import StripeWebhookEvent
+
+logger = logging.getLogger(__name__)
+
+
+def archive_dir() -> Path:
+    default = Path(settings.BASE_DIR) / "archive" / "stripe_events"
+    return Path(getattr(settings, "STRIPE_EVENT_ARCHIVE_DIR", "") or default)
+
+
+def retention_days() -> int:
+    return int(getattr(settings, "STRIPE_EVENT_RETENTION_DAYS", 30))
+
+
+def partition_path(day: date) -> Path:
+    return archive_dir() / f"{day:%Y}" / f"{day:%m}" / f"{day:%Y-%m-%d}.jsonl.gz"
+
+
+def _append(day: date, records):
+    path = partition_path(day)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lines = "".join(json.dumps(r, separators=(",", ":"), sort_keys=True) + "\n" for r in records)
+    with open(path, "ab") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+            gz.write(lines.encode("utf-8"))
+        raw.flush()
+
+
+def archive_old_events(now=None, older_than_days=None, batch_size=500, dry_run=False):
+    """
+    Move payloads of events received before the retention cutoff into the
+    archive, batch by batch, and clear them from the table.
+
+    Files are written before payloads are cleared, so a crash can at worst
+    archive an event twice (search de-duplicates by event_id), never lose it.
+    Returns the number of events archived.
+    """
+    now = now or timezone.now()
+    days = retention_days() if older_than_days is None else older_than_days
+    cutoff = now - timedelta(days=days)
+    qs = (
+        StripeWebhookEvent.objects
+        .filter(received_at__lt=cutoff, payload__isnull=False)
+        .order_by("received_at", "pk")
+    )
+
+    if dry_run:
+        return qs.count()
+
+    total = 0
+    while True:
+        rows = list(qs.values("pk", "event_id", "event_type", "received_at", "payload")[:batch_size])
+        if not rows:
+            break
+
+        by_day = {}
+        for row in rows:
+            received = timezone.localtime(row["received_at"])
+            by_day.setdefault(received.date(), []).append({
+                "event_id": row["event_id"],
+                "event_type": row["event_type"],
+                "received_at": received.isoformat(),
+                "payload": row["payload"],
+            })
+        for day, records in by_day.items():
+            _append(day, records)
+
+        StripeWebhookEvent.objects.filter(pk__in=[r["pk"] for r in rows]).update(payload=None, archived_at=now)
+        total += len(rows)
+        if len(rows) < batch_size:
+            break
+
+    if total:
+        logger.info("Archived Stripe webhook payloads. count=%s cutoff=%s", total, cutoff.isoformat())
+    return total
+
+
+def _partitions(since=None, until=None):
+    root = archive_dir()
+    if not root.exists():
+        return
+    for path in sorted(root.glob("*/*/*.jsonl.gz")):
+        try:
+            day = date.fromisoformat(path.name[:10])
+        except ValueError:
+            continue
+        if since and day < since:
+            continue
+        if until and day > until:
+            continue
+        yield path
+
+
+def search_archive(event_id=None, event_type=None, since=None, until=None, text=None, limit=100):
+    """
+    Scan archived events (oldest day first) and return up to `limit`
+    matching records. `since`/`until` are dates and prune whole files;
+    `text` is a plain substring match on the raw JSON line.
+    """
+    results = []
+    seen = set()
+    for path in _partitions(since, until):
+        with gzip.open(path, "rt", encoding="utf-8") as fh:
+            for line in fh:
+                if event_id and event_id not in line:
+                    continue
+                if text and text not in line:
+                    continue
+                record = json.loads(line)
+                if event_id and record["event_id"] != event_id:
+                    continue
+                if event_type and record["event_type"] != event_type:
+                    continue
+                if record["event_id"] in seen:
+                    continue
+                seen.add(record["event_id"])
+                results.append(record)
+                if len(results) >= limit:
+                    return results
+    return results
+
+
+def load_archived_payload(event):
+    """Payload of an archived StripeWebhookEvent, read back from its day's file."""
+    if event.payload is not None:
+        return event.payload
+    day = timezone.localtime(event.received_at).date()
+    found = search_archive(event_id=event.event_id, since=day, until=day, limit=1)
+    return found[0]["payload"] if found else None
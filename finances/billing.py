@@ -0,0 +1,276 @@
+"""
+Month-end batch billing from completed appointments.
+
+1. preview_billing() reads unbilled COMPLETED appointments up to a day in one
+   grouped query (per client and hosting attorney). It returns what each
+   client would be billed.
+2. create_billing_drafts() makes one InvoiceDraft per client and attaches the
+   appointments to it. It makes no Stripe calls, so the admin billing screen
+   can run it in a request. An appointment attached to a draft (or already
+   billed) is never picked up again, and the draft's client_key
+   ("billing-<day>-<user id>") makes a rerun for the same day find the
+   drafts it already made.
+3. run_billing() creates the Stripe customers the drafts still lack, then
+   sends the drafts through the invoice pipeline (finances/invoicing.py)
+   with bounded parallelism. It marks the appointments of every completed
+   draft as billed. Failed drafts keep their progress and finish on the
+   next run.
+
+Time is billed at the hosting attorney's AdminProfile.hourly_rate, matched
+on Appointments.calendly_host_email, or at the default rate otherwise.
+"""
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from appointments.models import Appointments
+from users.emails import normalize_email
+from users.models import AdminProfile, User
+
+from .customers import provision_stripe_customers
+from .invoicing import run_invoice_drafts
+from .models import InvoiceDraft
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ClientBill:
+    user_id: int
+    email: str
+    name: str
+    appointment_count: int = 0
+    minutes: int = 0
+    # Invoice lines as InvoiceDraft.lines stores them (amounts in cents).
+    lines: list = field(default_factory=list)
+    # Attorneys whose appointments had no rate to bill at.
+    unpriced_hosts: list = field(default_factory=list)
+
+    @property
+    def amount(self):
+        return sum(line["quantity"] * line["unit_amount"] for line in self.lines)
+
+    @property
+    def billable(self):
+        return bool(self.lines) and not self.unpriced_hosts
+
+
+def billing_client_key(through, user_id):
+    return f"billing-{through:%Y%m%d}-{user_id}"
+
+
+def default_through(today=None):
+    """The last day of the previous month."""
+    today = today or timezone.localdate()
+    return today.replace(day=1) - timedelta(days=1)
+
+
+def parse_hourly_rate(value):
+    """
+    An hourly rate from user input, as a Decimal. Raises ValueError unless it
+    is a finite number above zero (a negative line would be a Stripe credit).
+    """
+    try:
+        rate = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"Invalid hourly rate: {value}")
+    if not rate.is_finite() or rate <= 0:
+        raise ValueError(f"Invalid hourly rate: {value} (must be a positive amount)")
+    return rate
+
+
+def _period_end(through):
+    return timezone.make_aware(datetime.combine(through + timedelta(days=1), time.min))
+
+
+def hourly_rates():
+    """{attorney email (normalized): hourly rate}."""
+    return {
+        normalize_email(email): rate
+        for email, rate in AdminProfile.objects.values_list("user__email", "hourly_rate")
+    }
+
+
+def default_hourly_rate(rates):
+    """BILLING_DEFAULT_HOURLY_RATE, or the only attorney's rate in a one-rate practice."""
+    configured = getattr(settings, "BILLING_DEFAULT_HOURLY_RATE", None)
+    if configured:
+        return Decimal(str(configured))
+    distinct = set(rates.values())
+    return distinct.pop() if len(distinct) == 1 else None
+
+
+def unbilled_appointments(through):
+    return Appointments.objects.filter(
+        status=Appointments.Status.COMPLETED,
+        invoice_draft__isnull=True,
+        # Also set for appointments billed before batch billing existed, and
+        # keeps a deleted draft's appointments from being billed again.
+        billed_at__isnull=True,
+        start_time__lt=_period_end(through),
+    )
+
+
+def _line(through, count, duration, rate):
+    hours = Decimal(duration.total_seconds()) / 3600
+    cents = (hours * rate * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP)
+    return {
+        "description": (
+            f"Legal services through {through:%b %d, %Y}: {count} appointment{'s' if count != 1 else ''}, "
+            f"{hours.quantize(Decimal('0.01'))} h at ${rate}/h"
+        ),
+        "quantity": 1,
+        "unit_amount": int(cents),
+    }
+
+
+def _bills(appointments, through, rate=None):
+    """One ClientBill per client in `appointments`; a single grouped query plus two lookups."""
+    rates = hourly_rates()
+    fallback = rate if rate is not None else default_hourly_rate(rates)
+    rows = list(
+        appointments
+        .values("user_id", "calendly_host_email")
+        .annotate(count=Count("id"), duration=Sum("duration"))
+        .order_by("user_id", "calendly_host_email")
+    )
+    users = {
+        user.pk: user
+        for user in User.objects.filter(pk__in={row["user_id"] for row in rows})
+        .only("pk", "email", "first_name", "last_name")
+    }
+
+    bills = {}
+    for row in rows:
+        user = users[row["user_id"]]
+        bill = bills.get(user.pk)
+        if bill is None:
+            name = f"{user.first_name} {user.last_name}".strip() or user.email
+            bill = bills[user.pk] = ClientBill(user_id=user.pk, email=user.email, name=name)
+        duration = row["duration"] or timedelta()
+        bill.appointment_count += row["count"]
+        bill.minutes += int(duration.total_seconds() // 60)
+
+        host = row["calendly_host_email"] or ""
+        host_rate = rates.get(normalize_email(host), fallback) if host else fallback
+        if host_rate is None:
+            bill.unpriced_hosts.append(host or "(no host)")
+        else:
+            bill.lines.append(_line(through, row["count"], duration, host_rate))
+    return sorted(bills.values(), key=lambda bill: bill.email.lower())
+
+
+def preview_billing(through, rate=None, user_ids=None):
+    """What each client with unbilled completed appointments up to `through` would be billed."""
+    appointments = unbilled_appointments(through)
+    if user_ids is not None:
+        appointments = appointments.filter(user_id__in=user_ids)
+    return _bills(appointments, through, rate)
+
+
+def create_billing_drafts(through, due_date, rate=None, user_ids=None):
+    """
+    Create an InvoiceDraft per billable client and attach their appointments.
+
+    Returns (drafts, skipped): the drafts to run and the ClientBills that
+    could not be billed (missing rate). Clients without a Stripe customer
+    get a draft with an empty stripe_customer_id, filled in by run_billing.
+    """
+    bills = preview_billing(through, rate=rate, user_ids=user_ids)
+    skipped = [bill for bill in bills if not bill.billable]
+    bills = [bill for bill in bills if bill.billable]
+
+    customers = dict(
+        User.objects.filter(pk__in=[bill.user_id for bill in bills])
+        .values_list("pk", "provider_customer_id")
+    )
+
+    new_drafts = {}
+    for bill in bills:
+        with transaction.atomic():
+            draft, created = InvoiceDraft.objects.get_or_create(
+                client_key=billing_client_key(through, bill.user_id),
+                defaults={
+                    "user_id": bill.user_id,
+                    "stripe_customer_id": customers.get(bill.user_id) or "",
+                    "due_date": due_date,
+                    "lines": bill.lines,
+                },
+            )
+            if created:
+                unbilled_appointments(through).filter(user_id=bill.user_id).update(invoice_draft=draft)
+                new_drafts[bill.user_id] = draft
+
+    # Re-price from the appointments actually attached, in case more were
+    # completed between the preview and the update above.
+    for bill in _bills(Appointments.objects.filter(invoice_draft__in=list(new_drafts.values())), through, rate):
+        draft = new_drafts[bill.user_id]
+        if bill.lines != draft.lines:
+            draft.lines = bill.lines
+            draft.save(update_fields=["lines", "updated_at"])
+
+    # Includes unfinished drafts from an earlier run for the same day.
+    drafts = list(
+        InvoiceDraft.objects
+        .filter(client_key__startswith=billing_client_key(through, ""))
+        .exclude(status=InvoiceDraft.Status.COMPLETED)
+        .order_by("pk")
+    )
+    logger.info(
+        "Billing drafts ready. through=%s drafts=%s skipped=%s",
+        through,
+        len(drafts),
+        len(skipped),
+    )
+    return drafts, skipped
+
+
+def _attach_customers(drafts, max_workers=None):
+    """
+    Fill in the Stripe customer of drafts made before their client had one,
+    creating the customers with bounded parallelism. Returns the drafts that
+    still have none.
+    """
+    missing = [draft for draft in drafts if not draft.stripe_customer_id]
+    if not missing:
+        return []
+    user_ids = {draft.user_id for draft in missing}
+    provision_stripe_customers(User.objects.filter(pk__in=user_ids), max_workers=max_workers)
+    customers = dict(User.objects.filter(pk__in=user_ids).values_list("pk", "provider_customer_id"))
+
+    unattached = []
+    for draft in missing:
+        if customers.get(draft.user_id):
+            draft.stripe_customer_id = customers[draft.user_id]
+            draft.save(update_fields=["stripe_customer_id", "updated_at"])
+        else:
+            unattached.append(draft)
+    return unattached
+
+
+def run_billing(drafts, max_workers=None):
+    """
+    Create the Stripe customers `drafts` still lack, send the drafts through
+    the invoice pipeline and mark the appointments of every completed draft
+    as billed. Returns (completed, failed) as
+    run_invoice_drafts does.
+    """
+    unattached = _attach_customers(drafts, max_workers=max_workers)
+    drafts = [draft for draft in drafts if draft not in unattached]
+
+    completed, failed = run_invoice_drafts(drafts, max_workers=max_workers)
+    failed += [(draft, "No Stripe customer (provisioning failed)") for draft in unattached]
+    if completed:
+        Appointments.objects.filter(
+            invoice_draft__in=[draft.pk for draft, _ in completed],
+            billed_at__isnull=True,
+        ).update(billed_at=timezone.now())
+    for draft, message in failed:
+        logger.warning("Billing draft failed. draft_id=%s error=%s", draft.pk, message)
+    return completed, failed
@@ -0,0 +1,117 @@
+"""
+Bulk invoice actions for the admin transactions page.
+
+The selected invoices are read and validated in one query. The Stripe calls
+for the eligible ones run with at most STRIPE_MAX_CONCURRENCY requests in
+flight, and the local status changes are applied afterwards through the
+ledger in one set-based update (see finances/ledger.py). Stripe calls happen
+in worker threads; every database write happens here.
+"""
+import logging
+
+import stripe
+from django.utils import timezone
+
+from core.concurrency import bounded_map
+
+from . import stripe_cache
+from .checkout import expire_invoice_sessions
+from .invoicing import stripe_max_concurrency
+from .ledger import OUTSTANDING_STATUSES, set_invoice_statuses
+from .models import Invoice
+
+logger = logging.getLogger(__name__)
+
+# Bulk actions offered on the admin transactions list -> result label.
+BULK_ACTIONS = {
+    "void": "voided",
+    "resend": "sent",
+}
+
+
+# Keys use the Stripe invoice id, not the local pk, so a reset database or a
+# staging copy sharing the Stripe account can't replay another invoice's call.
+def _void(stripe_invoice_id, pk):
+    return stripe.Invoice.void_invoice(stripe_invoice_id, idempotency_key=f"void-{stripe_invoice_id}")
+
+
+def _resend(stripe_invoice_id, pk):
+    # One email per invoice per day, however often the button is pressed.
+    return stripe.Invoice.send_invoice(
+        stripe_invoice_id,
+        idempotency_key=f"send-{stripe_invoice_id}-{timezone.localdate():%Y%m%d}",
+    )
+
+
+def bulk_invoice_action(invoice_ids, action):
+    """
+    Void or resend a set of invoices.
+
+    Only outstanding invoices (pending or payment failed) that exist at Stripe
+    are eligible. A Stripe error on one invoice doesn't stop the others.
+
+    Returns one result dict per requested id:
+        {"id": ..., "result": "voided" | "sent" | "skipped" | "not_found" | "failed",
+         "message": ...}
+    """
+    if action not in BULK_ACTIONS:
+        raise ValueError(f"Unknown invoice action: {action}")
+
+    requested = []
+    for raw in invoice_ids:
+        try:
+            pk = int(raw)
+        except (TypeError, ValueError):
+            continue
+        if pk not in requested:
+            requested.append(pk)
+
+    results = {pk: {"id": pk, "result": "not_found", "message": "Invoice not found."} for pk in requested}
+
+    eligible = []
+    customers = {}
+    for pk, status, stripe_invoice_id, customer_id in (
+        Invoice.objects
+        .filter(pk__in=requested)
+        .values_list("pk", "status", "stripe_invoice_id", "user__provider_customer_id")
+    ):
+        if status not in OUTSTANDING_STATUSES:
+            results[pk].update(result="skipped", message=f"Invoice is {status}.")
+        elif not stripe_invoice_id:
+            results[pk].update(result="skipped", message="Invoice has no Stripe invoice.")
+        else:
+            eligible.append((stripe_invoice_id, pk))
+            customers[pk] = customer_id
+
+    call = _void if action == "void" else _resend
+    succeeded = []
+    for (stripe_invoice_id, pk), _, error in bounded_map(
+        lambda item: call(*item), eligible, max_workers=stripe_max_concurrency()
+    ):
+        if error is not None:
+            logger.warning(
+                "Bulk invoice action failed. action=%s invoice_id=%s stripe_invoice_id=%s error=%s",
+                action,
+                pk,
+                stripe_invoice_id,
+                error,
+            )
+            results[pk].update(result="failed", message=f"Stripe error: {error}")
+            continue
+        succeeded.append((stripe_invoice_id, pk))
+        results[pk].update(result=BULK_ACTIONS[action], message=f"Invoice {BULK_ACTIONS[action]}.")
+
+    if action == "void" and succeeded:
+        set_invoice_statuses({pk: Invoice.Status.VOIDED for _, pk in succeeded})
+        # Close any open checkout page so a voided invoice can't be paid.
+        expire_invoice_sessions([pk for _, pk in succeeded])
+        for stripe_invoice_id, pk in succeeded:
+            stripe_cache.invalidate_invoice(stripe_invoice_id, customers[pk])
+
+    logger.info(
+        "Bulk invoice action. action=%s requested=%s succeeded=%s",
+        action,
+        len(requested),
+        len(succeeded),
+    )
+    return [results[pk] for pk in requested]
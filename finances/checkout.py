@@ -0,0 +1,218 @@
+"""
+Stripe Checkout Sessions for paying invoices.
+
+Every open session is stored as a CheckoutSession row. Clicking "pay" again
+on the same unpaid invoice redirects straight to the stored session URL,
+with no Stripe call, as long as the session:
+
+- is still open,
+- charges the invoice's current amount, and
+- has at least REUSE_MARGIN left before it expires.
+
+Otherwise the stale session is expired and a new one is created.
+
+Sessions are expired proactively once the invoice is paid or voided, so a
+leftover tab can't take a second payment. A completed session marks its
+invoice paid, locally and (paid out of band) on the Stripe invoice, so the
+hosted invoice page can't take a second payment either. Until that lands no
+new session is opened for an invoice that already has a completed one at its
+current amount; a session whose delayed payment fails stops blocking.
+"""
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import stripe
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .ledger import set_invoice_status
+from .models import CheckoutSession, Invoice
+
+logger = logging.getLogger(__name__)
+
+# Don't hand out a session the client has no time left to complete.
+REUSE_MARGIN = timedelta(minutes=5)
+
+
+class InvoiceAlreadyPaid(Exception):
+    """A checkout session for the invoice's current amount has already completed."""
+
+
+def session_ttl() -> timedelta:
+    # Stripe accepts 30 minutes to 24 hours.
+    hours = float(getattr(settings, "STRIPE_CHECKOUT_SESSION_TTL_HOURS", 12))
+    return timedelta(hours=min(max(hours, 0.5), 24))
+
+
+def _reusable(invoice, now):
+    return (
+        CheckoutSession.objects
+        .filter(
+            invoice_id=invoice.pk,
+            status=CheckoutSession.Status.OPEN,
+            amount=invoice.amount,
+            expires_at__gt=now + REUSE_MARGIN,
+        )
+        .order_by("-expires_at")
+        .first()
+    )
+
+
+def _completed(invoice):
+    return CheckoutSession.objects.filter(
+        invoice_id=invoice.pk,
+        status=CheckoutSession.Status.COMPLETE,
+        amount=invoice.amount,
+    ).exists()
+
+
+def _create_session(invoice, now):
+    session = stripe.checkout.Session.create(
+        mode="payment",
+        payment_method_types=["card"],
+        line_items=[{
+            "price_data": {
+                "currency": "usd",
+                "product_data": {
+                    "name": f"Invoice #{invoice.id}",
+                },
+                "unit_amount": invoice.amount,
+            },
+            "quantity": 1,
+        }],
+        metadata={"invoice_id": str(invoice.id)},
+        expires_at=int((now + session_ttl()).timestamp()),
+        success_url="http://localhost:8000/payment/success/",
+        cancel_url="http://localhost:8000/dashboard/",
+    )
+    return CheckoutSession.objects.create(
+        invoice_id=invoice.pk,
+        stripe_session_id=session.id,
+        url=session.url,
+        amount=invoice.amount,
+        expires_at=datetime.fromtimestamp(session.expires_at, tz=dt_timezone.utc),
+    )
+
+
+def _expire(sessions):
+    """Expire the given OPEN sessions at Stripe and locally."""
+    expired = []
+    for checkout in sessions:
+        try:
+            stripe.checkout.Session.expire(checkout.stripe_session_id)
+        except stripe.error.InvalidRequestError:
+            # Already completed or expired at Stripe; nothing left to close.
+            pass
+        except stripe.error.StripeError as exc:
+            # Leave it OPEN so the next call tries again.
+            logger.warning(
+                "Could not expire Stripe checkout session. session_id=%s error=%s",
+                checkout.stripe_session_id,
+                exc,
+            )
+            continue
+        expired.append(checkout.pk)
+    if expired:
+        CheckoutSession.objects.filter(pk__in=expired, status=CheckoutSession.Status.OPEN).update(
+            status=CheckoutSession.Status.EXPIRED
+        )
+    return len(expired)
+
+
+def get_checkout_url(invoice):
+    """
+    URL of a Checkout Session paying `invoice`, reusing an open one when possible.
+
+    The first lookup needs no lock. A new session is only created while the
+    invoice row is locked, so two quick clicks can't open two sessions.
+    Raises InvoiceAlreadyPaid when a session for the current amount completed.
+    """
+    now = timezone.now()
+    checkout = _reusable(invoice, now)
+    if checkout:
+        return checkout.url
+
+    with transaction.atomic():
+        invoice = Invoice.objects.select_for_update().get(pk=invoice.pk)
+        checkout = _reusable(invoice, now)
+        if checkout:
+            return checkout.url
+        if _completed(invoice):
+            raise InvoiceAlreadyPaid(invoice.pk)
+
+        stale = list(
+            CheckoutSession.objects.filter(invoice_id=invoice.pk, status=CheckoutSession.Status.OPEN)
+        )
+        _expire([session for session in stale if session.expires_at > now])
+        # Sessions past expires_at are already closed at Stripe.
+        CheckoutSession.objects.filter(
+            pk__in=[session.pk for session in stale if session.expires_at <= now],
+        ).update(status=CheckoutSession.Status.EXPIRED)
+
+        checkout = _create_session(invoice, now)
+    return checkout.url
+
+
+def expire_invoice_sessions(invoice_ids):
+    """Expire every open checkout session for the given (paid or voided) invoices."""
+    sessions = list(
+        CheckoutSession.objects.filter(
+            invoice_id__in=list(invoice_ids),
+            status=CheckoutSession.Status.OPEN,
+            expires_at__gt=timezone.now(),
+        )
+    )
+    return _expire(sessions)
+
+
+def _pay_stripe_invoice(invoice):
+    """Mark the Stripe invoice paid out of band, so Stripe stops collecting it."""
+    if not invoice.stripe_invoice_id:
+        return
+    try:
+        stripe.Invoice.pay(invoice.stripe_invoice_id, paid_out_of_band=True)
+    except stripe.error.StripeError as exc:
+        # Already paid or voided at Stripe, or unreachable; the invoice webhooks settle it.
+        logger.warning(
+            "Could not mark Stripe invoice paid out of band. invoice_id=%s stripe_invoice_id=%s error=%s",
+            invoice.pk,
+            invoice.stripe_invoice_id,
+            exc,
+        )
+
+
+def record_session_event(event_type, session_obj):
+    """
+    Mirror checkout.session webhooks onto the stored row. A completed, paid
+    session also marks its invoice (metadata.invoice_id) paid. A session whose
+    delayed payment failed is recorded as expired, so a new one can be opened.
+    """
+    status = {
+        "checkout.session.completed": CheckoutSession.Status.COMPLETE,
+        "checkout.session.async_payment_succeeded": CheckoutSession.Status.COMPLETE,
+        "checkout.session.async_payment_failed": CheckoutSession.Status.EXPIRED,
+        "checkout.session.expired": CheckoutSession.Status.EXPIRED,
+    }.get(event_type)
+    if not status or not session_obj.get("id"):
+        return
+    CheckoutSession.objects.filter(stripe_session_id=session_obj["id"]).update(status=status)
+
+    if status != CheckoutSession.Status.COMPLETE or session_obj.get("payment_status") != "paid":
+        return
+    invoice_id = str((session_obj.get("metadata") or {}).get("invoice_id") or "")
+    invoice = Invoice.objects.filter(pk=int(invoice_id)).first() if invoice_id.isdigit() else None
+    if invoice is None:
+        logger.warning(
+            "Completed checkout session has no matching invoice. session_id=%s invoice_id=%s",
+            session_obj["id"],
+            invoice_id,
+        )
+        return
+    if set_invoice_status(invoice, Invoice.Status.PAID):
+        _pay_stripe_invoice(invoice)
+        # Close any other tab still open on this invoice.
+        expire_invoice_sessions([invoice.pk])
+        logger.info(
+            "Invoice paid through checkout. invoice_id=%s session_id=%s", invoice.pk, session_obj["id"]
+        )
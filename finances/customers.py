@@ -0,0 +1,125 @@
+"""
+Stripe customer provisioning.
+
+Each client maps to one Stripe customer, stored in User.provider_customer_id.
+Customer creation always uses the idempotency key
+"stripe-customer-<User.stripe_idempotency_token>". If two requests (or a
+request and the backfill command) race for the same user within Stripe's 24
+hour key window, they get the same customer back. The token is random, so
+another database on the same Stripe account never produces the same key.
+"""
+import logging
+
+import stripe
+from django.db import transaction
+from django.db.models import Q
+
+from core.concurrency import bounded_map
+from users.models import User
+
+from .invoicing import stripe_max_concurrency
+
+logger = logging.getLogger(__name__)
+
+
+def customer_idempotency_key(user) -> str:
+    return f"stripe-customer-{user.stripe_idempotency_token}"
+
+
+def _missing_customer_q():
+    return Q(provider_customer_id__isnull=True) | Q(provider_customer_id="")
+
+
+def _create_customer(user):
+    return stripe.Customer.create(
+        email=user.email,
+        name=f"{user.first_name} {user.last_name}",
+        metadata={"user_id": str(user.id)},
+        idempotency_key=customer_idempotency_key(user),
+    )
+
+
+def get_or_create_stripe_customer_id(user):
+    """
+    Return the user's Stripe customer id, creating the customer if needed.
+
+    The check and the write happen while the user's row is locked, so
+    concurrent callers for one user are serialized and only one of them
+    talks to Stripe. Once provision_stripe_customers has run, this is a
+    single indexed read.
+    """
+    customer_id = (
+        User.objects.filter(pk=user.pk).values_list("provider_customer_id", flat=True).first()
+    )
+    if customer_id:
+        user.provider_customer_id = customer_id
+        return customer_id
+
+    with transaction.atomic():
+        # locks the user's row to prevent duplicate stripe customers for one user
+        locked = User.objects.select_for_update().get(pk=user.pk)
+        if not locked.provider_customer_id:
+            customer = _create_customer(locked)
+            locked.provider_customer_id = customer.id
+            locked.save(update_fields=["provider_customer_id"])
+
+    user.provider_customer_id = locked.provider_customer_id
+    return locked.provider_customer_id
+
+
+def clients_without_customer():
+    """Active, non-staff users that have no Stripe customer yet."""
+    return (
+        User.objects
+        .filter(_missing_customer_q(), is_active=True, is_staff=False, is_superuser=False)
+        .order_by("pk")
+    )
+
+
+def provision_stripe_customers(users=None, batch_size=200, max_workers=None, dry_run=False):
+    """
+    Create Stripe customers for every user in `users` (default: all clients
+    without one). Customers are created with up to `max_workers` requests in
+    flight, and ids are saved one batch at a time.
+
+    A save only fills an empty provider_customer_id, so it never overwrites
+    an id that a concurrent invoice request stored first. With the shared
+    idempotency key, that id is the same customer anyway.
+
+    Returns {"created": n, "failed": n}.
+    """
+    qs = clients_without_customer() if users is None else users.filter(_missing_customer_q())
+    max_workers = max_workers or stripe_max_concurrency()
+    totals = {"created": 0, "failed": 0}
+
+    if dry_run:
+        totals["created"] = qs.count()
+        return totals
+
+    last_pk = 0
+    while True:
+        batch = list(
+            qs.filter(pk__gt=last_pk)
+            .only("pk", "email", "first_name", "last_name", "stripe_idempotency_token")[:batch_size]
+        )
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+
+        for user, customer, error in bounded_map(_create_customer, batch, max_workers=max_workers):
+            if error is not None:
+                totals["failed"] += 1
+                logger.warning("Stripe customer provisioning failed. user_id=%s error=%s", user.pk, error)
+                continue
+            User.objects.filter(_missing_customer_q(), pk=user.pk).update(provider_customer_id=customer.id)
+            totals["created"] += 1
+
+        if len(batch) < batch_size:
+            break
+
+    logger.info(
+        "Stripe customer provisioning finished. created=%s failed=%s",
+        totals["created"],
+        totals["failed"],
+    )
+    return totals
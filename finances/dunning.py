@@ -0,0 +1,106 @@
+"""
+Overdue invoice reminders (the send_invoice_reminders command).
+
+An invoice is due a reminder when all of these hold:
+- it is PENDING,
+- its due_date has passed, and
+- no reminder was queued in the last DUNNING_REMINDER_INTERVAL_DAYS days
+  (default 7).
+
+The (status, due_date) index makes each run read only the invoices that are
+actually overdue. They are processed in pk batches. Each reminder is queued
+in the outbound email queue (core/outbox.py) with notification_type
+INVOICE_REMINDER, and each batch stamps last_reminder_at with one UPDATE.
+Delivery, retries with backoff and the final SENT or FAILED Notification are
+left to the send_queued_email worker, so a bad address fails once per
+reminder instead of on every run.
+"""
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from appointments.models import Notification
+from core.outbox import enqueue_email
+
+from .models import Invoice
+
+logger = logging.getLogger(__name__)
+
+
+def reminder_interval() -> timedelta:
+    return timedelta(days=int(getattr(settings, "DUNNING_REMINDER_INTERVAL_DAYS", 7)))
+
+
+def due_for_reminder(now=None):
+    now = now or timezone.now()
+    return (
+        Invoice.objects
+        .filter(status=Invoice.Status.PENDING, due_date__lt=timezone.localdate(now))
+        .filter(Q(last_reminder_at__isnull=True) | Q(last_reminder_at__lt=now - reminder_interval()))
+    )
+
+
+def _reminder_email(invoice, today):
+    context = {
+        "invoice": invoice,
+        "user": invoice.user,
+        "amount_dollars": Decimal(invoice.amount) / 100,
+        "days_overdue": (today - invoice.due_date).days,
+    }
+    subject = render_to_string("finances/email/invoice_reminder_subject.txt", context).strip()
+    body = render_to_string("finances/email/invoice_reminder_message.txt", context)
+    return EmailMessage(subject, body, to=[invoice.user.email])
+
+
+def send_invoice_reminders(batch_size=100, dry_run=False, now=None):
+    """Queue every due reminder. Returns {"queued": n}."""
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    qs = (
+        due_for_reminder(now)
+        .select_related("user")
+        .only(
+            "id", "user_id", "amount", "due_date", "hosted_invoice_url",
+            "user__email", "user__first_name", "user__last_name",
+        )
+        .order_by("pk")
+    )
+    totals = {"queued": 0}
+    if dry_run:
+        totals["queued"] = qs.count()
+        return totals
+
+    last_pk = 0
+    while True:
+        batch = list(qs.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+
+        with transaction.atomic():
+            for invoice in batch:
+                enqueue_email(
+                    _reminder_email(invoice, today),
+                    user=invoice.user,
+                    notification_type=Notification.Type.INVOICE_REMINDER,
+                    payload={
+                        "invoice_id": invoice.pk,
+                        "amount": invoice.amount,
+                        "due_date": invoice.due_date.isoformat(),
+                    },
+                )
+            Invoice.objects.filter(pk__in=[invoice.pk for invoice in batch]).update(last_reminder_at=now)
+        totals["queued"] += len(batch)
+
+        if len(batch) < batch_size:
+            break
+
+    logger.info("Invoice reminders queued. queued=%s", totals["queued"])
+    return totals
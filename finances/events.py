@@ -0,0 +1,279 @@
+"""
+Stripe event processing, shared by the webhook and the reconciliation job.
+
+process_stripe_event() handles one verified event the way stripe_webhook
+always has: record it in StripeWebhookEvent (duplicates stop there), then
+update the matching Invoice's status.
+
+reconcile_stripe_events() catches up on events the webhook never delivered
+(endpoint down, STRIPE_WEBHOOK_SECRET missing, ...). It reads Stripe's event
+list forward from a stored StripeEventCursor and skips events already
+recorded. It then applies the invoice changes in bulk through the ledger.
+When nothing has happened since the last run it costs one empty API page.
+"""
+import json
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import stripe
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import stripe_cache
+from .checkout import expire_invoice_sessions, record_session_event
+from .ledger import FINAL_STATUSES, set_invoice_status, set_invoice_statuses, transition_applies
+from .models import Invoice, StripeEventCursor, StripeWebhookEvent
+
+logger = logging.getLogger(__name__)
+
+# Stripe event type -> local invoice status.
+INVOICE_STATUS_EVENTS = {
+    "invoice.paid": Invoice.Status.PAID,
+    "invoice.payment_failed": Invoice.Status.PAYMENT_FAILED,
+    "invoice.voided": Invoice.Status.VOIDED,
+}
+
+CURSOR_NAME = "invoice_events"
+
+
+def _local_invoice_id(invoice_obj):
+    # Stripe invoice metadata can include our local invoice ID.
+    metadata = invoice_obj.get("metadata") or {}
+    return metadata.get("local_invoice_id") or metadata.get("invoice_id")
+
+
+def find_invoice(invoice_obj):
+    invoice = None
+    local_invoice_id = _local_invoice_id(invoice_obj)
+    stripe_invoice_id = invoice_obj.get("id")
+    # Prefer a direct local ID lookup when available.
+    if local_invoice_id:
+        invoice = Invoice.objects.filter(id=local_invoice_id).first()
+    # Fall back to the Stripe invoice ID if stored in our database.
+    if not invoice and stripe_invoice_id:
+        invoice = Invoice.objects.filter(stripe_invoice_id=stripe_invoice_id).first()
+    return invoice
+
+
+def process_stripe_event(event_data):
+    """
+    Record and apply one Stripe event (a plain dict).
+    Returns "duplicate", "ignored" or "success".
+    """
+    event_id = event_data["id"]
+    try:
+        with transaction.atomic():
+            # Store the event so duplicates can be detected safely.
+            _, created = StripeWebhookEvent.objects.get_or_create(
+                event_id=event_id,
+                defaults={
+                    "event_type": event_data.get("type", ""),
+                    "payload": event_data,
+                },
+            )
+    except IntegrityError:
+        created = False
+
+    if not created:
+        logger.info("Duplicate Stripe event received: %s", event_id)
+        return "duplicate"
+
+    event_type = event_data.get("type")
+    invoice_obj = event_data.get("data", {}).get("object", {})
+
+    if (event_type or "").startswith("invoice."):
+        # Any invoice change makes cached admin lookups for it stale.
+        stripe_cache.invalidate_invoice(invoice_obj.get("id"), invoice_obj.get("customer"))
+
+    if event_type in INVOICE_STATUS_EVENTS:
+        invoice = find_invoice(invoice_obj)
+        if not invoice:
+            logger.warning(
+                "Stripe invoice event received but no matching invoice found. "
+                "event_id=%s stripe_invoice_id=%s local_invoice_id=%s",
+                event_id,
+                invoice_obj.get("id"),
+                _local_invoice_id(invoice_obj),
+            )
+            return "ignored"
+
+        # Status and client balance change together (see finances/ledger.py).
+        changed = set_invoice_status(invoice, INVOICE_STATUS_EVENTS[event_type])
+        if changed and invoice.status in FINAL_STATUSES:
+            # Close any open checkout page so the invoice can't be paid twice.
+            expire_invoice_sessions([invoice.id])
+        logger.info(
+            "Stripe invoice updated. invoice_id=%s status=%s event_id=%s",
+            invoice.id,
+            invoice.status,
+            event_id,
+        )
+
+    if (event_type or "").startswith("checkout.session."):
+        record_session_event(event_type, invoice_obj)
+
+    logger.info("Stripe webhook processed. event_id=%s type=%s", event_id, event_type)
+    return "success"
+
+
+def _plain(obj):
+    """A StripeObject (or plain dict) as JSON-ready nested dicts."""
+    if isinstance(obj, stripe.StripeObject):
+        return json.loads(str(obj))
+    return obj
+
+
+def _events_since_cursor(cursor, page_size):
+    """
+    Events newer than cursor.last_event_id, oldest first.
+
+    Stripe lists newest first. ending_before=<id> returns the page just newer
+    than <id>, so each following page starts from the newest id seen so far.
+    """
+    pages = []
+    ending_before = cursor.last_event_id
+    while True:
+        page = stripe.Event.list(
+            types=list(INVOICE_STATUS_EVENTS),
+            limit=page_size,
+            ending_before=ending_before,
+        )
+        data = [_plain(event) for event in page.get("data", [])]
+        if not data:
+            break
+        pages.append(data)
+        ending_before = data[0]["id"]
+        if not page.get("has_more"):
+            break
+    # Pages come back oldest page first, each page newest first.
+    return [event for data in pages for event in reversed(data)]
+
+
+def _events_in_window(since, page_size):
+    """Events created at or after `since`, oldest first (used without a cursor)."""
+    events = []
+    starting_after = None
+    while True:
+        params = {
+            "types": list(INVOICE_STATUS_EVENTS),
+            "limit": page_size,
+            "created": {"gte": int(since.timestamp())},
+        }
+        if starting_after:
+            params["starting_after"] = starting_after
+        page = stripe.Event.list(**params)
+        data = [_plain(event) for event in page.get("data", [])]
+        events.extend(data)
+        if not data or not page.get("has_more"):
+            break
+        starting_after = data[-1]["id"]
+    events.reverse()
+    return events
+
+
+def reconcile_stripe_events(now=None, lookback=timedelta(days=3), page_size=100):
+    """
+    Apply invoice events Stripe sent while the webhook wasn't listening.
+
+    The cursor row stays locked for the whole run, so overlapping runs wait
+    instead of processing the same events twice. The cursor only moves
+    forward in the same transaction as the invoice updates.
+    Without a cursor (first run, or cursor event expired at Stripe) it scans
+    the last `lookback` of events.
+
+    Returns {"fetched": n, "new": n, "updated": n}.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        StripeEventCursor.objects.get_or_create(name=CURSOR_NAME)
+        cursor = StripeEventCursor.objects.select_for_update().get(name=CURSOR_NAME)
+
+        events = None
+        if cursor.last_event_id:
+            try:
+                events = _events_since_cursor(cursor, page_size)
+            except stripe.error.InvalidRequestError:
+                # Stripe keeps events for 30 days; the cursor event is gone.
+                logger.warning("Stripe event cursor no longer valid. cursor=%s", cursor.last_event_id)
+        if events is None:
+            events = _events_in_window(now - lookback, page_size)
+
+        known = set(
+            StripeWebhookEvent.objects
+            .filter(event_id__in=[event["id"] for event in events])
+            .values_list("event_id", flat=True)
+        )
+        new_events = [event for event in events if event["id"] not in known]
+
+        StripeWebhookEvent.objects.bulk_create(
+            [
+                StripeWebhookEvent(event_id=event["id"], event_type=event.get("type", ""), payload=event)
+                for event in new_events
+            ],
+            ignore_conflicts=True,
+        )
+
+        updated, changes = _apply_invoice_events(new_events)
+
+        if events:
+            newest = events[-1]
+            cursor.last_event_id = newest["id"]
+            if newest.get("created"):
+                cursor.last_event_created = datetime.fromtimestamp(newest["created"], tz=dt_timezone.utc)
+        cursor.last_run_at = now
+        cursor.save()
+
+    # Outside the transaction: Stripe calls shouldn't hold the cursor lock.
+    expire_invoice_sessions([pk for pk in updated if changes[pk] in FINAL_STATUSES])
+
+    if new_events:
+        logger.info(
+            "Reconciled missed Stripe events. new=%s updated_invoices=%s",
+            len(new_events),
+            len(updated),
+        )
+    return {"fetched": len(events), "new": len(new_events), "updated": len(updated)}
+
+
+def _apply_invoice_events(events):
+    """
+    Bulk version of the invoice part of process_stripe_event; later events win.
+    Returns (changed pks, {pk: status applied}).
+    """
+    if not events:
+        return [], {}
+
+    objects = [event.get("data", {}).get("object", {}) for event in events]
+    stripe_ids = {obj.get("id") for obj in objects if obj.get("id")}
+    local_ids = {str(_local_invoice_id(obj)) for obj in objects if _local_invoice_id(obj)}
+    local_pks = {int(pk) for pk in local_ids if pk.isdigit()}
+
+    found_pks, by_stripe_id = set(), {}
+    for pk, stripe_invoice_id in Invoice.objects.filter(
+        Q(stripe_invoice_id__in=stripe_ids) | Q(pk__in=local_pks)
+    ).values_list("pk", "stripe_invoice_id"):
+        found_pks.add(pk)
+        if stripe_invoice_id:
+            by_stripe_id[stripe_invoice_id] = pk
+
+    changes = {}
+    for event, obj in zip(events, objects):
+        local = str(_local_invoice_id(obj) or "")
+        pk = int(local) if local.isdigit() and int(local) in found_pks else None
+        pk = pk or by_stripe_id.get(obj.get("id"))
+        if pk is None:
+            logger.warning(
+                "Reconciled Stripe event has no matching invoice. event_id=%s stripe_invoice_id=%s",
+                event["id"],
+                obj.get("id"),
+            )
+            continue
+        new_status = INVOICE_STATUS_EVENTS[event["type"]]
+        # Same rule the ledger applies against the stored status, so a late
+        # failure after a payment within this batch doesn't win either.
+        if pk not in changes or transition_applies(changes[pk], new_status):
+            changes[pk] = new_status
+        stripe_cache.invalidate_invoice(obj.get("id"), obj.get("customer"))
+
+    return set_invoice_statuses(changes), changes
@@ -0,0 +1,296 @@
+"""
+Stripe invoice creation pipeline.
+
+An InvoiceDraft moves through these steps, saving after each one:
+
+    PENDING -> INVOICE_CREATED -> ITEMS_CREATED -> FINALIZED -> COMPLETED
+
+1. Create the Stripe invoice with pending_invoice_items_behavior="exclude" so
+   it only ever contains this draft's lines, never stray pending items.
+2. Create one invoice item per line, attached directly to that invoice, with
+   at most STRIPE_MAX_CONCURRENCY requests in flight. A multi-line invoice
+   takes about as long as a single line.
+3. Finalize the invoice.
+4. Record the local Invoice row.
+
+Every Stripe call sends an idempotency key built from the draft id and step
+("invoice-draft-12-item-3"). Running a draft again (after a timeout, a
+crash, or a Stripe error) skips the finished steps. A retried call whose
+earlier attempt actually reached Stripe gets back the original object
+instead of creating a second one. Stripe keeps idempotency keys for 24
+hours, so resume failed drafts within that window.
+
+run_invoice_drafts() runs many drafts (a billing run) one step at a time
+across all of them, sharing the same concurrency limit.
+"""
+import logging
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+import stripe
+from django.conf import settings
+from django.db import transaction
+
+from core.concurrency import bounded_map
+
+from . import stripe_cache
+from .ledger import create_invoice_record
+from .models import Invoice, InvoiceDraft
+
+logger = logging.getLogger(__name__)
+
+
+class InvoicePipelineError(Exception):
+    """A Stripe step failed. Progress so far is saved on the draft."""
+
+    def __init__(self, draft, message):
+        super().__init__(message)
+        self.draft = draft
+
+
+def stripe_max_concurrency() -> int:
+    return int(getattr(settings, "STRIPE_MAX_CONCURRENCY", 4))
+
+
+def parse_invoice_lines(descriptions, quantities, unit_prices):
+    """
+    Validate the create-invoice form's line items and convert prices to cents.
+    Raises ValueError on the first bad line, before anything is sent to Stripe.
+    """
+    lines = []
+    for desc, quantity, price in zip(descriptions, quantities, unit_prices):
+        try:
+            quantity = int(quantity)
+            # Decimal avoids float rounding (19.99 * 100 == 1998.999...).
+            unit_amount = int((Decimal(str(price)) * 100).quantize(Decimal("1")))
+        except (TypeError, ValueError, InvalidOperation):
+            raise ValueError("Invalid quantity or price.")
+        if quantity < 1 or unit_amount < 0:
+            raise ValueError("Invalid quantity or price.")
+        lines.append({"description": (desc or "").strip(), "quantity": quantity, "unit_amount": unit_amount})
+    if not lines:
+        raise ValueError("Add at least one line item.")
+    return lines
+
+
+def _due_date_timestamp(draft):
+    # Stripe wants a UNIX timestamp; matches the form's date at local midnight.
+    due = draft.due_date
+    return int(datetime(due.year, due.month, due.day).timestamp())
+
+
+def _stripe_invoice(draft):
+    return stripe.Invoice.create(
+        customer=draft.stripe_customer_id,
+        collection_method="send_invoice",
+        auto_advance=False,
+        due_date=_due_date_timestamp(draft),
+        # Only the items created below (attached by invoice id) end up on it.
+        pending_invoice_items_behavior="exclude",
+        metadata={"invoice_draft_id": str(draft.pk)},
+        idempotency_key=draft.idempotency_key("invoice"),
+    )
+
+
+def _save_invoice_created(draft, stripe_invoice):
+    draft.stripe_invoice_id = stripe_invoice.id
+    draft.status = InvoiceDraft.Status.INVOICE_CREATED
+    draft.save(update_fields=["stripe_invoice_id", "status", "updated_at"])
+
+
+def _create_stripe_invoice(draft):
+    _save_invoice_created(draft, _stripe_invoice(draft))
+
+
+def _missing_lines(draft):
+    return [
+        (index, line) for index, line in enumerate(draft.lines)
+        if str(index) not in draft.stripe_item_ids
+    ]
+
+
+def _stripe_item(draft, index, line):
+    return stripe.InvoiceItem.create(
+        customer=draft.stripe_customer_id,
+        invoice=draft.stripe_invoice_id,
+        description=line["description"],
+        quantity=line["quantity"],
+        unit_amount_decimal=line["unit_amount"],
+        currency="usd",  # Assuming only accepting usd.
+        idempotency_key=draft.idempotency_key(f"item-{index}"),
+    )
+
+
+def _save_line_items(draft, results):
+    """Save [(line index, item, error), ...]; raises if any line failed."""
+    errors = []
+    for index, item, error in results:
+        if error is not None:
+            errors.append(f"line {index + 1}: {error}")
+        else:
+            draft.stripe_item_ids[str(index)] = item.id
+
+    if not errors:
+        draft.status = InvoiceDraft.Status.ITEMS_CREATED
+    # Save whatever succeeded so a retry only sends the lines still missing.
+    draft.save(update_fields=["stripe_item_ids", "status", "updated_at"])
+    if errors:
+        raise InvoicePipelineError(draft, "Could not create invoice items: " + "; ".join(errors))
+
+
+def _create_line_items(draft):
+    results = bounded_map(
+        lambda item: _stripe_item(draft, *item),
+        _missing_lines(draft),
+        max_workers=stripe_max_concurrency(),
+    )
+    _save_line_items(draft, [(index, item, error) for (index, _), item, error in results])
+
+
+def _stripe_finalize(draft):
+    return stripe.Invoice.finalize_invoice(
+        draft.stripe_invoice_id,
+        idempotency_key=draft.idempotency_key("finalize"),
+    )
+
+
+def _save_finalized(draft):
+    draft.status = InvoiceDraft.Status.FINALIZED
+    draft.save(update_fields=["status", "updated_at"])
+
+
+def _finalize(draft):
+    stripe_invoice = _stripe_finalize(draft)
+    _save_finalized(draft)
+    return stripe_invoice
+
+
+def _record_invoice(draft, stripe_invoice):
+    with transaction.atomic():
+        invoice = Invoice.objects.filter(stripe_invoice_id=draft.stripe_invoice_id).first()
+        if invoice is None:
+            invoice = create_invoice_record(
+                stripe_invoice_id=draft.stripe_invoice_id,
+                user_id=draft.user_id,
+                amount=stripe_invoice.amount_due,
+                hosted_invoice_url=stripe_invoice.hosted_invoice_url,
+                due_date=draft.due_date,
+                status=Invoice.Status.PENDING,  # Webhook handles changes.
+            )
+        draft.invoice = invoice
+        draft.status = InvoiceDraft.Status.COMPLETED
+        draft.last_error = ""
+        draft.save(update_fields=["invoice", "status", "last_error", "updated_at"])
+    stripe_cache.invalidate_invoice(draft.stripe_invoice_id, draft.stripe_customer_id)
+    return invoice
+
+
+def run_invoice_draft(draft):
+    """
+    Take `draft` from wherever it stopped to COMPLETED and return its Invoice.
+    Raises InvoicePipelineError if a Stripe step fails; calling again resumes.
+    """
+    if draft.status == InvoiceDraft.Status.COMPLETED and draft.invoice_id:
+        return draft.invoice
+
+    draft.attempts += 1
+    draft.save(update_fields=["attempts", "updated_at"])
+
+    try:
+        if draft.status == InvoiceDraft.Status.PENDING:
+            _create_stripe_invoice(draft)
+        if draft.status == InvoiceDraft.Status.INVOICE_CREATED:
+            _create_line_items(draft)
+        if draft.status == InvoiceDraft.Status.ITEMS_CREATED:
+            stripe_invoice = _finalize(draft)
+        else:
+            # Finalized on an earlier attempt; read back the totals and URL.
+            stripe_invoice = stripe.Invoice.retrieve(draft.stripe_invoice_id)
+        return _record_invoice(draft, stripe_invoice)
+    except InvoicePipelineError as exc:
+        _record_failure(draft, str(exc))
+        raise
+    except stripe.error.StripeError as exc:
+        _record_failure(draft, str(exc))
+        raise InvoicePipelineError(draft, str(exc)) from exc
+
+
+def run_invoice_drafts(drafts, max_workers=None):
+    """
+    Batch version of run_invoice_draft for many drafts (e.g. a billing run).
+
+    Each step runs for every draft before the next step starts, with at most
+    `max_workers` Stripe requests in flight across all drafts. A draft that
+    fails a step keeps its progress, drops out of the rest of this run, and
+    resumes from there next time. Stripe calls happen in worker threads;
+    every database write happens here.
+
+    Returns (completed, failed): [(draft, invoice), ...] and [(draft, message), ...].
+    """
+    max_workers = max_workers or stripe_max_concurrency()
+    completed, failed, active = [], [], []
+    for draft in drafts:
+        if draft.status == InvoiceDraft.Status.COMPLETED and draft.invoice_id:
+            completed.append((draft, draft.invoice))
+            continue
+        draft.attempts += 1
+        draft.save(update_fields=["attempts", "updated_at"])
+        active.append(draft)
+
+    def fail(draft, error):
+        _record_failure(draft, str(error))
+        failed.append((draft, str(error)))
+
+    def at(status):
+        return [draft for draft in active if draft.status == status]
+
+    for draft, stripe_invoice, error in bounded_map(_stripe_invoice, at(InvoiceDraft.Status.PENDING), max_workers):
+        if error is not None:
+            fail(draft, error)
+        else:
+            _save_invoice_created(draft, stripe_invoice)
+
+    with_items = at(InvoiceDraft.Status.INVOICE_CREATED)
+    work = [(draft, index, line) for draft in with_items for index, line in _missing_lines(draft)]
+    results = {draft.pk: [] for draft in with_items}
+    for (draft, index, _), item, error in bounded_map(lambda w: _stripe_item(*w), work, max_workers):
+        results[draft.pk].append((index, item, error))
+    for draft in with_items:
+        try:
+            _save_line_items(draft, results[draft.pk])
+        except InvoicePipelineError as exc:
+            fail(draft, exc)
+
+    stripe_invoices = {}
+    for draft, stripe_invoice, error in bounded_map(_stripe_finalize, at(InvoiceDraft.Status.ITEMS_CREATED), max_workers):
+        if error is not None:
+            fail(draft, error)
+        else:
+            _save_finalized(draft)
+            stripe_invoices[draft.pk] = stripe_invoice
+
+    # Finalized on an earlier attempt; read back the totals and URL.
+    earlier = [draft for draft in at(InvoiceDraft.Status.FINALIZED) if draft.pk not in stripe_invoices]
+    for draft, stripe_invoice, error in bounded_map(
+        lambda d: stripe.Invoice.retrieve(d.stripe_invoice_id), earlier, max_workers
+    ):
+        if error is not None:
+            fail(draft, error)
+        else:
+            stripe_invoices[draft.pk] = stripe_invoice
+
+    for draft in at(InvoiceDraft.Status.FINALIZED):
+        if draft.pk in stripe_invoices:
+            completed.append((draft, _record_invoice(draft, stripe_invoices[draft.pk])))
+    return completed, failed
+
+
+def _record_failure(draft, message):
+    logger.warning(
+        "Invoice draft step failed. draft_id=%s status=%s error=%s",
+        draft.pk,
+        draft.status,
+        message,
+    )
+    InvoiceDraft.objects.filter(pk=draft.pk).update(last_error=message[:2000])
+    draft.last_error = message
@@ -0,0 +1,200 @@
+"""
+Client balance ledger.
+
+User.balance_due holds the total (cents) of the user's outstanding invoices.
+It is kept in step with invoice rows: every status change and every new
+invoice goes through this module, which updates the invoice and adjusts the
+balance with an F() expression in the same transaction. The client dashboard
+then reads one column instead of summing invoices on every load. The same
+transaction updates the invoice rollups (see finances/rollups.py) and the
+admin dashboard's receivables KPIs (core/kpis.py).
+
+reconcile_balances() (the reconcile_balances command) recomputes balances
+from the invoices to find and repair drift, e.g. after edits in Django admin
+or manual SQL.
+"""
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, F, Sum, Value, When
+
+from users.models import User
+
+from . import rollups
+from .models import Invoice
+
+logger = logging.getLogger(__name__)
+
+# Invoice statuses that still count toward what the client owes.
+OUTSTANDING_STATUSES = (Invoice.Status.PENDING, Invoice.Status.PAYMENT_FAILED)
+# Once paid or voided, a late (out-of-order) failure event must not reopen it.
+FINAL_STATUSES = (Invoice.Status.PAID, Invoice.Status.VOIDED)
+
+
+def _owed(amount, status):
+    return amount if status in OUTSTANDING_STATUSES else 0
+
+
+def transition_applies(old_status, new_status):
+    if old_status == new_status:
+        return False
+    return not (old_status in FINAL_STATUSES and new_status in OUTSTANDING_STATUSES)
+
+
+def _adjust(user_id, delta):
+    if delta:
+        User.objects.filter(pk=user_id).update(balance_due=F("balance_due") + delta)
+
+
+def create_invoice_record(**fields):
+    """Invoice.objects.create() that also adds the invoice to the user's balance."""
+    with transaction.atomic():
+        invoice = Invoice.objects.create(**fields)
+        _adjust(invoice.user_id, _owed(invoice.amount, invoice.status))
+        rollups.record_changes([(invoice.created_at, invoice.amount, None, invoice.status)])
+    return invoice
+
+
+def set_invoice_status(invoice, new_status):
+    """
+    Move `invoice` to `new_status` (keeping the legacy `paid` flag in step)
+    and adjust the owner's balance by the difference.
+
+    The invoice row is locked and re-read first, so two webhooks for the same
+    invoice can't both apply the same change. A PAID or VOIDED invoice is
+    never moved back to an outstanding status. Returns True if the status
+    changed.
+    """
+    with transaction.atomic():
+        current = (
+            Invoice.objects.select_for_update()
+            .only("id", "user_id", "amount", "status", "created_at")
+            .get(pk=invoice.pk)
+        )
+        if not transition_applies(current.status, new_status):
+            invoice.status, invoice.paid = current.status, current.status == Invoice.Status.PAID
+            return False
+
+        paid = new_status == Invoice.Status.PAID
+        Invoice.objects.filter(pk=current.pk).update(status=new_status, paid=paid)
+        _adjust(
+            current.user_id,
+            _owed(current.amount, new_status) - _owed(current.amount, current.status),
+        )
+        rollups.record_changes([(current.created_at, current.amount, current.status, new_status)])
+
+    invoice.status = new_status
+    invoice.paid = paid
+    return True
+
+
+def set_invoice_statuses(changes):
+    """
+    Bulk set_invoice_status for {invoice pk: new status}.
+
+    One locked read of the invoices, one UPDATE per target status, one
+    UPDATE for all affected balances and one per rollup row touched.
+    Follows the same rules as set_invoice_status. Returns the pks that
+    changed.
+    """
+    if not changes:
+        return []
+
+    with transaction.atomic():
+        rows = (
+            Invoice.objects.select_for_update()
+            .filter(pk__in=list(changes))
+            .values_list("pk", "user_id", "amount", "status", "created_at")
+        )
+        by_status = defaultdict(list)
+        deltas = defaultdict(int)
+        moves = []
+        for pk, user_id, amount, status, created_at in rows:
+            new_status = changes[pk]
+            if not transition_applies(status, new_status):
+                continue
+            by_status[new_status].append(pk)
+            deltas[user_id] += _owed(amount, new_status) - _owed(amount, status)
+            moves.append((created_at, amount, status, new_status))
+
+        for new_status, pks in by_status.items():
+            Invoice.objects.filter(pk__in=pks).update(
+                status=new_status, paid=new_status == Invoice.Status.PAID
+            )
+
+        deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+        if deltas:
+            User.objects.filter(pk__in=list(deltas)).update(
+                balance_due=F("balance_due") + Case(
+                    *[When(pk=user_id, then=Value(delta)) for user_id, delta in deltas.items()],
+                    default=Value(0),
+                    output_field=BigIntegerField(),
+                )
+            )
+        rollups.record_changes(moves)
+
+    return [pk for pks in by_status.values() for pk in pks]
+
+
+def outstanding_total(user_id):
+    return (
+        Invoice.objects
+        .filter(user_id=user_id, status__in=OUTSTANDING_STATUSES)
+        .aggregate(total=Sum("amount"))["total"]
+        or 0
+    )
+
+
+def recalculate_balance(user_id):
+    """Recompute one user's balance from their invoices, under a row lock."""
+    with transaction.atomic():
+        User.objects.select_for_update().filter(pk=user_id).values_list("pk").first()
+        total = outstanding_total(user_id)
+        User.objects.filter(pk=user_id).update(balance_due=total)
+    return total
+
+
+def reconcile_balances(fix=False):
+    """
+    Compare every stored balance with the sum of outstanding invoices.
+
+    Detection is two queries (one grouped SUM, one read of nonzero stored
+    balances). When `fix` is set, each drifted user is recomputed under a
+    row lock, so a concurrent invoice change can't be lost.
+
+    Returns a list of (user_id, stored, expected) for the users that drifted.
+    """
+    expected = dict(
+        Invoice.objects
+        .filter(status__in=OUTSTANDING_STATUSES)
+        .values("user_id")
+        .annotate(total=Sum("amount"))
+        .values_list("user_id", "total")
+    )
+    stored = dict(
+        User.objects.exclude(balance_due=0).values_list("pk", "balance_due")
+    )
+    # Users with outstanding invoices but a zero stored balance.
+    stored.update({
+        pk: 0
+        for pk in expected
+        if pk not in stored
+    })
+
+    drift = [
+        (user_id, balance, expected.get(user_id, 0))
+        for user_id, balance in sorted(stored.items())
+        if balance != expected.get(user_id, 0)
+    ]
+
+    if fix:
+        for user_id, balance, _ in drift:
+            total = recalculate_balance(user_id)
+            logger.warning(
+                "Repaired balance drift. user_id=%s stored=%s expected=%s",
+                user_id,
+                balance,
+                total,
+            )
+    return drift
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from finances.archive import archive_old_events, retention_days
+
+
+class Command(BaseCommand):
+    help = (
+        "Move Stripe webhook payloads older than STRIPE_EVENT_RETENTION_DAYS into "
+        "compressed daily JSON Lines archives, keeping id/type/time for de-duplication."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None, help="Override the retention window.")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        days = retention_days() if options["days"] is None else options["days"]
+        count = archive_old_events(
+            older_than_days=days,
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+        )
+        prefix = "Would archive" if options["dry_run"] else "Archived"
+        self.stdout.write(f"{prefix} {count} event payload(s) older than {days} day(s).")
@@ -0,0 +1,62 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from finances.billing import create_billing_drafts, default_through, parse_hourly_rate, preview_billing, run_billing
+
+
+def _day(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date: {value} (expected YYYY-MM-DD)")
+
+
+class Command(BaseCommand):
+    help = (
+        "Bill every client's unbilled completed appointments up to a day "
+        "(default: the end of last month): one Stripe invoice per client. "
+        "Safe to rerun; unfinished invoices resume where they stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--through", help="Last day to bill (YYYY-MM-DD).")
+        parser.add_argument("--due-days", type=int, default=30, help="Days until the invoices are due (default 30).")
+        parser.add_argument("--rate", help="Hourly rate for appointments whose attorney has none.")
+        parser.add_argument("--concurrency", type=int, default=None, help="Stripe requests in flight.")
+        parser.add_argument("--preview", action="store_true", help="Show what would be billed and stop.")
+
+    def handle(self, *args, **options):
+        through = _day(options["through"]) if options["through"] else default_through()
+        rate = None
+        if options["rate"]:
+            try:
+                rate = parse_hourly_rate(options["rate"])
+            except ValueError as exc:
+                raise CommandError(str(exc))
+
+        if options["preview"]:
+            bills = preview_billing(through, rate=rate)
+            for bill in bills:
+                note = f"  no rate for {', '.join(bill.unpriced_hosts)}" if bill.unpriced_hosts else ""
+                self.stdout.write(
+                    f"{bill.email}: {bill.appointment_count} appointment(s), {bill.minutes} min, "
+                    f"${Decimal(bill.amount) / 100:.2f}{note}"
+                )
+            self.stdout.write(f"{len(bills)} client(s) to bill through {through}.")
+            return
+
+        due_date = timezone.localdate() + timedelta(days=options["due_days"])
+        drafts, skipped = create_billing_drafts(through, due_date, rate=rate)
+        for bill in skipped:
+            self.stderr.write(f"Skipped {bill.email}: no hourly rate.")
+
+        completed, failed = run_billing(drafts, max_workers=options["concurrency"])
+        for draft, message in failed:
+            self.stderr.write(f"Draft {draft.pk} failed: {message}")
+        self.stdout.write(
+            f"Billed {len(completed)} client(s) through {through}; "
+            f"{len(failed)} failed, {len(skipped)} skipped."
+        )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from finances.customers import provision_stripe_customers
+
+
+class Command(BaseCommand):
+    help = (
+        "Create Stripe customers for all active clients that don't have one yet, "
+        "so invoice creation never has to do it inline. Safe to re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=None, help="Defaults to STRIPE_MAX_CONCURRENCY.")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        totals = provision_stripe_customers(
+            batch_size=options["batch_size"],
+            max_workers=options["concurrency"],
+            dry_run=options["dry_run"],
+        )
+        if options["dry_run"]:
+            self.stdout.write(f"Would create {totals['created']} Stripe customer(s).")
+        else:
+            self.stdout.write(f"Created {totals['created']} Stripe customer(s); {totals['failed']} failed.")
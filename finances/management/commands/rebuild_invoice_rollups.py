@@ -0,0 +1,35 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from finances.rollups import rebuild_rollups
+
+
+def _day(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        raise CommandError(f"Invalid date: {value} (expected YYYY-MM-DD)")
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the day and month invoice rollups from the invoices table. "
+        "Without dates every rollup is rebuilt; with --since/--until only the months they cover."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="First day to rebuild (YYYY-MM-DD).")
+        parser.add_argument("--until", help="Last day to rebuild (YYYY-MM-DD); defaults to today.")
+
+    def handle(self, *args, **options):
+        since, until = _day(options["since"]), _day(options["until"])
+        if until and not since:
+            raise CommandError("--until needs --since.")
+        if since and not until:
+            until = timezone.localdate()
+        if since and until < since:
+            raise CommandError("--until is before --since.")
+        written = rebuild_rollups(since, until)
+        self.stdout.write(f"Wrote {written} rollup row(s).")
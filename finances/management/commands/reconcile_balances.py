@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from finances.ledger import reconcile_balances
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare each client's stored balance_due with their outstanding invoices. "
+        "Reports drift, and repairs it with --fix."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true", help="Rewrite drifted balances from the invoices.")
+
+    def handle(self, *args, **options):
+        drift = reconcile_balances(fix=options["fix"])
+        for user_id, stored, expected in drift:
+            self.stdout.write(f"user {user_id}: stored={stored} expected={expected}")
+
+        if not drift:
+            self.stdout.write("All balances match.")
+        elif options["fix"]:
+            self.stdout.write(f"Repaired {len(drift)} balance(s).")
+        else:
+            self.stdout.write(f"{len(drift)} balance(s) drifted; re-run with --fix to repair.")
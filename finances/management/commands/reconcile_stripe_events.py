@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+import stripe
+from django.core.management.base import BaseCommand, CommandError
+
+from finances.events import reconcile_stripe_events
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply Stripe invoice events the webhook missed, reading forward from the "
+        "stored event cursor. Safe to run every few minutes; a run with nothing new "
+        "costs one Stripe API call."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lookback-days",
+            type=int,
+            default=3,
+            help="How far back to scan when there is no usable cursor (default 3).",
+        )
+        parser.add_argument("--page-size", type=int, default=100, help="Events per Stripe page (max 100).")
+
+    def handle(self, *args, **options):
+        try:
+            result = reconcile_stripe_events(
+                lookback=timedelta(days=options["lookback_days"]),
+                page_size=max(1, min(options["page_size"], 100)),
+            )
+        except stripe.error.StripeError as exc:
+            raise CommandError(f"Stripe error: {exc}")
+
+        self.stdout.write(
+            f"Fetched {result['fetched']} event(s), {result['new']} new, "
+            f"{result['updated']} invoice(s) updated."
+        )
@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from finances.invoicing import InvoicePipelineError, run_invoice_draft
+from finances.models import InvoiceDraft
+
+
+class Command(BaseCommand):
+    help = (
+        "Retry invoice drafts that stopped part way through Stripe creation. "
+        "Only drafts younger than Stripe's 24 hour idempotency window are retried."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-age-hours", type=int, default=23)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(hours=options["max_age_hours"])
+        drafts = (
+            InvoiceDraft.objects
+            .exclude(status=InvoiceDraft.Status.COMPLETED)
+            .filter(created_at__gte=since)
+            # Billing drafts still waiting for a Stripe customer are bill_appointments' job.
+            .exclude(stripe_customer_id="")
+            .order_by("created_at")
+        )
+
+        resumed = failed = 0
+        for draft in drafts:
+            if options["dry_run"]:
+                self.stdout.write(f"Would resume draft {draft.pk} ({draft.status}).")
+                continue
+            try:
+                invoice = run_invoice_draft(draft)
+            except InvoicePipelineError as exc:
+                failed += 1
+                self.stderr.write(f"Draft {draft.pk} failed again: {exc}")
+            else:
+                resumed += 1
+                self.stdout.write(f"Draft {draft.pk} completed as invoice {invoice.pk}.")
+
+        if not options["dry_run"]:
+            self.stdout.write(f"Resumed {resumed} draft(s); {failed} still failing.")
@@ -0,0 +1,29 @@
+import json
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from finances.archive import search_archive
+
+
+class Command(BaseCommand):
+    help = "Search archived Stripe webhook events. Prints one JSON object per match."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--event-id")
+        parser.add_argument("--type", dest="event_type")
+        parser.add_argument("--since", type=date.fromisoformat, help="YYYY-MM-DD")
+        parser.add_argument("--until", type=date.fromisoformat, help="YYYY-MM-DD")
+        parser.add_argument("--contains", help="Substring to look for in the raw event JSON (e.g. an invoice id).")
+        parser.add_argument("--limit", type=int, default=100)
+
+    def handle(self, *args, **options):
+        for record in search_archive(
+            event_id=options["event_id"],
+            event_type=options["event_type"],
+            since=options["since"],
+            until=options["until"],
+            text=options["contains"],
+            limit=options["limit"],
+        ):
+            self.stdout.write(json.dumps(record, sort_keys=True))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from finances.dunning import send_invoice_reminders
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue email reminders for overdue PENDING invoices that haven't had one recently "
+        "(DUNNING_REMINDER_INTERVAL_DAYS, default 7); send_queued_email delivers them. "
+        "Safe to run daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--dry-run", action="store_true", help="Count the reminders due without queueing them.")
+
+    def handle(self, *args, **options):
+        totals = send_invoice_reminders(batch_size=options["batch_size"], dry_run=options["dry_run"])
+        if options["dry_run"]:
+            self.stdout.write(f"{totals['queued']} reminder(s) due.")
+        else:
+            self.stdout.write(f"Queued {totals['queued']} reminder(s).")
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0006_invoice_voided_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stripewebhookevent',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='stripewebhookevent',
+            name='payload',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='stripewebhookevent',
+            name='received_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0007_stripe_webhook_event_archival'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceDraft',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('client_key', models.CharField(blank=True, max_length=64, null=True, unique=True)),
+                ('stripe_customer_id', models.CharField(max_length=255)),
+                ('due_date', models.DateField()),
+                ('customer_notes', models.TextField(blank=True, default='')),
+                ('lines', models.JSONField(default=list)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('INVOICE_CREATED', 'Stripe Invoice Created'), ('ITEMS_CREATED', 'Line Items Created'), ('FINALIZED', 'Finalized'), ('COMPLETED', 'Completed')], default='PENDING', max_length=20)),
+                ('stripe_invoice_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('stripe_item_ids', models.JSONField(blank=True, default=dict)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('invoice', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='draft', to='finances.invoice')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='invoice_drafts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'invoice_drafts',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
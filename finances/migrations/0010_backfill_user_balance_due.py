@@ -0,0 +1,28 @@
+from django.db import migrations
+from django.db.models import Sum
+
+
+def backfill_balance_due(apps, schema_editor):
+    Invoice = apps.get_model("finances", "Invoice")
+    User = apps.get_model("users", "User")
+    totals = (
+        Invoice.objects
+        .filter(status__in=["PENDING", "PAYMENT_FAILED"])
+        .values("user_id")
+        .annotate(total=Sum("amount"))
+        .values_list("user_id", "total")
+    )
+    for user_id, total in totals:
+        User.objects.filter(pk=user_id).update(balance_due=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0009_invoice_listing_indexes'),
+        ('users', '0003_user_balance_due'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_balance_due, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0010_backfill_user_balance_due'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['user', 'status', 'created_at'], name='invoice_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['user', 'created_at'], name='invoice_user_created_idx'),
+        ),
+        # After the composite indexes exist, so MySQL always has an index
+        # backing the foreign key when the single-column one is dropped.
+        migrations.AlterField(
+            model_name='invoice',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='invoices', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0011_invoice_user_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeEventCursor',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_event_id', models.CharField(blank=True, default='', max_length=255)),
+                ('last_event_created', models.DateTimeField(blank=True, null=True)),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'stripe_event_cursors',
+            },
+        ),
+    ]
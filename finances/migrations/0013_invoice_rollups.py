@@ -0,0 +1,57 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:36
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    Invoice = apps.get_model("finances", "Invoice")
+    InvoiceRollup = apps.get_model("finances", "InvoiceRollup")
+    months = defaultdict(lambda: [0, 0])
+    rows = []
+    for day, status, count, amount in (
+        Invoice.objects
+        .annotate(day=TruncDate("created_at"))
+        .values("day", "status")
+        .annotate(count=Count("id"), total=Sum("amount"))
+        .values_list("day", "status", "count", "total")
+    ):
+        rows.append(InvoiceRollup(granularity="DAY", period_start=day, status=status, invoice_count=count, amount=total))
+        month = months[(day.replace(day=1), status)]
+        month[0] += count
+        month[1] += total
+    rows.extend(
+        InvoiceRollup(granularity="MONTH", period_start=start, status=status, invoice_count=count, amount=total)
+        for (start, status), (count, total) in months.items()
+    )
+    InvoiceRollup.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0012_stripe_event_cursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceRollup',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('granularity', models.CharField(choices=[('DAY', 'Day'), ('MONTH', 'Month')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('PAID', 'Paid'), ('PAYMENT_FAILED', 'Payment Failed'), ('VOIDED', 'Voided')], max_length=20)),
+                ('invoice_count', models.IntegerField(default=0)),
+                ('amount', models.BigIntegerField(default=0, help_text='minor units (cents)')),
+            ],
+            options={
+                'db_table': 'invoice_rollups',
+                'ordering': ['granularity', 'period_start', 'status'],
+                'constraints': [models.UniqueConstraint(fields=('granularity', 'period_start', 'status'), name='invoice_rollup_period_status_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
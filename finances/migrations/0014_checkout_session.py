@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0013_invoice_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckoutSession',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('stripe_session_id', models.CharField(max_length=255, unique=True)),
+                ('url', models.URLField(max_length=1000)),
+                ('amount', models.PositiveIntegerField(help_text='minor units (cents)')),
+                ('status', models.CharField(choices=[('OPEN', 'Open'), ('COMPLETE', 'Complete'), ('EXPIRED', 'Expired')], default='OPEN', max_length=10)),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkout_sessions', to='finances.invoice')),
+            ],
+            options={
+                'db_table': 'checkout_sessions',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['invoice', 'status', 'expires_at'], name='checkout_invoice_open_idx')],
+            },
+        ),
+    ]
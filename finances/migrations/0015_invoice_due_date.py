@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:49
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_due_dates(apps, schema_editor):
+    # Invoices made through the draft pipeline still have their due date there.
+    Invoice = apps.get_model("finances", "Invoice")
+    InvoiceDraft = apps.get_model("finances", "InvoiceDraft")
+    Invoice.objects.filter(due_date__isnull=True).update(
+        due_date=Subquery(
+            InvoiceDraft.objects.filter(invoice_id=OuterRef("pk")).values("due_date")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0014_checkout_session'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='due_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='last_reminder_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['status', 'due_date'], name='invoice_status_due_idx'),
+        ),
+        migrations.RunPython(backfill_due_dates, migrations.RunPython.noop),
+    ]
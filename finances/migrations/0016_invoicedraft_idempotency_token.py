@@ -0,0 +1,38 @@
+import uuid
+
+from django.db import migrations, models
+
+
+def fill_idempotency_tokens(apps, schema_editor):
+    # One token per row; AddField would give every existing draft the same one.
+    InvoiceDraft = apps.get_model("finances", "InvoiceDraft")
+    batch = []
+    for draft in InvoiceDraft.objects.only("pk").order_by("pk").iterator(chunk_size=1000):
+        draft.idempotency_token = uuid.uuid4()
+        batch.append(draft)
+        if len(batch) >= 1000:
+            InvoiceDraft.objects.bulk_update(batch, ["idempotency_token"])
+            batch = []
+    if batch:
+        InvoiceDraft.objects.bulk_update(batch, ["idempotency_token"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0015_invoice_due_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoicedraft',
+            name='idempotency_token',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_idempotency_tokens, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='invoicedraft',
+            name='idempotency_token',
+            field=models.UUIDField(default=uuid.uuid4, editable=False),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.conf import settings
 
@@ -24,7 +26,8 @@ class Invoice(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.PROTECT,
         related_name="invoices",
-        db_index=True
+        # Covered by the (user, ...) composite indexes below.
+        db_index=False,
     )
     created_at = models.DateTimeField(auto_now_add=True)
     amount = models.PositiveIntegerField(help_text="minor units (cents)")
@@ -44,6 +47,10 @@ class Invoice(models.Model):
     stripe_invoice_id = models.CharField(max_length=255, unique=True, null=True, blank=True)
     # Stripe's invoice URL to easily find this invoice in the future.
     hosted_invoice_url = models.URLField(max_length=500, null=True, blank=True)
+    # Due date sent to Stripe; the dunning job finds overdue invoices by it.
+    due_date = models.DateField(null=True, blank=True)
+    # When the last overdue reminder went out (finances/dunning.py).
+    last_reminder_at = models.DateTimeField(null=True, blank=True)
 
     # Output Readability
     def __str__(self):
@@ -52,6 +59,17 @@ class Invoice(models.Model):
     class Meta:
         db_table = "invoices"
         ordering = ["-created_at"]
+        indexes = [
+            # Keyset pagination on the admin transactions page walks
+            # (created_at, id); InnoDB secondary indexes already carry the pk.
+            models.Index(fields=["created_at"], name="invoice_created_idx"),
+            models.Index(fields=["status", "created_at"], name="invoice_status_created_idx"),
+            # Client invoices page: a client's invoices by status / newest first.
+            models.Index(fields=["user", "status", "created_at"], name="invoice_user_status_idx"),
+            models.Index(fields=["user", "created_at"], name="invoice_user_created_idx"),
+            # Dunning: overdue PENDING invoices are a range scan on this index.
+            models.Index(fields=["status", "due_date"], name="invoice_status_due_idx"),
+        ]
     
     # To get and show client's name on transaction page for admin
     # If name is not listed, email is shown, if no email -> unknown
@@ -71,10 +89,160 @@ class StripeWebhookEvent(models.Model):
     # Stripe's event ID is unique across all events.
     event_id = models.CharField(max_length=255, unique=True, db_index=True)
     event_type = models.CharField(max_length=100)
-    received_at = models.DateTimeField(auto_now_add=True)
-    # Full payload for troubleshooting and audits.
-    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Full payload for troubleshooting and audits. Cleared once the event is
+    # moved to the compressed archive (see finances/archive.py).
+    payload = models.JSONField(null=True, blank=True)
+    archived_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         db_table = "stripe_webhook_events"
-        ordering = ["-received_at"]
\ No newline at end of file
+        ordering = ["-received_at"]
+
+
+class InvoiceDraft(models.Model):
+    """
+    Local record of an invoice while it is being created in Stripe.
+
+    Creating an invoice takes several Stripe calls (invoice, one item per line,
+    finalize). Each step's result is saved here, and every call carries an
+    idempotency key derived from this row's random idempotency_token, so a run
+    that fails part way can be retried without double-billing (see
+    finances/invoicing.py). Unlike the id, the token can't repeat in another
+    database sharing the Stripe account, or after ids are reused.
+    """
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "Pending"
+        INVOICE_CREATED = "INVOICE_CREATED", "Stripe Invoice Created"
+        ITEMS_CREATED = "ITEMS_CREATED", "Line Items Created"
+        FINALIZED = "FINALIZED", "Finalized"
+        COMPLETED = "COMPLETED", "Completed"
+
+    id = models.BigAutoField(primary_key=True)
+    # Token rendered into the create-invoice form, so resubmitting the same form
+    # resumes this draft instead of starting a new invoice.
+    client_key = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    idempotency_token = models.UUIDField(default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.PROTECT,
+        related_name="invoice_drafts",
+    )
+    stripe_customer_id = models.CharField(max_length=255)
+    due_date = models.DateField()
+    customer_notes = models.TextField(blank=True, default="")
+    # [{"description": str, "quantity": int, "unit_amount": cents}, ...]
+    lines = models.JSONField(default=list)
+
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    stripe_invoice_id = models.CharField(max_length=255, null=True, blank=True)
+    # Line index (as a string) -> Stripe invoice item id, filled in as items are created.
+    stripe_item_ids = models.JSONField(default=dict, blank=True)
+    invoice = models.OneToOneField(
+        Invoice,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="draft",
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "invoice_drafts"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"Invoice draft #{self.id} - User {self.user_id} - {self.status}"
+
+    def idempotency_key(self, step):
+        return f"invoice-draft-{self.idempotency_token}-{step}"
+
+
+class CheckoutSession(models.Model):
+    """
+    A Stripe Checkout Session opened to pay an invoice.
+
+    Kept so repeat clicks on "pay" reuse the open session instead of creating
+    a new one each time (see finances/checkout.py).
+    """
+    class Status(models.TextChoices):
+        OPEN = "OPEN", "Open"
+        COMPLETE = "COMPLETE", "Complete"
+        EXPIRED = "EXPIRED", "Expired"
+
+    id = models.BigAutoField(primary_key=True)
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name="checkout_sessions")
+    stripe_session_id = models.CharField(max_length=255, unique=True)
+    url = models.URLField(max_length=1000)
+    # The invoice amount the session charges; a changed amount needs a new session.
+    amount = models.PositiveIntegerField(help_text="minor units (cents)")
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.OPEN)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "checkout_sessions"
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["invoice", "status", "expires_at"], name="checkout_invoice_open_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.stripe_session_id} - Invoice {self.invoice_id} - {self.status}"
+
+
+class StripeEventCursor(models.Model):
+    """
+    How far the reconcile_stripe_events job has read Stripe's event list.
+    One row per feed (named), holding the newest event already processed.
+    """
+    id = models.BigAutoField(primary_key=True)
+    name = models.CharField(max_length=50, unique=True)
+    last_event_id = models.CharField(max_length=255, blank=True, default="")
+    last_event_created = models.DateTimeField(null=True, blank=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "stripe_event_cursors"
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_event_id or '-'}"
+
+
+
+class InvoiceRollup(models.Model):
+    """
+    Precomputed invoice totals per day or month, by invoice status.
+
+    Invoices are bucketed by the day (or month) they were issued, so "PAID"
+    in a row means the invoices issued then that have since been paid. The
+    ledger keeps these rows in step as invoices are created and change status
+    (see finances/rollups.py). Reports read these rows, not the invoices.
+    """
+    class Granularity(models.TextChoices):
+        DAY = "DAY", "Day"
+        MONTH = "MONTH", "Month"
+
+    id = models.BigAutoField(primary_key=True)
+    granularity = models.CharField(max_length=5, choices=Granularity.choices)
+    # The day itself, or the first day of the month.
+    period_start = models.DateField()
+    status = models.CharField(max_length=20, choices=Invoice.Status.choices)
+    invoice_count = models.IntegerField(default=0)
+    amount = models.BigIntegerField(default=0, help_text="minor units (cents)")
+
+    class Meta:
+        db_table = "invoice_rollups"
+        ordering = ["granularity", "period_start", "status"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["granularity", "period_start", "status"],
+                name="invoice_rollup_period_status_uniq",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} {self.period_start} {self.status}: {self.amount}"
@@ -0,0 +1,278 @@
+"""
+Invoice rollups: invoiced / paid / failed / voided totals by day and month.
+
+InvoiceRollup holds one row per (granularity, period, status) with the count
+and amount (cents) of the invoices issued in that period that are currently
+in that status. The total invoiced for a period is the sum over its statuses.
+
+finances/ledger.py calls record_changes() in the same transaction as every
+invoice it creates or moves, so the rows stay current without rescanning
+invoices. rebuild_rollups() (the rebuild_invoice_rollups command, and
+InvoiceAdmin after each save or delete) recomputes them from the invoices
+after edits that bypass the ledger.
+
+The reports below read a few hundred rollup rows at most: one per day for
+the aging window plus one per month for the revenue series.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Invoice, InvoiceRollup
+
+DAY = InvoiceRollup.Granularity.DAY
+MONTH = InvoiceRollup.Granularity.MONTH
+
+# Label, lowest age in days, highest age in days (None: no upper bound).
+AGING_BUCKETS = (
+    ("0-30", 0, 30),
+    ("31-60", 31, 60),
+    ("61-90", 61, 90),
+    ("90+", 91, None),
+)
+
+_STATUS_FIELDS = {
+    Invoice.Status.PENDING: "pending",
+    Invoice.Status.PAID: "paid",
+    Invoice.Status.PAYMENT_FAILED: "failed",
+    Invoice.Status.VOIDED: "voided",
+}
+
+
+def invoice_day(created_at):
+    return timezone.localdate(created_at)
+
+
+def _month(day):
+    return day.replace(day=1)
+
+
+def _bump(granularity, period_start, status, count, amount):
+    rows = InvoiceRollup.objects.filter(granularity=granularity, period_start=period_start, status=status)
+    if rows.update(invoice_count=F("invoice_count") + count, amount=F("amount") + amount):
+        return
+    try:
+        with transaction.atomic():
+            InvoiceRollup.objects.create(
+                granularity=granularity,
+                period_start=period_start,
+                status=status,
+                invoice_count=count,
+                amount=amount,
+            )
+    except IntegrityError:
+        # Another transaction created the row first.
+        rows.update(invoice_count=F("invoice_count") + count, amount=F("amount") + amount)
+
+
+def record_changes(changes):
+    """
+    Apply invoice changes to the rollups.
+
+    `changes` is an iterable of (created_at, amount, old_status, new_status);
+    old_status is None for a new invoice. Changes landing in the same rollup
+    row are combined, so a bulk status update costs one UPDATE per row touched.
+    """
+    deltas = defaultdict(lambda: [0, 0])
+    for created_at, amount, old_status, new_status in changes:
+        day = invoice_day(created_at)
+        for granularity, period_start in ((DAY, day), (MONTH, _month(day))):
+            if old_status is not None:
+                delta = deltas[(granularity, period_start, old_status)]
+                delta[0] -= 1
+                delta[1] -= amount
+            delta = deltas[(granularity, period_start, new_status)]
+            delta[0] += 1
+            delta[1] += amount
+
+    for (granularity, period_start, status), (count, amount) in sorted(deltas.items()):
+        if count or amount:
+            _bump(granularity, period_start, status, count, amount)
+
+
+def rebuild_rollups(start=None, end=None):
+    """
+    Recompute the rollups from the invoices, for every day or for the days
+    from `start` to `end` (inclusive) and the months containing them.
+    Returns the number of rows in the rebuilt range.
+
+    The range's rollup rows are locked before the invoices are counted. A
+    ledger change that bumped one of them first has committed by then, so
+    the count includes it. One that comes later waits for the lock, and its
+    delta lands on the rebuilt row instead of being overwritten. Rows are
+    corrected in place for the same reason.
+    """
+    invoices = Invoice.objects.annotate(day=TruncDate("created_at"))
+    existing = InvoiceRollup.objects.all()
+    if start or end:
+        # Whole months, since their rows are rebuilt too.
+        start = _month(start or end)
+        end = end or start
+        next_month = _month(end + timedelta(days=32))
+        invoices = invoices.filter(day__gte=start, day__lt=next_month)
+        existing = existing.filter(period_start__gte=start, period_start__lt=next_month)
+
+    with transaction.atomic():
+        stale = {
+            (row.granularity, row.period_start, row.status): row
+            for row in existing.select_for_update().order_by("pk")
+        }
+
+        expected = {}
+        months = defaultdict(lambda: [0, 0])
+        for day, status, count, total in (
+            invoices
+            .values("day", "status")
+            .annotate(count=Count("id"), total=Sum("amount"))
+            .values_list("day", "status", "count", "total")
+        ):
+            expected[(DAY, day, status)] = (count, total)
+            month = months[(_month(day), status)]
+            month[0] += count
+            month[1] += total
+        for (period_start, status), (count, total) in months.items():
+            expected[(MONTH, period_start, status)] = (count, total)
+
+        changed, created = [], []
+        for (granularity, period_start, status), (count, total) in expected.items():
+            row = stale.pop((granularity, period_start, status), None)
+            if row is None:
+                created.append(InvoiceRollup(
+                    granularity=granularity, period_start=period_start, status=status,
+                    invoice_count=count, amount=total,
+                ))
+            elif (row.invoice_count, row.amount) != (count, total):
+                row.invoice_count, row.amount = count, total
+                changed.append(row)
+
+        InvoiceRollup.objects.filter(pk__in=[row.pk for row in stale.values()]).delete()
+        InvoiceRollup.objects.bulk_update(changed, ["invoice_count", "amount"], batch_size=500)
+        InvoiceRollup.objects.bulk_create(created, batch_size=500)
+    return len(expected)
+
+
+def status_totals(start=None, end=None):
+    """
+    {status: (count, cents)} for invoices issued from `start` to `end`
+    (inclusive, either may be None). Unbounded totals sum the month rows.
+    """
+    if start or end:
+        rows = InvoiceRollup.objects.filter(granularity=DAY)
+        if start:
+            rows = rows.filter(period_start__gte=start)
+        if end:
+            rows = rows.filter(period_start__lte=end)
+    else:
+        rows = InvoiceRollup.objects.filter(granularity=MONTH)
+    return {
+        status: (count or 0, amount or 0)
+        for status, count, amount in (
+            rows.values("status")
+            .annotate(count=Sum("invoice_count"), total=Sum("amount"))
+            .values_list("status", "count", "total")
+        )
+    }
+
+
+def _totals(row_map):
+    totals = {"invoiced": 0, "invoiced_count": 0, "pending": 0, "paid": 0, "failed": 0, "voided": 0}
+    for status, (count, amount) in row_map.items():
+        totals["invoiced"] += amount
+        totals["invoiced_count"] += count
+        totals[_STATUS_FIELDS[status]] += amount
+    return totals
+
+
+def period_totals(granularity, start, end):
+    """
+    [{"period": date, "invoiced": cents, "pending": ..., "paid": ..., "failed": ...,
+    "voided": ..., "invoiced_count": n}, ...] for each period from start to end
+    that has invoices, oldest first.
+    """
+    by_period = defaultdict(dict)
+    for period_start, status, count, amount in (
+        InvoiceRollup.objects
+        .filter(granularity=granularity, period_start__gte=start, period_start__lte=end)
+        .values_list("period_start", "status", "invoice_count", "amount")
+    ):
+        by_period[period_start][status] = (count, amount)
+    return [
+        {"period": period_start, **_totals(by_period[period_start])}
+        for period_start in sorted(by_period)
+    ]
+
+
+def monthly_totals(months=12, today=None):
+    """period_totals() for the last `months` months, including this one."""
+    today = today or timezone.localdate()
+    start = _month(today)
+    for _ in range(months - 1):
+        start = _month(start - timedelta(days=1))
+    return period_totals(MONTH, start, today)
+
+
+def aging_report(today=None):
+    """
+    Outstanding (pending or failed) amounts by age since the invoice was issued.
+
+    Reads the day rollups for the last 90 days plus one month-level SUM for
+    everything older. Returns [{"label": "0-30", "amount": cents, "count": n}, ...].
+    """
+    from .ledger import OUTSTANDING_STATUSES  # ledger imports this module
+
+    today = today or timezone.localdate()
+    buckets = [{"label": label, "amount": 0, "count": 0} for label, _, _ in AGING_BUCKETS]
+    oldest_day = today - timedelta(days=AGING_BUCKETS[-1][1] - 1)
+
+    for period_start, count, amount in (
+        InvoiceRollup.objects
+        .filter(granularity=DAY, status__in=OUTSTANDING_STATUSES, period_start__gte=oldest_day)
+        .values_list("period_start", "invoice_count", "amount")
+    ):
+        age = max((today - period_start).days, 0)
+        for bucket, (_, low, high) in zip(buckets, AGING_BUCKETS):
+            if age >= low and (high is None or age <= high):
+                bucket["count"] += count
+                bucket["amount"] += amount
+                break
+
+    # 90+ days: whole months before the window come from month rows, and
+    # the partial month at the window's edge from its day rows.
+    older = (
+        InvoiceRollup.objects
+        .filter(granularity=MONTH, status__in=OUTSTANDING_STATUSES, period_start__lt=_month(oldest_day))
+        .aggregate(count=Sum("invoice_count"), amount=Sum("amount"))
+    )
+    edge = (
+        InvoiceRollup.objects
+        .filter(
+            granularity=DAY,
+            status__in=OUTSTANDING_STATUSES,
+            period_start__gte=_month(oldest_day),
+            period_start__lt=oldest_day,
+        )
+        .aggregate(count=Sum("invoice_count"), amount=Sum("amount"))
+    )
+    for extra in (older, edge):
+        buckets[-1]["count"] += extra["count"] or 0
+        buckets[-1]["amount"] += extra["amount"] or 0
+    return buckets
+
+
+def receivables_summary(today=None):
+    """Numbers for the admin dashboard cards (amounts in cents)."""
+    from .ledger import OUTSTANDING_STATUSES  # ledger imports this module
+
+    today = today or timezone.localdate()
+    aging = aging_report(today)
+    totals = status_totals()
+    return {
+        "month": {"period": _month(today), **_totals(status_totals(_month(today), today))},
+        "aging": aging,
+        "outstanding": sum(bucket["amount"] for bucket in aging),
+        "outstanding_count": sum(totals.get(status, (0, 0))[0] for status in OUTSTANDING_STATUSES),
+    }
@@ -0,0 +1,164 @@
+"""
+Read-through cache for Stripe invoice lookups on the admin screens.
+
+    stripe:invoice:<invoice id>                          one invoice, summarized
+    stripe:customer-invoices:<customer>:<ver>:<cursor>   one page of a list
+
+Entries expire after STRIPE_CACHE_TTL seconds (default 300) and are dropped
+early by the Stripe webhook: any invoice.* event clears that invoice and
+bumps its customer's list version, so every cached page for that customer
+goes stale at once.
+
+Identical lookups that miss at the same time make one Stripe call. Threads in
+one process wait on the first caller's result. Other processes wait briefly on
+a cache.add() lock and then read what the leader stored.
+"""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+import stripe
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+LIST_PAGE_SIZE = 100
+_LOCK_TIMEOUT = 30
+_LOCK_POLL = 0.05
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def cache_ttl() -> int:
+    return int(getattr(settings, "STRIPE_CACHE_TTL", 300))
+
+
+def _lock_wait() -> float:
+    return float(getattr(settings, "STRIPE_CACHE_LOCK_WAIT", 2.0))
+
+
+def summarize_invoice(inv):
+    """The fields the admin endpoints expose (amounts in cents, created as a UNIX timestamp)."""
+    return {
+        "id": inv.get("id"),
+        "status": inv.get("status"),
+        "amount_due": inv.get("amount_due"),
+        "amount_paid": inv.get("amount_paid"),
+        "currency": inv.get("currency"),
+        "hosted_invoice_url": inv.get("hosted_invoice_url"),
+        "invoice_pdf": inv.get("invoice_pdf"),
+        "created": inv.get("created"),
+        "customer": inv.get("customer"),
+    }
+
+
+def _invoice_key(stripe_invoice_id):
+    return f"stripe:invoice:{stripe_invoice_id}"
+
+
+def _list_version_key(customer_id):
+    return f"stripe:customer-invoices:{customer_id}:ver"
+
+
+def _list_version(customer_id):
+    key = _list_version_key(customer_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        # add() so two first readers agree on one token.
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key) or version
+    return version
+
+
+def _single_flight(key, fetch):
+    """Return cache[key], calling fetch() at most once across concurrent misses."""
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+    if not leader:
+        return future.result()
+
+    try:
+        value = _fetch_with_cache_lock(key, fetch)
+        future.set_result(value)
+        return value
+    except BaseException as exc:
+        future.set_exception(exc)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def _fetch_with_cache_lock(key, fetch):
+    lock_key = f"{key}:lock"
+    if not cache.add(lock_key, 1, timeout=_LOCK_TIMEOUT):
+        # Another process is fetching this key; give it a moment.
+        deadline = time.monotonic() + _lock_wait()
+        while time.monotonic() < deadline:
+            time.sleep(_LOCK_POLL)
+            value = cache.get(key)
+            if value is not None:
+                return value
+        return fetch()
+
+    try:
+        value = fetch()
+        cache.set(key, value, timeout=cache_ttl())
+        return value
+    finally:
+        cache.delete(lock_key)
+
+
+def get_invoice(stripe_invoice_id):
+    """Summarized Stripe invoice, from cache or a single Stripe call."""
+    return _single_flight(
+        _invoice_key(stripe_invoice_id),
+        lambda: summarize_invoice(stripe.Invoice.retrieve(stripe_invoice_id)),
+    )
+
+
+def get_invoice_page(customer_id, starting_after=None):
+    """One page ({"data": [...], "has_more": bool}) of a customer's invoices, newest first."""
+    key = f"stripe:customer-invoices:{customer_id}:{_list_version(customer_id)}:{starting_after or '-'}"
+
+    def fetch():
+        params = {"customer": customer_id, "limit": LIST_PAGE_SIZE}
+        if starting_after:
+            params["starting_after"] = starting_after
+        page = stripe.Invoice.list(**params)
+        data = [summarize_invoice(inv) for inv in page.get("data", [])]
+        # Warm the per-invoice entries too.
+        cache.set_many({_invoice_key(inv["id"]): inv for inv in data}, timeout=cache_ttl())
+        return {"data": data, "has_more": bool(page.get("has_more"))}
+
+    return _single_flight(key, fetch)
+
+
+def iter_customer_invoices(customer_id, first_page=None):
+    """Every invoice for a customer, following Stripe's cursor one page at a time."""
+    page = first_page or get_invoice_page(customer_id)
+    while True:
+        yield from page["data"]
+        if not page["has_more"] or not page["data"]:
+            return
+        page = get_invoice_page(customer_id, starting_after=page["data"][-1]["id"])
+
+
+def invalidate_invoice(stripe_invoice_id=None, customer_id=None):
+    """Drop a cached invoice and every cached list page for its customer."""
+    if stripe_invoice_id:
+        cache.delete(_invoice_key(stripe_invoice_id))
+    if customer_id:
+        cache.set(_list_version_key(customer_id), uuid.uuid4().hex, timeout=None)
@@ -1,3 +1,1505 @@
-from django.test import TestCase
+import gzip
+import json
+import itertools
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import stripe
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from appointments.models import Appointments, Notification
+from core.models import OutboundEmail
+from core.outbox import deliver_queued_email
+from users.models import AdminProfile, User
+
+from . import stripe_cache
+from .archive import archive_old_events, load_archived_payload, partition_path, search_archive
+from .billing import create_billing_drafts, default_through, parse_hourly_rate, preview_billing, run_billing
+from .bulk import bulk_invoice_action
+from .customers import get_or_create_stripe_customer_id, provision_stripe_customers
+from .dunning import due_for_reminder, send_invoice_reminders
+from .events import reconcile_stripe_events
+from .invoicing import InvoicePipelineError, run_invoice_draft
+from .ledger import create_invoice_record, reconcile_balances, set_invoice_status, set_invoice_statuses
+from .models import CheckoutSession, Invoice, InvoiceDraft, InvoiceRollup, StripeEventCursor, StripeWebhookEvent
+from .rollups import aging_report, monthly_totals, rebuild_rollups
+
+
+class StripeEventArchiveTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        settings_override = override_settings(
+            STRIPE_EVENT_ARCHIVE_DIR=self.tmp.name, STRIPE_EVENT_RETENTION_DAYS=30
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.now = timezone.now()
+
+    def _event(self, event_id, days_old, event_type="invoice.paid", invoice_id="in_123"):
+        event = StripeWebhookEvent.objects.create(
+            event_id=event_id,
+            event_type=event_type,
+            payload={"id": event_id, "type": event_type, "data": {"object": {"id": invoice_id}}},
+        )
+        # received_at is auto_now_add; backdate it directly.
+        StripeWebhookEvent.objects.filter(pk=event.pk).update(received_at=self.now - timedelta(days=days_old))
+        event.refresh_from_db()
+        return event
+
+    def test_archives_only_events_past_retention(self):
+        old = self._event("evt_old", days_old=45)
+        recent = self._event("evt_recent", days_old=2)
+
+        self.assertEqual(archive_old_events(now=self.now), 1)
+
+        old.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertIsNone(old.payload)
+        self.assertIsNotNone(old.archived_at)
+        self.assertIsNotNone(recent.payload)
+        self.assertIsNone(recent.archived_at)
+
+        path = partition_path(timezone.localtime(old.received_at).date())
+        with gzip.open(path, "rt", encoding="utf-8") as fh:
+            records = [json.loads(line) for line in fh]
+        self.assertEqual([r["event_id"] for r in records], ["evt_old"])
+        self.assertEqual(records[0]["payload"]["data"]["object"]["id"], "in_123")
+
+    def test_rerun_is_a_noop_and_rows_still_deduplicate(self):
+        self._event("evt_old", days_old=45)
+        archive_old_events(now=self.now)
+        self.assertEqual(archive_old_events(now=self.now), 0)
+        self.assertEqual(StripeWebhookEvent.objects.filter(event_id="evt_old").count(), 1)
+
+    def test_dry_run_changes_nothing(self):
+        event = self._event("evt_old", days_old=45)
+        self.assertEqual(archive_old_events(now=self.now, dry_run=True), 1)
+        event.refresh_from_db()
+        self.assertIsNotNone(event.payload)
+        self.assertFalse(partition_path(timezone.localtime(event.received_at).date()).exists())
+
+    def test_batches_append_to_the_same_day_file(self):
+        for i in range(5):
+            self._event(f"evt_{i}", days_old=40)
+        self.assertEqual(archive_old_events(now=self.now, batch_size=2), 5)
+        self.assertEqual(len(search_archive()), 5)
+
+    def test_search_filters_and_loads_payload(self):
+        paid = self._event("evt_paid", days_old=50, invoice_id="in_AAA")
+        self._event("evt_failed", days_old=40, event_type="invoice.payment_failed", invoice_id="in_BBB")
+        archive_old_events(now=self.now)
+
+        self.assertEqual([r["event_id"] for r in search_archive(text="in_BBB")], ["evt_failed"])
+        self.assertEqual([r["event_id"] for r in search_archive(event_type="invoice.paid")], ["evt_paid"])
+        paid_day = timezone.localtime(paid.received_at).date()
+        self.assertEqual(
+            [r["event_id"] for r in search_archive(since=paid_day + timedelta(days=1))], ["evt_failed"]
+        )
+
+        paid.refresh_from_db()
+        self.assertEqual(load_archived_payload(paid)["data"]["object"]["id"], "in_AAA")
+
+    def test_commands(self):
+        self._event("evt_old", days_old=45)
+        out = StringIO()
+        call_command("archive_stripe_events", stdout=out)
+        self.assertIn("Archived 1", out.getvalue())
+
+        out = StringIO()
+        call_command("search_stripe_events", "--event-id", "evt_old", stdout=out)
+        self.assertEqual(json.loads(out.getvalue())["event_id"], "evt_old")
+
+    def test_admin_archive_search(self):
+        admin_user = User.objects.create_superuser(
+            email="admin@example.com", password="pw"
+        )
+        event = self._event("evt_old", days_old=45)
+        archive_old_events(now=self.now)
+        self.client.force_login(admin_user)
+
+        response = self.client.get(reverse("admin:finances_stripewebhookevent_archive"), {"q": "in_123"})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "evt_old")
+
+        response = self.client.get(reverse("admin:finances_stripewebhookevent_change", args=[event.pk]))
+        self.assertContains(response, "in_123")
+
+
+class FakeStripe:
+    """
+    Local stand-in for the Stripe invoice endpoints the pipeline uses.
+
+    Honors idempotency keys like Stripe does (same key -> same object, no new
+    side effect), tracks how many item requests are in flight at once, and can
+    be told to fail or to "lose" a response after the write went through.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.invoices = {}
+        self.items = {}
+        self.responses = {}
+        self.calls = []
+        self.fail_keys = set()
+        # Item descriptions / customer emails whose next create call fails.
+        self.fail_once = set()
+        self.lose_response_keys = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _request(self, name, key, create):
+        with self._lock:
+            self.calls.append(name)
+            if key in self.fail_keys:
+                self.fail_keys.discard(key)
+                raise stripe.error.APIConnectionError("Simulated network failure")
+            if key in self.responses:
+                return self.responses[key]
+            result = self.responses[key] = create()
+            if key in self.lose_response_keys:
+                # The write happened but the client never saw the response.
+                self.lose_response_keys.discard(key)
+                raise stripe.error.APIConnectionError("Simulated timeout")
+            return result
+
+    def invoice_create(self, idempotency_key, **params):
+        def create():
+            invoice = SimpleNamespace(
+                id=f"in_{next(self._ids)}", status="draft", params=params,
+                amount_due=0, hosted_invoice_url=None,
+            )
+            self.invoices[invoice.id] = invoice
+            return invoice
+        return self._request("invoice.create", idempotency_key, create)
+
+    def item_create(self, idempotency_key, **params):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+            if params["description"] in self.fail_once:
+                self.fail_once.discard(params["description"])
+                raise stripe.error.APIConnectionError("Simulated network failure")
+
+            def create():
+                item = SimpleNamespace(id=f"ii_{next(self._ids)}", params=params)
+                self.items[item.id] = item
+                return item
+            return self._request("item.create", idempotency_key, create)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def invoice_finalize(self, invoice_id, idempotency_key):
+        def finalize():
+            invoice = self.invoices[invoice_id]
+            invoice.status = "open"
+            invoice.amount_due = sum(
+                i.params["quantity"] * i.params["unit_amount_decimal"]
+                for i in self.items.values() if i.params["invoice"] == invoice_id
+            )
+            invoice.hosted_invoice_url = f"https://invoice.stripe.test/{invoice_id}"
+            return invoice
+        return self._request("invoice.finalize", idempotency_key, finalize)
+
+    def customer_create(self, idempotency_key, **params):
+        time.sleep(self.latency)
+        if params["email"] in self.fail_once:
+            self.fail_once.discard(params["email"])
+            raise stripe.error.APIConnectionError("Simulated network failure")
+        return self._request(
+            "customer.create", idempotency_key,
+            lambda: SimpleNamespace(id=f"cus_{next(self._ids)}", params=params),
+        )
+
+    def invoice_retrieve(self, invoice_id):
+        self.calls.append("invoice.retrieve")
+        return self.invoices[invoice_id]
+
+    def _invoice_action(self, name, invoice_id, idempotency_key, status):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+
+            def apply():
+                invoice = self.invoices.setdefault(invoice_id, SimpleNamespace(id=invoice_id, status="open"))
+                invoice.status = status
+                return invoice
+            return self._request(name, idempotency_key, apply)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def invoice_void(self, invoice_id, idempotency_key):
+        return self._invoice_action("invoice.void", invoice_id, idempotency_key, "void")
+
+    def invoice_send(self, invoice_id, idempotency_key):
+        return self._invoice_action("invoice.send", invoice_id, idempotency_key, "open")
+
+    def patch(self):
+        invoice = SimpleNamespace(
+            create=self.invoice_create,
+            finalize_invoice=self.invoice_finalize,
+            retrieve=self.invoice_retrieve,
+            void_invoice=self.invoice_void,
+            send_invoice=self.invoice_send,
+        )
+        item = SimpleNamespace(create=self.item_create)
+        customer = SimpleNamespace(create=self.customer_create)
+        return mock.patch.multiple(stripe, Invoice=invoice, InvoiceItem=item, Customer=customer)
+
+
+@override_settings(STRIPE_MAX_CONCURRENCY=4)
+class InvoicePipelineTests(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user(
+            email="client@example.com",
+            password="pw",
+            first_name="Client",
+            last_name="User",
+            provider_customer_id="cus_123",
+        )
+        self.stripe = FakeStripe()
+        patcher = self.stripe.patch()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _draft(self, lines=4):
+        return InvoiceDraft.objects.create(
+            user=self.client_user,
+            stripe_customer_id="cus_123",
+            due_date=date(2030, 1, 31),
+            lines=[{"description": f"Line {i}", "quantity": 2, "unit_amount": 1000 + i} for i in range(lines)],
+        )
+
+    def test_creates_items_concurrently_and_records_invoice(self):
+        self.stripe.latency = 0.05
+        draft = self._draft(lines=4)
+
+        invoice = run_invoice_draft(draft)
+
+        self.assertGreater(self.stripe.max_in_flight, 1)
+        self.assertEqual(len(self.stripe.items), 4)
+        self.assertEqual(invoice.amount, 2 * (1000 + 1001 + 1002 + 1003))
+        self.assertEqual(invoice.user, self.client_user)
+        self.assertEqual(invoice.status, Invoice.Status.PENDING)
+        self.client_user.refresh_from_db()
+        self.assertEqual(self.client_user.balance_due, invoice.amount)
+        draft.refresh_from_db()
+        self.assertEqual(draft.status, InvoiceDraft.Status.COMPLETED)
+        self.assertEqual(draft.invoice, invoice)
+        stripe_invoice = self.stripe.invoices[invoice.stripe_invoice_id]
+        self.assertEqual(stripe_invoice.params["pending_invoice_items_behavior"], "exclude")
+
+    def test_idempotency_keys_are_not_derived_from_the_id(self):
+        draft = self._draft(lines=1)
+        draft.refresh_from_db()
+        other = self._draft(lines=1)
+        self.assertEqual(draft.idempotency_key("invoice"), f"invoice-draft-{draft.idempotency_token}-invoice")
+        self.assertNotEqual(draft.idempotency_key("invoice"), other.idempotency_key("invoice"))
+
+    def test_failed_item_resumes_without_duplicates(self):
+        draft = self._draft(lines=3)
+        self.stripe.fail_keys.add(draft.idempotency_key("item-1"))
+
+        with self.assertRaises(InvoicePipelineError):
+            run_invoice_draft(draft)
+
+        draft.refresh_from_db()
+        self.assertEqual(draft.status, InvoiceDraft.Status.INVOICE_CREATED)
+        self.assertEqual(set(draft.stripe_item_ids), {"0", "2"})
+        self.assertIn("line 2", draft.last_error)
+        self.assertFalse(Invoice.objects.exists())
+
+        invoice = run_invoice_draft(draft)
+
+        self.assertEqual(len(self.stripe.invoices), 1)
+        self.assertEqual(len(self.stripe.items), 3)
+        self.assertEqual(self.stripe.calls.count("invoice.create"), 1)
+        self.assertEqual(invoice.amount, 2 * (1000 + 1001 + 1002))
+        draft.refresh_from_db()
+        self.assertEqual(draft.attempts, 2)
+        self.assertEqual(draft.last_error, "")
+
+    def test_lost_response_is_not_billed_twice(self):
+        draft = self._draft(lines=2)
+        self.stripe.lose_response_keys.update({
+            draft.idempotency_key("invoice"),
+            draft.idempotency_key("item-0"),
+            draft.idempotency_key("finalize"),
+        })
+
+        for _ in range(3):
+            with self.assertRaises(InvoicePipelineError):
+                run_invoice_draft(draft)
+        invoice = run_invoice_draft(draft)
+
+        self.assertEqual(len(self.stripe.invoices), 1)
+        self.assertEqual(len(self.stripe.items), 2)
+        self.assertEqual(invoice.amount, 2 * (1000 + 1001))
+        self.assertEqual(Invoice.objects.count(), 1)
+
+    def test_completed_draft_is_not_rerun(self):
+        draft = self._draft(lines=1)
+        invoice = run_invoice_draft(draft)
+        calls = len(self.stripe.calls)
+
+        self.assertEqual(run_invoice_draft(draft), invoice)
+        self.assertEqual(len(self.stripe.calls), calls)
+
+    def test_create_invoice_view_resumes_same_form_submission(self):
+        admin_user = User.objects.create_user(email="admin@example.com", password="pw", is_staff=True)
+        self.client.force_login(admin_user)
+        form = {
+            "email": "client@example.com",
+            "due_date": "2030-01-31",
+            "draft_key": "form-token-1",
+            "description[]": ["Consultation", "Filing fee"],
+            "quantity[]": ["1", "2"],
+            "unit_price[]": ["150", "19.99"],
+        }
+        self.stripe.fail_once.add("Filing fee")
+        first = self.client.post(reverse("admin_create_invoices"), form).json()
+        second = self.client.post(reverse("admin_create_invoices"), form).json()
+
+        self.assertFalse(first["success"])
+        self.assertIn("resume", first["error"])
+        self.assertTrue(second["success"])
+        self.assertEqual(InvoiceDraft.objects.count(), 1)
+        self.assertEqual(len(self.stripe.items), 2)
+        self.assertEqual(Invoice.objects.get().amount, 15000 + 2 * 1999)
+
+    def test_create_invoice_view_rejects_bad_lines_before_calling_stripe(self):
+        admin_user = User.objects.create_user(email="admin@example.com", password="pw", is_staff=True)
+        self.client.force_login(admin_user)
+        response = self.client.post(reverse("admin_create_invoices"), {
+            "email": "client@example.com",
+            "due_date": "2030-01-31",
+            "description[]": ["Consultation"],
+            "quantity[]": ["one"],
+            "unit_price[]": ["150"],
+        }).json()
+
+        self.assertFalse(response["success"])
+        self.assertEqual(self.stripe.calls, [])
+        self.assertFalse(InvoiceDraft.objects.exists())
+
+
+class StripeCustomerProvisioningTests(TestCase):
+    def setUp(self):
+        self.stripe = FakeStripe()
+        patcher = self.stripe.patch()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _client(self, email, **extra):
+        extra.setdefault("is_active", True)
+        return User.objects.create_user(email=email, password="pw", first_name="C", last_name="L", **extra)
+
+    def test_creates_customer_once_with_idempotency_key(self):
+        user = self._client("client@example.com")
+
+        first = get_or_create_stripe_customer_id(user)
+        second = get_or_create_stripe_customer_id(User.objects.get(pk=user.pk))
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.stripe.calls, ["customer.create"])
+        self.assertIn(f"stripe-customer-{user.stripe_idempotency_token}", self.stripe.responses)
+        self.assertNotEqual(
+            user.stripe_idempotency_token, self._client("other@example.com").stripe_idempotency_token
+        )
+        user.refresh_from_db()
+        self.assertEqual(user.provider_customer_id, first)
+
+    def test_stale_instance_uses_stored_customer(self):
+        user = self._client("client@example.com")
+        User.objects.filter(pk=user.pk).update(provider_customer_id="cus_existing")
+
+        self.assertEqual(get_or_create_stripe_customer_id(user), "cus_existing")
+        self.assertEqual(self.stripe.calls, [])
+
+    def test_bulk_provisioning_skips_staff_and_existing_and_resumes(self):
+        clients = [self._client(f"client{i}@example.com") for i in range(5)]
+        self._client("has-id@example.com", provider_customer_id="cus_existing")
+        self._client("staff@example.com", is_staff=True)
+        self._client("inactive@example.com", is_active=False)
+        self.stripe.latency = 0.02
+        self.stripe.fail_once.add("client3@example.com")
+
+        totals = provision_stripe_customers(batch_size=2, max_workers=4)
+
+        self.assertEqual(totals, {"created": 4, "failed": 1})
+        self.assertEqual(
+            User.objects.filter(pk__in=[c.pk for c in clients], provider_customer_id__startswith="cus_").count(), 4
+        )
+        self.assertEqual(User.objects.get(email="has-id@example.com").provider_customer_id, "cus_existing")
+        self.assertIsNone(User.objects.get(email="staff@example.com").provider_customer_id)
+
+        out = StringIO()
+        call_command("provision_stripe_customers", stdout=out)
+        self.assertIn("Created 1", out.getvalue())
+        self.assertEqual(self.stripe.calls.count("customer.create"), 5)
+
+
+class AdminTransactionsTests(TestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_user(email="admin@example.com", password="pw", is_staff=True, is_active=True)
+        self.alice = User.objects.create_user(email="alice@example.com", password="pw", first_name="Alice", last_name="Smith")
+        self.bob = User.objects.create_user(email="bob@example.com", password="pw", first_name="Bob", last_name="Jones")
+        self.client.force_login(self.admin_user)
+        self.now = timezone.now()
+
+    def _invoices(self, count, user, status=Invoice.Status.PENDING, amount=1050, days_ago=0):
+        created = []
+        for _ in range(count):
+            invoice = Invoice.objects.create(user=user, amount=amount, status=status)
+            Invoice.objects.filter(pk=invoice.pk).update(created_at=self.now - timedelta(days=days_ago))
+            created.append(invoice.pk)
+        # Rows written behind the ledger's back.
+        rebuild_rollups()
+        return created
+
+    def _ids(self, response):
+        return [inv.id for inv in response.context["invoices"]]
+
+    def test_keyset_pages_walk_forward_and_back_without_overlap(self):
+        ids = self._invoices(30, self.alice)
+        url = reverse("admin_transactions")
+
+        first = self.client.get(url)
+        self.assertEqual(len(self._ids(first)), 25)
+        self.assertFalse(first.context["page"].has_previous)
+        self.assertTrue(first.context["page"].has_next)
+
+        second = self.client.get(url, {"after": first.context["page"].next_cursor})
+        self.assertEqual(len(self._ids(second)), 5)
+        self.assertFalse(second.context["page"].has_next)
+        self.assertEqual(sorted(self._ids(first) + self._ids(second)), sorted(ids))
+
+        back = self.client.get(url, {"before": second.context["page"].previous_cursor})
+        self.assertEqual(self._ids(back), self._ids(first))
+        self.assertFalse(back.context["page"].has_previous)
+
+    def test_filters_and_dollar_conversion_happen_in_sql(self):
+        self._invoices(2, self.alice, status=Invoice.Status.PAID, amount=1999)
+        self._invoices(3, self.bob, status=Invoice.Status.PENDING, days_ago=40)
+
+        response = self.client.get(reverse("admin_transactions"), {"status": "PAID", "client": "alice"})
+        invoices = list(response.context["invoices"])
+        self.assertEqual(len(invoices), 2)
+        self.assertEqual(invoices[0].amount_dollars, Decimal("19.99"))
+        self.assertEqual(invoices[0].display_status, "PAID")
+
+        date_from = (self.now - timedelta(days=10)).date().isoformat()
+        response = self.client.get(reverse("admin_transactions"), {"date_from": date_from})
+        self.assertEqual(len(self._ids(response)), 2)
+
+        response = self.client.get(reverse("admin_transactions"), {"date_from": "not-a-date"})
+        self.assertEqual(len(self._ids(response)), 5)
+
+    def test_date_range_covers_whole_local_days(self):
+        day = timezone.localdate(self.now) - timedelta(days=5)
+        day_start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+        inside = self._invoices(2, self.alice)
+        outside = self._invoices(2, self.bob)
+        for pk, created_at in zip(inside + outside, (
+            day_start, day_start + timedelta(days=1, microseconds=-1),
+            day_start - timedelta(microseconds=1), day_start + timedelta(days=1),
+        )):
+            Invoice.objects.filter(pk=pk).update(created_at=created_at)
+
+        response = self.client.get(
+            reverse("admin_transactions"), {"date_from": day.isoformat(), "date_to": day.isoformat()}
+        )
+        self.assertEqual(sorted(self._ids(response)), sorted(inside))
+
+    def test_summary_totals_per_status(self):
+        self._invoices(2, self.alice, status=Invoice.Status.PAID, amount=1000)
+        self._invoices(1, self.bob, status=Invoice.Status.PENDING, amount=250)
+
+        response = self.client.get(reverse("admin_transactions"), {"status": "PAID"})
+        summary = {row["status"]: row for row in response.context["summary"]}
+        self.assertEqual(summary["PAID"]["count"], 2)
+        self.assertEqual(summary["PAID"]["total_dollars"], 20)
+        self.assertEqual(summary["PENDING"]["count"], 1)
+        self.assertEqual(summary["VOIDED"]["total_dollars"], 0)
+
+    def test_query_count_does_not_grow_with_invoices(self):
+        self._invoices(5, self.alice)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse("admin_transactions"))
+        self._invoices(60, self.bob)
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(reverse("admin_transactions"))
+        self.assertEqual(len(small), len(large))
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET="whsec_test")
+class BalanceLedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="client@example.com", password="pw", is_active=True)
+
+    def _balance(self):
+        return User.objects.values_list("balance_due", flat=True).get(pk=self.user.pk)
+
+    def _webhook(self, event_id, event_type, invoice):
+        payload = json.dumps({
+            "id": event_id,
+            "type": event_type,
+            "data": {"object": {"id": invoice.stripe_invoice_id, "metadata": {}}},
+        })
+        with mock.patch("stripe.Webhook.construct_event"):
+            return self.client.post(
+                reverse("stripe_webhook"), payload, content_type="application/json",
+                HTTP_STRIPE_SIGNATURE="t=1,v1=sig",
+            )
+
+    def test_status_changes_move_the_balance(self):
+        invoice = create_invoice_record(user=self.user, amount=5000, stripe_invoice_id="in_1")
+        create_invoice_record(user=self.user, amount=700, stripe_invoice_id="in_2")
+        self.assertEqual(self._balance(), 5700)
+
+        set_invoice_status(invoice, Invoice.Status.PAYMENT_FAILED)
+        self.assertEqual(self._balance(), 5700)
+        set_invoice_status(invoice, Invoice.Status.PAID)
+        self.assertEqual(self._balance(), 700)
+        invoice.refresh_from_db()
+        self.assertTrue(invoice.paid)
+
+        # Repeating a transition is a no-op.
+        self.assertFalse(set_invoice_status(invoice, Invoice.Status.PAID))
+        self.assertEqual(self._balance(), 700)
+
+    def test_webhook_and_void_update_the_balance(self):
+        paid = create_invoice_record(user=self.user, amount=5000, stripe_invoice_id="in_1")
+        voided = create_invoice_record(user=self.user, amount=700, stripe_invoice_id="in_2")
+
+        self._webhook("evt_1", "invoice.paid", paid)
+        self._webhook("evt_1", "invoice.paid", paid)  # duplicate delivery
+        self.assertEqual(self._balance(), 700)
+
+        admin_user = User.objects.create_user(email="admin@example.com", password="pw", is_staff=True, is_active=True)
+        self.client.force_login(admin_user)
+        with mock.patch("stripe.Invoice.void_invoice"):
+            response = self.client.post(reverse("void_invoice", args=[voided.stripe_invoice_id]))
+        self.assertEqual(response.json(), {"status": "voided"})
+        self.assertEqual(self._balance(), 0)
+
+    def test_dashboard_reads_the_stored_balance(self):
+        create_invoice_record(user=self.user, amount=12345)
+        self.client.force_login(self.user)
+        with mock.patch("users.views.get_latest_website_content", return_value=None):
+            response = self.client.get(reverse("client_dashboard"))
+        self.assertEqual(response.context["balance_dollars"], Decimal("123.45"))
+
+    def test_reconcile_reports_and_repairs_drift(self):
+        create_invoice_record(user=self.user, amount=5000)
+        other = User.objects.create_user(email="other@example.com", password="pw")
+        # Rows written behind the ledger's back.
+        Invoice.objects.create(user=other, amount=300)
+        User.objects.filter(pk=self.user.pk).update(balance_due=1)
+
+        self.assertEqual(
+            reconcile_balances(),
+            [(self.user.pk, 1, 5000), (other.pk, 0, 300)],
+        )
+        out = StringIO()
+        call_command("reconcile_balances", "--fix", stdout=out)
+        self.assertIn("Repaired 2", out.getvalue())
+        self.assertEqual(self._balance(), 5000)
+        self.assertEqual(reconcile_balances(), [])
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET="whsec_test")
+class StripeCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.admin_user = User.objects.create_user(email="admin@example.com", password="pw", is_staff=True, is_active=True)
+        self.client_user = User.objects.create_user(email="client@example.com", password="pw", provider_customer_id="cus_1")
+        self.client.force_login(self.admin_user)
+        self.invoices = [
+            {"id": f"in_{i:03d}", "status": "open", "amount_due": 100 * i, "customer": "cus_1"}
+            for i in range(250)
+        ]
+        self.calls = []
+        self.latency = 0
+        self.list_error = None
+        patcher = mock.patch.multiple(
+            stripe, Invoice=SimpleNamespace(retrieve=self._retrieve, list=self._list)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _retrieve(self, invoice_id):
+        self.calls.append(("retrieve", invoice_id))
+        time.sleep(self.latency)
+        return next(inv for inv in self.invoices if inv["id"] == invoice_id)
+
+    def _list(self, customer, limit, starting_after=None):
+        self.calls.append(("list", starting_after))
+        if self.list_error:
+            raise self.list_error
+        start = 0
+        if starting_after:
+            start = next(i for i, inv in enumerate(self.invoices) if inv["id"] == starting_after) + 1
+        return {"data": self.invoices[start:start + limit], "has_more": start + limit < len(self.invoices)}
+
+    def _webhook(self, event_id, invoice_id):
+        payload = json.dumps({
+            "id": event_id,
+            "type": "invoice.paid",
+            "data": {"object": {"id": invoice_id, "customer": "cus_1", "metadata": {}}},
+        })
+        with mock.patch("stripe.Webhook.construct_event"):
+            self.client.post(
+                reverse("stripe_webhook"), payload, content_type="application/json",
+                HTTP_STRIPE_SIGNATURE="t=1,v1=sig",
+            )
+
+    def test_detail_is_cached_until_webhook(self):
+        url = reverse("admin_stripe_invoice_detail", args=["in_007"])
+        self.assertEqual(self.client.get(url).json()["amount_due"], 700)
+        self.client.get(url)
+        self.assertEqual(self.calls, [("retrieve", "in_007")])
+
+        self.invoices[7]["status"] = "paid"
+        self._webhook("evt_1", "in_007")
+        self.assertEqual(self.client.get(url).json()["status"], "paid")
+        self.assertEqual(len(self.calls), 2)
+
+    def test_concurrent_misses_make_one_call(self):
+        self.latency = 0.1
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(stripe_cache.get_invoice("in_001")))
+            for _ in range(5)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(results), 5)
+        self.assertEqual(self.calls, [("retrieve", "in_001")])
+
+    def test_user_list_streams_every_page_and_caches_them(self):
+        url = reverse("admin_stripe_invoices_for_user", args=[self.client_user.pk])
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        body = json.loads(b"".join(response.streaming_content))
+
+        self.assertEqual(body["count"], 250)
+        self.assertEqual([inv["id"] for inv in body["invoices"]], [inv["id"] for inv in self.invoices])
+        self.assertEqual(self.calls, [("list", None), ("list", "in_099"), ("list", "in_199")])
+
+        # Served from cache, including the per-invoice entries warmed by the list.
+        b"".join(self.client.get(url).streaming_content)
+        self.client.get(reverse("admin_stripe_invoice_detail", args=["in_150"]))
+        self.assertEqual(len(self.calls), 3)
+
+        # An invoice event for this customer invalidates every cached page.
+        self._webhook("evt_2", "in_003")
+        b"".join(self.client.get(url).streaming_content)
+        self.assertEqual(len(self.calls), 6)
+
+    def test_user_list_reports_stripe_error(self):
+        self.list_error = stripe.error.APIConnectionError("down")
+        response = self.client.get(reverse("admin_stripe_invoices_for_user", args=[self.client_user.pk]))
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(response.json()["message"], "down")
+
+
+
+class FakeEventLog:
+    """Stand-in for stripe.Event.list: newest first, with Stripe's cursor params."""
+
+    def __init__(self):
+        self.events = []  # oldest first
+        self.calls = []
+
+    def add(self, event_type, stripe_invoice_id, created=None):
+        event = {
+            "id": f"evt_{len(self.events) + 1:03d}",
+            "type": event_type,
+            "created": created or int(time.time()),
+            "data": {"object": {"id": stripe_invoice_id, "customer": "cus_1", "metadata": {}}},
+        }
+        self.events.append(event)
+        return event
+
+    def _index(self, event_id):
+        for index, event in enumerate(self.events):
+            if event["id"] == event_id:
+                return index
+        raise stripe.error.InvalidRequestError(f"No such event: {event_id}", "ending_before")
+
+    def list(self, types=None, limit=10, ending_before=None, starting_after=None, created=None):
+        self.calls.append({"ending_before": ending_before, "starting_after": starting_after})
+        events = [event for event in self.events if not types or event["type"] in types]
+        if created:
+            events = [event for event in events if event["created"] >= created["gte"]]
+        if ending_before:
+            index = self._index(ending_before)
+            newer = [event for event in events if self.events.index(event) > index]
+            page = newer[:limit]
+            return {"data": list(reversed(page)), "has_more": len(newer) > limit}
+        newest_first = list(reversed(events))
+        if starting_after:
+            index = self._index(starting_after)
+            newest_first = [event for event in newest_first if self.events.index(event) < index]
+        return {"data": newest_first[:limit], "has_more": len(newest_first) > limit}
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET="whsec_test")
+class StripeEventReconcileTests(TestCase):
+    def setUp(self):
+        self.log = FakeEventLog()
+        patcher = mock.patch.object(stripe.Event, "list", side_effect=self.log.list)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(email="client@example.com", password="pw", is_active=True)
+        self.invoices = [
+            create_invoice_record(user=self.user, amount=1000, stripe_invoice_id=f"in_{n}")
+            for n in range(3)
+        ]
+
+    def _balance(self):
+        return User.objects.values_list("balance_due", flat=True).get(pk=self.user.pk)
+
+    def _statuses(self):
+        return list(Invoice.objects.order_by("stripe_invoice_id").values_list("status", flat=True))
+
+    def test_applies_missed_events_in_bulk_and_advances_cursor(self):
+        self.log.add("invoice.paid", "in_0")
+        self.log.add("invoice.voided", "in_1")
+        self.log.add("invoice.payment_failed", "in_2")
+
+        with CaptureQueriesContext(connection) as queries:
+            result = reconcile_stripe_events(page_size=2)
+
+        self.assertEqual(result, {"fetched": 3, "new": 3, "updated": 3})
+        self.assertEqual(self._statuses(), [Invoice.Status.PAID, Invoice.Status.VOIDED, Invoice.Status.PAYMENT_FAILED])
+        self.assertEqual(self._balance(), 1000)
+        self.assertEqual(StripeWebhookEvent.objects.count(), 3)
+        self.assertEqual(StripeEventCursor.objects.get().last_event_id, "evt_003")
+        # One UPDATE per status, one for the balance and one for the cursor
+        # (plus one per rollup row touched).
+        updates = [
+            q for q in queries.captured_queries
+            if q["sql"].startswith("UPDATE") and "invoice_rollups" not in q["sql"]
+        ]
+        self.assertEqual(len(updates), 5)
+
+    def test_nothing_new_costs_one_page(self):
+        self.log.add("invoice.paid", "in_0")
+        reconcile_stripe_events()
+        self.log.calls.clear()
+
+        result = reconcile_stripe_events()
+
+        self.assertEqual(result, {"fetched": 0, "new": 0, "updated": 0})
+        self.assertEqual(self.log.calls, [{"ending_before": "evt_001", "starting_after": None}])
+
+    def test_pages_forward_from_the_cursor(self):
+        self.log.add("invoice.paid", "in_0")
+        reconcile_stripe_events()
+        for _ in range(5):
+            self.log.add("invoice.payment_failed", "in_1")
+        self.log.add("invoice.paid", "in_1")
+        self.log.calls.clear()
+
+        result = reconcile_stripe_events(page_size=2)
+
+        self.assertEqual(result["new"], 6)
+        self.assertEqual(
+            [call["ending_before"] for call in self.log.calls],
+            ["evt_001", "evt_003", "evt_005"],
+        )
+        # Applied oldest first across all three pages; the cursor ends on the newest.
+        self.assertEqual(
+            list(StripeWebhookEvent.objects.order_by("pk").values_list("event_id", flat=True)),
+            [f"evt_{n:03d}" for n in range(1, 8)],
+        )
+        self.assertEqual(StripeEventCursor.objects.get().last_event_id, "evt_007")
+        # The newest event wins.
+        self.assertEqual(self._statuses()[1], Invoice.Status.PAID)
+        self.assertEqual(self._balance(), 1000)
+
+        # Nothing new since: one call from the newest event.
+        self.log.calls.clear()
+        self.assertEqual(reconcile_stripe_events(page_size=2), {"fetched": 0, "new": 0, "updated": 0})
+        self.assertEqual(self.log.calls, [{"ending_before": "evt_007", "starting_after": None}])
+
+    def test_skips_events_the_webhook_already_handled(self):
+        event = self.log.add("invoice.paid", "in_0")
+        with mock.patch("stripe.Webhook.construct_event"):
+            self.client.post(
+                reverse("stripe_webhook"), json.dumps(event), content_type="application/json",
+                HTTP_STRIPE_SIGNATURE="t=1,v1=sig",
+            )
+        self.log.add("invoice.paid", "in_1")
+
+        result = reconcile_stripe_events()
+
+        self.assertEqual(result, {"fetched": 2, "new": 1, "updated": 1})
+        self.assertEqual(self._balance(), 1000)
+
+        # ...and the webhook then treats the reconciled event as a duplicate.
+        with mock.patch("stripe.Webhook.construct_event"):
+            response = self.client.post(
+                reverse("stripe_webhook"), json.dumps(self.log.events[1]), content_type="application/json",
+                HTTP_STRIPE_SIGNATURE="t=1,v1=sig",
+            )
+        self.assertEqual(response.json(), {"status": "duplicate"})
+
+    def test_late_failure_does_not_reopen_a_paid_invoice(self):
+        self.log.add("invoice.paid", "in_0")
+        reconcile_stripe_events()
+        self.log.add("invoice.paid", "in_1")
+        self.log.add("invoice.payment_failed", "in_1")
+        self.log.add("invoice.payment_failed", "in_0")
+
+        reconcile_stripe_events()
+
+        self.assertEqual(self._statuses()[:2], [Invoice.Status.PAID, Invoice.Status.PAID])
+        self.assertEqual(self._balance(), 1000)
+
+    def test_expired_cursor_falls_back_to_lookback_window(self):
+        old = int((timezone.now() - timedelta(days=10)).timestamp())
+        self.log.add("invoice.paid", "in_0", created=old)
+        self.log.add("invoice.paid", "in_1")
+        StripeEventCursor.objects.create(name="invoice_events", last_event_id="evt_gone")
+
+        out = StringIO()
+        call_command("reconcile_stripe_events", "--lookback-days", "3", stdout=out)
+
+        self.assertIn("Fetched 1 event(s), 1 new, 1 invoice(s) updated.", out.getvalue())
+        self.assertEqual(self._statuses()[:2], [Invoice.Status.PENDING, Invoice.Status.PAID])
+        self.assertEqual(StripeEventCursor.objects.get().last_event_id, "evt_002")
+
+
+class InvoiceRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="client@example.com", password="pw", is_active=True)
+        self.today = timezone.localdate()
+
+    def _invoice(self, amount, days_ago=0, status=Invoice.Status.PENDING):
+        created = timezone.now() - timedelta(days=days_ago)
+        with mock.patch("django.utils.timezone.now", return_value=created):
+            return create_invoice_record(user=self.user, amount=amount, status=status)
+
+    def _rows(self):
+        return sorted(
+            InvoiceRollup.objects.exclude(invoice_count=0, amount=0)
+            .values_list("granularity", "period_start", "status", "invoice_count", "amount")
+        )
+
+    def test_ledger_keeps_rollups_equal_to_a_rebuild(self):
+        paid = self._invoice(5000, days_ago=3)
+        failed = self._invoice(700, days_ago=3)
+        voided = self._invoice(300, days_ago=45)
+        self._invoice(1200)
+
+        set_invoice_status(paid, Invoice.Status.PAID)
+        set_invoice_statuses({failed.pk: Invoice.Status.PAYMENT_FAILED, voided.pk: Invoice.Status.VOIDED})
+
+        incremental = self._rows()
+        self.assertEqual(rebuild_rollups(), len(incremental))
+        self.assertEqual(self._rows(), incremental)
+
+        month = monthly_totals(months=1)[-1]
+        self.assertEqual(month["period"], self.today.replace(day=1))
+        self.assertEqual(month["invoiced"], sum(
+            row[4] for row in incremental if row[0] == "MONTH" and row[1] == self.today.replace(day=1)
+        ))
+
+    def test_admin_deletes_update_balances_and_rollups(self):
+        other = User.objects.create_user(email="other@example.com", password="pw", is_active=True)
+        kept = self._invoice(5000, days_ago=3)
+        single = self._invoice(700, days_ago=3)
+        bulk = [self._invoice(300, days_ago=45), self._invoice(200)]
+        bulk.append(create_invoice_record(user=other, amount=900))
+
+        admin_user = User.objects.create_superuser(email="admin@example.com", password="pw", is_active=True)
+        self.client.force_login(admin_user)
+        self.client.post(reverse("admin:finances_invoice_delete", args=[single.pk]), {"post": "yes"})
+        self.client.post(reverse("admin:finances_invoice_changelist"), {
+            "action": "delete_selected", "post": "yes", "_selected_action": [i.pk for i in bulk],
+        })
+
+        self.assertEqual(list(Invoice.objects.values_list("pk", flat=True)), [kept.pk])
+        balances = dict(User.objects.filter(pk__in=[self.user.pk, other.pk]).values_list("pk", "balance_due"))
+        self.assertEqual(balances, {self.user.pk: 5000, other.pk: 0})
+        rows = self._rows()
+        rebuild_rollups()
+        self.assertEqual(self._rows(), rows)
+        self.assertEqual(aging_report(self.today)[0]["amount"], 5000)
+
+    def test_aging_buckets(self):
+        self._invoice(100)
+        self._invoice(200, days_ago=30)
+        self._invoice(400, days_ago=31)
+        self._invoice(800, days_ago=90)
+        self._invoice(1600, days_ago=91)
+        self._invoice(3200, days_ago=400)
+        self._invoice(6400, days_ago=10, status=Invoice.Status.PAID)
+
+        with CaptureQueriesContext(connection) as queries:
+            aging = aging_report(self.today)
+
+        self.assertEqual(
+            [(bucket["label"], bucket["amount"], bucket["count"]) for bucket in aging],
+            [("0-30", 300, 2), ("31-60", 400, 1), ("61-90", 800, 1), ("90+", 4800, 2)],
+        )
+        self.assertFalse([q for q in queries.captured_queries if '"invoices"' in q["sql"]])
+
+    def test_rebuild_command_repairs_a_range(self):
+        self._invoice(100, days_ago=2)
+        InvoiceRollup.objects.all().delete()
+        Invoice.objects.create(user=self.user, amount=50)  # behind the ledger's back
+
+        out = StringIO()
+        since = (self.today - timedelta(days=2)).isoformat()
+        call_command("rebuild_invoice_rollups", "--since", since, stdout=out)
+
+        self.assertIn("rollup row(s)", out.getvalue())
+        self.assertEqual(sum(month["invoiced"] for month in monthly_totals(months=2)), 150)
+
+    def test_rebuild_locks_and_corrects_rows_in_place(self):
+        invoice = self._invoice(100)
+        row = InvoiceRollup.objects.get(granularity=InvoiceRollup.Granularity.DAY, status=Invoice.Status.PENDING)
+        InvoiceRollup.objects.filter(pk=row.pk).update(amount=999)
+        stray = InvoiceRollup.objects.create(
+            granularity=InvoiceRollup.Granularity.DAY, period_start=self.today, status=Invoice.Status.PAID,
+            invoice_count=1, amount=5,
+        )
+
+        with mock.patch.object(QuerySet, "select_for_update", autospec=True, side_effect=QuerySet.select_for_update) as lock:
+            rebuild_rollups(self.today, self.today)
+        self.assertTrue(any(call.args[0].model is InvoiceRollup for call in lock.call_args_list))
+
+        # A ledger bump waiting on the lock lands on the same row.
+        self.assertEqual(InvoiceRollup.objects.get(pk=row.pk).amount, invoice.amount)
+        self.assertFalse(InvoiceRollup.objects.filter(pk=stray.pk).exists())
+
+    def test_report_endpoint_and_dashboard_read_rollups(self):
+        self._invoice(2500, days_ago=40)
+        admin_user = User.objects.create_user(email="admin@example.com", password="pw", is_staff=True, is_active=True)
+        self.client.force_login(admin_user)
+
+        with CaptureQueriesContext(connection) as queries:
+            report = self.client.get(reverse("admin_finance_report"), {"months": 3}).json()
+        self.assertEqual(report["outstanding"], 2500)
+        self.assertEqual(report["aging"][1]["amount"], 2500)
+        self.assertEqual(sum(month["pending"] for month in report["months"]), 2500)
+        self.assertFalse([q for q in queries.captured_queries if 'FROM "invoices"' in q["sql"]])
+
+        with mock.patch("users.views.get_latest_website_content", return_value=None):
+            response = self.client.get(reverse("admin_dashboard"))
+        self.assertEqual(response.context["outstanding_dollars"], Decimal("25"))
+
+
+class FakeCheckout:
+    """Stand-in for stripe.checkout.Session."""
+
+    def __init__(self):
+        self.created = []
+        self.expired = []
+
+    def create(self, **params):
+        session = SimpleNamespace(
+            id=f"cs_{len(self.created) + 1}",
+            url=f"https://checkout.stripe.test/cs_{len(self.created) + 1}",
+            expires_at=params["expires_at"],
+        )
+        self.created.append(params)
+        return session
+
+    def expire(self, session_id):
+        self.expired.append(session_id)
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET="whsec_test")
+class CheckoutSessionTests(TestCase):
+    def setUp(self):
+        self.fake = FakeCheckout()
+        patcher = mock.patch("stripe.checkout.Session", self.fake)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(email="client@example.com", password="pw", is_active=True)
+        self.invoice = create_invoice_record(user=self.user, amount=5000, stripe_invoice_id="in_1")
+        self.url = reverse("create_checkout_session", args=[self.invoice.pk])
+
+    def _webhook(self, event_id, event_type, obj):
+        payload = json.dumps({"id": event_id, "type": event_type, "data": {"object": obj}})
+        with mock.patch("stripe.Webhook.construct_event"):
+            return self.client.post(
+                reverse("stripe_webhook"), payload, content_type="application/json",
+                HTTP_STRIPE_SIGNATURE="t=1,v1=sig",
+            )
+
+    def test_repeat_clicks_reuse_the_open_session(self):
+        first = self.client.get(self.url)
+        self.assertRedirects(first, "https://checkout.stripe.test/cs_1", fetch_redirect_response=False)
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(self.url)
+        self.assertEqual(second["Location"], "https://checkout.stripe.test/cs_1")
+        self.assertEqual(len(self.fake.created), 1)
+        self.assertLessEqual(len(queries), 2)
+
+    def test_changed_amount_or_expiry_opens_a_new_session(self):
+        self.client.get(self.url)
+        Invoice.objects.filter(pk=self.invoice.pk).update(amount=6000)
+        response = self.client.get(self.url)
+        self.assertEqual(response["Location"], "https://checkout.stripe.test/cs_2")
+        self.assertEqual(self.fake.expired, ["cs_1"])
+        self.assertEqual(self.fake.created[-1]["line_items"][0]["price_data"]["unit_amount"], 6000)
+
+        # About to expire: not worth sending the client there.
+        CheckoutSession.objects.filter(stripe_session_id="cs_2").update(
+            expires_at=timezone.now() + timedelta(minutes=2)
+        )
+        self.client.get(self.url)
+        self.assertEqual(len(self.fake.created), 3)
+        self.assertEqual(
+            dict(CheckoutSession.objects.values_list("stripe_session_id", "status")),
+            {"cs_1": "EXPIRED", "cs_2": "EXPIRED", "cs_3": "OPEN"},
+        )
+
+    def test_paid_or_voided_invoice_expires_open_sessions(self):
+        self.client.get(self.url)
+        self._webhook("evt_1", "invoice.paid", {"id": "in_1", "metadata": {}})
+        self.assertEqual(self.fake.expired, ["cs_1"])
+        self.assertEqual(CheckoutSession.objects.get().status, CheckoutSession.Status.EXPIRED)
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+
+        other = create_invoice_record(user=self.user, amount=700, stripe_invoice_id="in_2")
+        self.client.get(reverse("create_checkout_session", args=[other.pk]))
+        admin_user = User.objects.create_user(email="admin@example.com", password="pw", is_staff=True, is_active=True)
+        self.client.force_login(admin_user)
+        with mock.patch("stripe.Invoice.void_invoice"):
+            self.client.post(reverse("void_invoice", args=["in_2"]))
+        self.assertEqual(self.fake.expired, ["cs_1", "cs_2"])
+
+    def test_completed_session_marks_the_invoice_paid(self):
+        self.client.get(self.url)
+        with mock.patch("stripe.Invoice.pay") as pay:
+            self._webhook("evt_1", "checkout.session.completed", {
+                "id": "cs_1", "payment_status": "paid", "metadata": {"invoice_id": str(self.invoice.pk)},
+            })
+
+        # The Stripe invoice is closed too, so its hosted page can't be paid again.
+        pay.assert_called_once_with("in_1", paid_out_of_band=True)
+        self.assertEqual(CheckoutSession.objects.get().status, CheckoutSession.Status.COMPLETE)
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.status, Invoice.Status.PAID)
+        self.assertEqual(User.objects.values_list("balance_due", flat=True).get(pk=self.user.pk), 0)
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(len(self.fake.created), 1)
+
+    def test_completed_session_blocks_a_second_payment_until_the_invoice_is_paid(self):
+        self.client.get(self.url)
+        # Completed, but the payment hasn't settled yet (e.g. a delayed method).
+        self._webhook("evt_1", "checkout.session.completed", {
+            "id": "cs_1", "payment_status": "unpaid", "metadata": {"invoice_id": str(self.invoice.pk)},
+        })
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.status, Invoice.Status.PENDING)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "Invoice already paid")
+        self.assertEqual(len(self.fake.created), 1)
+
+        # A new amount is a new bill, so it can be paid.
+        Invoice.objects.filter(pk=self.invoice.pk).update(amount=6000)
+        self.assertEqual(self.client.get(self.url)["Location"], "https://checkout.stripe.test/cs_2")
+
+    def test_failed_delayed_payment_stops_blocking_checkout(self):
+        self.client.get(self.url)
+        self._webhook("evt_1", "checkout.session.completed", {
+            "id": "cs_1", "payment_status": "unpaid", "metadata": {"invoice_id": str(self.invoice.pk)},
+        })
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+
+        self._webhook("evt_2", "checkout.session.async_payment_failed", {
+            "id": "cs_1", "payment_status": "unpaid", "metadata": {"invoice_id": str(self.invoice.pk)},
+        })
+        self.assertEqual(self.client.get(self.url)["Location"], "https://checkout.stripe.test/cs_2")
+
+    def test_delayed_payment_success_marks_the_invoice_paid(self):
+        self.client.get(self.url)
+        with mock.patch("stripe.Invoice.pay"):
+            self._webhook("evt_1", "checkout.session.async_payment_succeeded", {
+                "id": "cs_1", "payment_status": "paid", "metadata": {"invoice_id": str(self.invoice.pk)},
+            })
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.status, Invoice.Status.PAID)
+
+    def test_expired_webhook_updates_the_stored_session(self):
+        self.client.get(self.url)
+        self._webhook("evt_1", "checkout.session.expired", {"id": "cs_1"})
+        self.assertEqual(CheckoutSession.objects.get().status, CheckoutSession.Status.EXPIRED)
+        self.assertEqual(self.client.get(self.url)["Location"], "https://checkout.stripe.test/cs_2")
+
+
+@override_settings(STRIPE_MAX_CONCURRENCY=3)
+class BatchBillingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.fake = FakeStripe(latency=0.02)
+        patcher = self.fake.patch()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        attorney = User.objects.create_user(email="lydia@example.com", password="pw", is_staff=True, is_active=True)
+        AdminProfile.objects.create(user=attorney, hourly_rate=Decimal("200.00"))
+        self.admin_user = attorney
+        self.through = default_through()
+        self.last_month = timezone.make_aware(datetime.combine(self.through, datetime.min.time())) + timedelta(hours=10)
+        self.clients = [
+            User.objects.create_user(email=f"client{n}@example.com", password="pw", is_active=True)
+            for n in range(5)
+        ]
+
+    def _appt(self, user, minutes, start=None, status=Appointments.Status.COMPLETED, host="Lydia@example.com"):
+        return Appointments.objects.create(
+            user_id=user,
+            start_time=start or self.last_month,
+            duration=timedelta(minutes=minutes),
+            status=status,
+            calendly_host_email=host,
+        )
+
+    def test_preview_is_one_grouped_query(self):
+        alice, bob = self.clients[:2]
+        self._appt(alice, 60)
+        self._appt(alice, 30)
+        self._appt(bob, 45)
+        self._appt(bob, 45, status=Appointments.Status.CONFIRMED)
+        self._appt(bob, 45, start=self.last_month + timedelta(days=2))  # after the period
+
+        with CaptureQueriesContext(connection) as queries:
+            bills = preview_billing(self.through)
+
+        # Rates, the grouped appointments query, and the clients.
+        self.assertEqual(len(queries), 3)
+        self.assertEqual([(b.email, b.appointment_count, b.minutes, b.amount) for b in bills], [
+            ("client0@example.com", 2, 90, 30000),
+            ("client1@example.com", 1, 45, 15000),
+        ])
+        self.assertIn("1.50 h at $200.00/h", bills[0].lines[0]["description"])
+
+    def test_run_bills_every_client_in_parallel_and_once(self):
+        appts = [self._appt(client, 30) for client in self.clients]
+
+        out = StringIO()
+        call_command("bill_appointments", stdout=out)
+
+        self.assertIn("Billed 5 client(s)", out.getvalue())
+        self.assertEqual(Invoice.objects.count(), 5)
+        self.assertEqual(set(Invoice.objects.values_list("amount", flat=True)), {10000})
+        self.assertLessEqual(self.fake.max_in_flight, 3)
+        for appt in appts:
+            appt.refresh_from_db()
+            self.assertIsNotNone(appt.billed_at)
+            self.assertEqual(appt.invoice_draft.invoice.user_id, appt.user_id_id)
+
+        calls = len(self.fake.calls)
+        call_command("bill_appointments", stdout=StringIO())
+        self.assertEqual(len(self.fake.calls), calls)
+        self.assertEqual(Invoice.objects.count(), 5)
+
+    def test_failed_draft_resumes_on_the_next_run(self):
+        for client in self.clients[:3]:
+            self._appt(client, 30)
+        drafts, skipped = create_billing_drafts(self.through, date.today())
+        self.assertEqual((len(drafts), skipped), (3, []))
+        self.fake.fail_keys.add(drafts[1].idempotency_key("finalize"))
+
+        completed, failed = run_billing(drafts)
+        self.assertEqual((len(completed), [d.pk for d, _ in failed]), (2, [drafts[1].pk]))
+        self.assertEqual(
+            Appointments.objects.filter(billed_at__isnull=True).values_list("invoice_draft", flat=True).get(),
+            drafts[1].pk,
+        )
+
+        call_command("bill_appointments", stdout=StringIO())
+        self.assertEqual(Invoice.objects.count(), 3)
+        self.assertEqual(self.fake.calls.count("invoice.create"), 3)
+        self.assertFalse(Appointments.objects.filter(billed_at__isnull=True).exists())
+
+    def test_unknown_host_without_default_rate_is_skipped(self):
+        AdminProfile.objects.create(
+            user=User.objects.create_user(email="partner@example.com", password="pw", is_staff=True),
+            hourly_rate=Decimal("350.00"),
+        )
+        self._appt(self.clients[0], 60, host="partner@example.com")
+        self._appt(self.clients[1], 60, host="contractor@example.com")
+
+        bills = preview_billing(self.through)
+        self.assertEqual([b.amount for b in bills], [35000, 0])
+        self.assertEqual(bills[1].unpriced_hosts, ["contractor@example.com"])
+        self.assertEqual(preview_billing(self.through, rate=Decimal("100"))[1].amount, 10000)
+
+    def test_admin_screen_previews_and_creates_drafts_only(self):
+        self._appt(self.clients[0], 60)
+        self.client.force_login(User.objects.create_superuser(email="root@example.com", password="pw"))
+        url = reverse("admin:finances_invoicedraft_billing")
+
+        response = self.client.get(url)
+        self.assertContains(response, "client0@example.com")
+        self.assertContains(response, "Create 1 invoice draft ($200.00)")
+
+        response = self.client.post(url, {"through": self.through.isoformat(), "due_days": "14"}, follow=True)
+        self.assertRedirects(response, reverse("admin:finances_invoicedraft_changelist"))
+        self.assertContains(response, "1 invoice draft(s) pending")
+        # Nothing is sent to Stripe from the request, not even the customer.
+        self.assertEqual(self.fake.calls, [])
+        self.assertFalse(Invoice.objects.exists())
+        draft = InvoiceDraft.objects.get()
+        self.assertEqual((draft.status, draft.stripe_customer_id), (InvoiceDraft.Status.PENDING, ""))
+
+        call_command("bill_appointments", "--through", self.through.isoformat(), stdout=StringIO())
+        self.assertEqual(Invoice.objects.get().amount, 20000)
+        draft.refresh_from_db()
+        self.assertTrue(draft.stripe_customer_id)
+
+    def test_rejects_rates_that_are_not_positive_amounts(self):
+        for value in ("NaN", "Infinity", "-50", "0", "abc"):
+            with self.assertRaises(ValueError):
+                parse_hourly_rate(value)
+        self.assertEqual(parse_hourly_rate(" 150.50 "), Decimal("150.50"))
+
+        self._appt(self.clients[0], 60, host="")
+        self.client.force_login(User.objects.create_superuser(email="root@example.com", password="pw"))
+        url = reverse("admin:finances_invoicedraft_billing")
+        self.assertContains(self.client.get(url, {"rate": "NaN"}), "Invalid hourly rate")
+        self.client.post(url, {"through": self.through.isoformat(), "due_days": "14", "rate": "-50"})
+        self.assertFalse(InvoiceDraft.objects.exists())
+
+        with self.assertRaises(CommandError):
+            call_command("bill_appointments", "--rate", "Infinity", stdout=StringIO())
+
+    def test_billed_appointments_are_never_billed_again(self):
+        billed = self._appt(self.clients[0], 60)
+        Appointments.objects.filter(pk=billed.pk).update(billed_at=timezone.now())
+        self.assertEqual(preview_billing(self.through), [])
+
+        # Deleting a completed draft releases its appointments (SET_NULL),
+        # but billed_at keeps them off the next run.
+        self._appt(self.clients[1], 60)
+        call_command("bill_appointments", stdout=StringIO())
+        InvoiceDraft.objects.all().delete()
+        self.assertEqual(preview_billing(self.through), [])
+
+
+class DunningTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="client@example.com", password="pw", first_name="Ada", is_active=True)
+        self.today = timezone.localdate()
+
+    def _invoice(self, due_in_days, status=Invoice.Status.PENDING, **fields):
+        return create_invoice_record(
+            user=self.user, amount=12345, status=status,
+            due_date=self.today + timedelta(days=due_in_days), **fields,
+        )
+
+    def test_reminds_only_overdue_pending_invoices_once_per_interval(self):
+        overdue = [self._invoice(-3), self._invoice(-40, hosted_invoice_url="https://invoice.stripe.test/in_1")]
+        self._invoice(0)  # due today
+        self._invoice(10)
+        self._invoice(-5, status=Invoice.Status.PAID)
+        create_invoice_record(user=self.user, amount=100)  # no due date
+
+        out = StringIO()
+        call_command("send_invoice_reminders", stdout=out)
+
+        self.assertIn("Queued 2 reminder(s).", out.getvalue())
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(deliver_queued_email(), {"sent": 2, "retrying": 0, "failed": 0})
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[0].subject, f"Reminder: invoice #{overdue[0].pk} is past due")
+        self.assertIn("$123.45", mail.outbox[0].body)
+        self.assertIn("https://invoice.stripe.test/in_1", mail.outbox[1].body)
+        sent = Notification.objects.filter(type=Notification.Type.INVOICE_REMINDER, status="SENT")
+        self.assertEqual(sent.count(), 2)
+        self.assertEqual(sent.order_by("pk").first().payload["invoice_id"], overdue[0].pk)
+
+        # Nothing new until the interval passes.
+        self.assertEqual(send_invoice_reminders(), {"queued": 0})
+        # A week later the invoice due today is overdue too.
+        later = timezone.now() + timedelta(days=8)
+        self.assertEqual(send_invoice_reminders(now=later), {"queued": 3})
+
+    def test_batches_stamp_reminders_with_one_update(self):
+        for days in range(1, 6):
+            self._invoice(-days)
+
+        with CaptureQueriesContext(connection) as queries:
+            totals = send_invoice_reminders(batch_size=2)
+
+        self.assertEqual(totals, {"queued": 5})
+        self.assertEqual(OutboundEmail.objects.count(), 5)
+        updates = [q for q in queries.captured_queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 3)
+        self.assertFalse(Invoice.objects.filter(last_reminder_at__isnull=True).exists())
+
+    @override_settings(OUTBOUND_EMAIL_MAX_ATTEMPTS=1)
+    def test_failed_send_is_recorded_once_by_the_outbox(self):
+        invoice = self._invoice(-2)
+        self.assertEqual(send_invoice_reminders(), {"queued": 1})
+        with mock.patch("django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=OSError("smtp down")):
+            self.assertEqual(deliver_queued_email(), {"sent": 0, "retrying": 0, "failed": 1})
+
+        notification = Notification.objects.get()
+        self.assertEqual(
+            (notification.type, notification.status, notification.error_message),
+            (Notification.Type.INVOICE_REMINDER, "FAILED", "smtp down"),
+        )
+        invoice.refresh_from_db()
+        self.assertIsNotNone(invoice.last_reminder_at)
+        # The next daily run doesn't queue the reminder again.
+        self.assertEqual(send_invoice_reminders(), {"queued": 0})
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+
+    def test_overdue_lookup_uses_the_status_due_date_index(self):
+        plan = due_for_reminder().explain()
+        self.assertIn("invoice_status_due_idx", plan)
+
+    def test_pipeline_stores_the_due_date(self):
+        fake = FakeStripe()
+        draft = InvoiceDraft.objects.create(
+            user=self.user, stripe_customer_id="cus_1", due_date=date(2030, 1, 31),
+            lines=[{"description": "Consultation", "quantity": 1, "unit_amount": 5000}],
+        )
+        with fake.patch():
+            invoice = run_invoice_draft(draft)
+        self.assertEqual(invoice.due_date, date(2030, 1, 31))
+
+
+@override_settings(STRIPE_MAX_CONCURRENCY=3)
+class BulkInvoiceActionTests(TestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_user(email="admin@example.com", password="pw", is_staff=True, is_active=True)
+        self.user = User.objects.create_user(email="client@example.com", password="pw", provider_customer_id="cus_1")
+        self.fake = FakeStripe(latency=0.02)
+
+    def _invoice(self, n, status=Invoice.Status.PENDING, amount=1000):
+        return create_invoice_record(user=self.user, amount=amount, status=status, stripe_invoice_id=f"in_bulk_{n}")
+
+    def test_void_validates_in_one_query_and_updates_statuses_in_one_statement(self):
+        pending = [self._invoice(n) for n in range(8)]
+        paid = self._invoice(100, status=Invoice.Status.PAID)
+        no_stripe = create_invoice_record(user=self.user, amount=500)
+
+        ids = [inv.pk for inv in pending] + [paid.pk, no_stripe.pk, 99999, "junk", pending[0].pk]
+        with self.fake.patch(), CaptureQueriesContext(connection) as queries:
+            results = bulk_invoice_action(ids, "void")
+
+        self.assertEqual([r["id"] for r in results], [inv.pk for inv in pending] + [paid.pk, no_stripe.pk, 99999])
+        by_id = {r["id"]: r["result"] for r in results}
+        self.assertEqual({by_id[inv.pk] for inv in pending}, {"voided"})
+        self.assertEqual(by_id[paid.pk], "skipped")
+        self.assertEqual(by_id[no_stripe.pk], "skipped")
+        self.assertEqual(by_id[99999], "not_found")
+
+        self.assertGreater(self.fake.max_in_flight, 1)
+        self.assertLessEqual(self.fake.max_in_flight, 3)
+        self.assertEqual(self.fake.calls.count("invoice.void"), 8)
+
+        invoice_sql = [q["sql"] for q in queries.captured_queries if 'FROM "invoices"' in q["sql"] or 'UPDATE "invoices"' in q["sql"]]
+        self.assertEqual(len([sql for sql in invoice_sql if sql.startswith("UPDATE")]), 1)
+        self.assertEqual(
+            set(Invoice.objects.filter(pk__in=[inv.pk for inv in pending]).values_list("status", flat=True)),
+            {Invoice.Status.VOIDED},
+        )
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance_due, 500)
+
+    def test_stripe_failure_is_reported_per_invoice(self):
+        ok, failing = self._invoice(1), self._invoice(2)
+        self.fake.fail_keys.add(f"void-{failing.stripe_invoice_id}")
+        with self.fake.patch():
+            results = bulk_invoice_action([ok.pk, failing.pk], "void")
+
+        self.assertEqual([r["result"] for r in results], ["voided", "failed"])
+        self.assertIn("Stripe error", results[1]["message"])
+        failing.refresh_from_db()
+        self.assertEqual(failing.status, Invoice.Status.PENDING)
+
+    def test_resend_leaves_status_alone_and_is_idempotent_per_day(self):
+        invoices = [self._invoice(n) for n in range(3)]
+        with self.fake.patch():
+            first = bulk_invoice_action([inv.pk for inv in invoices], "resend")
+            bulk_invoice_action([inv.pk for inv in invoices], "resend")
+
+        self.assertEqual({r["result"] for r in first}, {"sent"})
+        # The second run replays the same idempotency keys; Stripe sends nothing new.
+        self.assertEqual(len(self.fake.responses), 3)
+        self.assertEqual(
+            set(Invoice.objects.filter(pk__in=[inv.pk for inv in invoices]).values_list("status", flat=True)),
+            {Invoice.Status.PENDING},
+        )
+
+    def test_view_applies_action_to_all_matching_filters(self):
+        pending = [self._invoice(n) for n in range(3)]
+        paid = self._invoice(10, status=Invoice.Status.PAID)
+        self.client.force_login(self.admin_user)
+
+        with self.fake.patch():
+            response = self.client.post(reverse("admin_transactions_bulk"), {
+                "action": "void",
+                "select_all_matching": "1",
+                "status": Invoice.Status.PENDING,
+                "next": reverse("admin_transactions"),
+            })
+
+        self.assertRedirects(response, reverse("admin_transactions"), fetch_redirect_response=False)
+        self.assertEqual(
+            Invoice.objects.filter(status=Invoice.Status.VOIDED).count(), len(pending)
+        )
+        paid.refresh_from_db()
+        self.assertEqual(paid.status, Invoice.Status.PAID)
+
+    def test_all_matching_needs_a_filter(self):
+        invoice = self._invoice(1)
+        self.client.force_login(self.admin_user)
+        with self.fake.patch():
+            response = self.client.post(reverse("admin_transactions_bulk"), {
+                "action": "void", "select_all_matching": "1", "status": "", "client": " ",
+            }, follow=True)
+        self.assertContains(response, "Set at least one filter")
+        self.assertEqual(self.fake.calls, [])
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.status, Invoice.Status.PENDING)
+
+    def test_view_requires_an_action(self):
+        invoice = self._invoice(1)
+        self.client.force_login(self.admin_user)
+        with self.fake.patch():
+            self.client.post(reverse("admin_transactions_bulk"), {"invoice_ids": [invoice.pk]})
+        self.assertEqual(self.fake.calls, [])
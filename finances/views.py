@@ -1,18 +1,35 @@
-from datetime import datetime
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from urllib.parse import urlencode
 import json
 import logging
+import uuid
 
 from django.conf import settings
-from django.db import IntegrityError, transaction
-from django.http import JsonResponse
+from django.contrib import messages
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value
+from django.db.models.functions import Upper
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
+from django.urls import reverse
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 from users.views import is_admin_user
+from core.pagination import keyset_paginate
 
 import stripe
+from users.emails import users_by_email
 from users.models import User
-from .models import Invoice, StripeWebhookEvent
+from . import rollups, stripe_cache
+from .bulk import BULK_ACTIONS, bulk_invoice_action
+from .checkout import InvoiceAlreadyPaid, expire_invoice_sessions, get_checkout_url
+from .customers import get_or_create_stripe_customer_id
+from .events import process_stripe_event
+from .ledger import set_invoice_status
+from .invoicing import InvoicePipelineError, parse_invoice_lines, run_invoice_draft
+from .models import Invoice, InvoiceDraft
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
@@ -20,28 +37,6 @@ stripe.api_key = settings.STRIPE_SECRET_KEY
 logger = logging.getLogger(__name__)
 
 
-def get_or_create_stripe_customer_id(user):
-    # locks the user's row to prevent duplicate stripe customers for one user
-    with transaction.atomic():
-        user = type(user).objects.select_for_update().get(pk=user.pk)
-
-    # check if client has stripe customer id
-    if user.provider_customer_id:
-        return user.provider_customer_id
-
-    # create Stripe customer id if it doesn't exist
-    customer = stripe.Customer.create(
-        email=user.email,
-        name=f"{user.first_name} {user.last_name}",
-        metadata={"user_id": str(user.id)},
-    )
-
-    # save Stripe customer id
-    user.provider_customer_id = customer.id
-    user.save()
-
-    return customer.id
-
 @csrf_exempt
 def stripe_webhook(request):
     """
@@ -81,231 +76,287 @@ def stripe_webhook(request):
         logger.warning("Stripe webhook missing event id.")
         return JsonResponse({"error": "Missing event id"}, status=400)
 
-    try:
-        with transaction.atomic():
-            # Store the event so duplicates can be detected safely.
-            webhook_event, created = StripeWebhookEvent.objects.get_or_create(
-                event_id=event_id,
-                defaults={
-                    "event_type": event_data.get("type", ""),
-                    "payload": event_data,
-                },
-            )
-    except IntegrityError:
-        created = False
-        webhook_event = None
-
-    if not created:
-        logger.info(
-            "Duplicate Stripe event received: %s",
-            event_id,
-        )
-        return JsonResponse({"status": "duplicate"}, status=200)
-
-    event_type = event_data.get("type")
-    invoice_obj = event_data.get("data", {}).get("object", {})
-
-    if event_type in {"invoice.paid", "invoice.payment_failed", "invoice.voided"}:
-        # Stripe invoice metadata can include our local invoice ID.
-        metadata = invoice_obj.get("metadata") or {}
-        local_invoice_id = metadata.get("local_invoice_id") or metadata.get("invoice_id")
-        stripe_invoice_id = invoice_obj.get("id")
-
-        invoice = None
-        # Prefer a direct local ID lookup when available.
-        if local_invoice_id:
-            invoice = Invoice.objects.filter(id=local_invoice_id).first()
-        # Fall back to the Stripe invoice ID if stored in our database.
-        if not invoice and stripe_invoice_id:
-            invoice = Invoice.objects.filter(stripe_invoice_id=stripe_invoice_id).first()
-
-        if not invoice:
-            logger.warning(
-                "Stripe invoice event received but no matching invoice found. "
-                "event_id=%s stripe_invoice_id=%s local_invoice_id=%s",
-                event_id,
-                stripe_invoice_id,
-                local_invoice_id,
-            )
-            return JsonResponse({"status": "ignored"}, status=200)
-
-        if event_type == "invoice.paid":
-            # Paid means the invoice is complete.
-            invoice.status = Invoice.Status.PAID
-            invoice.paid = True
-        elif event_type == "invoice.payment_failed":
-            # Payment failed means the invoice is still unpaid.
-            invoice.status = Invoice.Status.PAYMENT_FAILED
-            invoice.paid = False
-        elif event_type == "invoice.voided":
-            invoice.status = Invoice.Status.VOIDED
-            invoice.paid = False
-
-        invoice.save(update_fields=["status", "paid"])
-        logger.info(
-            "Stripe invoice updated. invoice_id=%s status=%s event_id=%s",
-            invoice.id,
-            invoice.status,
-            event_id,
-        )
+    # De-duplicate and apply the event (shared with reconcile_stripe_events).
+    result = process_stripe_event(event_data)
+    return JsonResponse({"status": result}, status=200)
 
-    logger.info(
-        "Stripe webhook processed. event_id=%s type=%s",
-        event_id,
-        event_type,
-    )
-    return JsonResponse({"status": "success"}, status=200)
-
-def create_invoice_items(stripe_customer_id, descriptions, quantities, unit_prices):
-    # Creates an invoice item object for each unique line item.
-    # Quanitity and unit_price are taken into consideration, total amount
-    # is calculated during the creation of the stripe invoice.
-    for desc, quantity, price in zip(descriptions, quantities, unit_prices):
-        try:
-            price_cents = int(float(price) * 100)
-            quantity = int(quantity)
-
-            stripe.InvoiceItem.create(
-                unit_amount_decimal=price_cents,
-                quantity=quantity,
-                currency="usd", # Assuming only accepting usd.
-                customer=stripe_customer_id,
-                description=desc,
-            )
-        except ValueError:
-            return JsonResponse({"success": False, "error": "Invalid quantity or price."})
 
 def create_invoice(request):
     if request.method == "POST":
         # Customer Information.
         user_email = request.POST.get("email")
         # Invoice Details.
-        issue_date = request.POST.get("issue_date")
         due_date = request.POST.get("due_date")
-        customer_notes = request.POST.get("customer_notes")
-        # List Items Information.
-        descriptions = request.POST.getlist("description[]")
-        quantities = request.POST.getlist("quantity[]")
-        unit_prices = request.POST.getlist("unit_price[]")
+        customer_notes = request.POST.get("customer_notes") or ""
+        # Rendered into the form on GET; resubmitting the same form resumes
+        # the same draft instead of billing the client twice.
+        draft_key = (request.POST.get("draft_key") or "").strip() or None
 
         try:
-            # Get user.
-            user = User.objects.get(email=user_email)
-
-            # Check if user has existing Stripe ID.
-            stripe_customer_id = get_or_create_stripe_customer_id(user)
-
-            # Create invoice items based on line items.
-            create_invoice_items(stripe_customer_id, descriptions, quantities, unit_prices)
-
-            # Sets due date as a datetime object.
-            # Stripe requires this to be a UNIX timestamp integer, so.. ya.
-            due_date_timestamp = int(datetime.strptime(due_date, "%Y-%m-%d").timestamp())
-
-            # Actually creates the overall stripe invoice object.
-            stripe_invoice = stripe.Invoice.create(
-                customer=stripe_customer_id,
-                collection_method = "send_invoice",
-                # Auto advance automatically finalizes the invoice.
-                # This may need to change if we want to add another layer of confirmation
-                # before charging users, if Lydia wants this feature.
-                auto_advance=False,
-                due_date=due_date_timestamp,
-                pending_invoice_items_behavior="include", # Pulls all pending invoice items into invoice.
-            )
-
-            '''
-            Webhook isn't working for finalize_invoice event type,
-            so this is being done manually right now.
-            '''
-
-            stripe_invoice = stripe.Invoice.finalize_invoice(stripe_invoice.id)
-
-            # Creates and saves new invoice DB object for created stripe invoice.
-            Invoice.objects.create(
-                user=user,
-                amount=stripe_invoice.amount_due,
-                stripe_invoice_id=stripe_invoice.id,
-                hosted_invoice_url=stripe_invoice.hosted_invoice_url,
-                status=Invoice.Status.PENDING,  # Defaults to pending, webhook handles changes.
-            )
+            draft = InvoiceDraft.objects.filter(client_key=draft_key).first() if draft_key else None
+
+            if draft is None:
+                # Get user.
+                user = users_by_email(user_email).get()
+
+                # Validate line items before anything is sent to Stripe.
+                lines = parse_invoice_lines(
+                    request.POST.getlist("description[]"),
+                    request.POST.getlist("quantity[]"),
+                    request.POST.getlist("unit_price[]"),
+                )
+                due = datetime.strptime(due_date or "", "%Y-%m-%d").date()
+
+                # Check if user has existing Stripe ID.
+                stripe_customer_id = get_or_create_stripe_customer_id(user)
+
+                draft = InvoiceDraft.objects.create(
+                    client_key=draft_key,
+                    user=user,
+                    stripe_customer_id=stripe_customer_id,
+                    due_date=due,
+                    customer_notes=customer_notes,
+                    lines=lines,
+                )
+
+            invoice = run_invoice_draft(draft)
 
             return JsonResponse(
                 {
                     "success": True,
                     "redirect_url": "/administrator/invoice_confirmation/",
-                    "hosted_invoice_url": stripe_invoice.hosted_invoice_url,
-                    "stripe_invoice_id": stripe_invoice.id,
-                    
+                    "hosted_invoice_url": invoice.hosted_invoice_url,
+                    "stripe_invoice_id": invoice.stripe_invoice_id,
                 }
             )
 
         except User.DoesNotExist:
             return JsonResponse({"success": False, "error": "User not found"})
+        except ValueError as e:
+            return JsonResponse({"success": False, "error": str(e) or "Invalid invoice details."})
+        except InvoicePipelineError as e:
+            return JsonResponse(
+                {
+                    "success": False,
+                    "error": f"{e} Submit again to resume this invoice.",
+                    "draft_id": e.draft.pk,
+                }
+            )
         except Exception as e:
             return JsonResponse({"success": False, "error": str(e)})
 
-    return render(request, "admin/create_invoice.html")
+    return render(request, "admin/create_invoice.html", {"draft_key": uuid.uuid4().hex})
 
 def invoice_confirmation(request):
     return render(request, "admin/invoice_confirmation.html")
 
-# Retrieve strip invoice
-def stripe_get_invoice(stripe_invoice_id: str):
-    return stripe.Invoice.retrieve(stripe_invoice_id)
+TRANSACTIONS_PAGE_SIZE = 25
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _filter_admin_invoices(qs, params):
+    # Filter by date range (unparseable dates are ignored). Bare bounds on
+    # created_at, rather than __date, so the index on it can be used.
+    date_from = _parse_date(params.get("date_from"))
+    date_to = _parse_date(params.get("date_to"))
+    if date_from:
+        qs = qs.filter(created_at__gte=_day_start(date_from))
+    if date_to:
+        qs = qs.filter(created_at__lt=_day_start(date_to + timedelta(days=1)))
+
+    # Filter by client (email or name)
+    client = (params.get("client") or "").strip()
+    if client:
+        qs = qs.filter(
+            Q(user__email__icontains=client)
+            | Q(user__first_name__icontains=client)
+            | Q(user__last_name__icontains=client)
+        )
+    return qs
+
+
+def invoice_status_summary(qs):
+    """Count and total (cents) per status for `qs`, in one aggregate query."""
+    aggregates = {}
+    for status in Invoice.Status.values:
+        aggregates[f"{status}_count"] = Count("id", filter=Q(status=status))
+        aggregates[f"{status}_total"] = Sum("amount", filter=Q(status=status))
+    row = qs.aggregate(**aggregates)
+    return _summary_rows({
+        status: (row[f"{status}_count"], row[f"{status}_total"] or 0)
+        for status in Invoice.Status.values
+    })
+
+
+def _summary_rows(totals):
+    return [
+        {
+            "status": value,
+            "label": label,
+            "count": totals.get(value, (0, 0))[0],
+            "total_dollars": totals.get(value, (0, 0))[1] / 100,
+        }
+        for value, label in Invoice.Status.choices
+    ]
 
-# List Client Invoices
-def stripe_list_client_invoices(user, limit=50):
-    return stripe.Invoice.list(customer=user.provider_customer_id, limit=limit)
 
 @login_required
 def admin_transactions(request):
     # Ensures only visible to admins (PermissionDenied if not)
     is_admin_user(request.user)
 
-    # Fetch from local DB so we can link to Django users
-    # Use select_related to get the user email in one database hit
-    invoices = Invoice.objects.select_related("user").all().order_by("-created_at")
+    filtered = _filter_admin_invoices(Invoice.objects.all(), request.GET)
+    # Per-status totals ignore the status filter so every card stays meaningful.
+    # Without a client filter they come from the rollups, not the invoices.
+    if (request.GET.get("client") or "").strip():
+        summary = invoice_status_summary(filtered)
+    else:
+        summary = _summary_rows(rollups.status_totals(
+            _parse_date(request.GET.get("date_from")),
+            _parse_date(request.GET.get("date_to")),
+        ))
+
+    status_filter = request.GET.get("status", "")
+    if status_filter in Invoice.Status.values:
+        filtered = filtered.filter(status=status_filter)
+
+    # Use select_related to get the user email in one database hit, and do
+    # the cents -> dollars conversion in SQL.
+    qs = (
+        filtered
+        .select_related("user")
+        .only(
+            "id", "amount", "status", "stripe_invoice_id", "hosted_invoice_url", "created_at",
+            "user__email", "user__first_name", "user__last_name",
+        )
+        .annotate(
+            amount_dollars=ExpressionWrapper(
+                F("amount") * Value(Decimal("0.01")),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+            # Ensure status is uppercase for templates checks
+            display_status=Upper("status"),
+        )
+    )
+    page = keyset_paginate(
+        qs,
+        ("-created_at", "-id"),
+        TRANSACTIONS_PAGE_SIZE,
+        after=request.GET.get("after"),
+        before=request.GET.get("before"),
+    )
+
+    filters = {key: request.GET.get(key, "") for key in ("status", "date_from", "date_to", "client")}
+    return render(request, "admin/transactions.html", {
+        "invoices": page,
+        "page": page,
+        "summary": summary,
+        "status_choices": Invoice.Status.choices,
+        "filters": filters,
+        "filter_query": urlencode({k: v for k, v in filters.items() if v}),
+        "summary_query": urlencode({k: v for k, v in filters.items() if v and k != "status"}),
+    })
+
+@require_POST
+@login_required
+def admin_transactions_bulk(request):
+    """
+    Void or resend many invoices at once. Either the checked rows or, with
+    select_all_matching, every invoice matching the list filters.
+    Each invoice's outcome is reported back as a message.
+    """
+    is_admin_user(request.user)
+
+    next_url = request.POST.get("next") or reverse("admin_transactions")
+
+    action = request.POST.get("action", "")
+    if action not in BULK_ACTIONS:
+        messages.error(request, "Choose a bulk action.")
+        return redirect(next_url)
+
+    if request.POST.get("select_all_matching"):
+        # Without a filter "all matching" is the whole table; one click could void everything.
+        if not any((request.POST.get(key) or "").strip() for key in ("status", "date_from", "date_to", "client")):
+            messages.error(request, "Set at least one filter before applying an action to all matching invoices.")
+            return redirect(next_url)
+        qs = _filter_admin_invoices(Invoice.objects.all(), request.POST)
+        if request.POST.get("status") in Invoice.Status.values:
+            qs = qs.filter(status=request.POST["status"])
+        ids = list(qs.values_list("pk", flat=True))
+    else:
+        ids = request.POST.getlist("invoice_ids")
+
+    if not ids:
+        messages.warning(request, "No invoices selected.")
+        return redirect(next_url)
+
+    results = bulk_invoice_action(ids, action)
+
+    done = [r for r in results if r["result"] == BULK_ACTIONS[action]]
+    if done:
+        messages.success(request, f"{len(done)} invoice(s) {BULK_ACTIONS[action]}.")
+    for r in results:
+        if r["result"] != BULK_ACTIONS[action]:
+            messages.warning(request, f"Invoice #{r['id']}: {r['message']}")
+    return redirect(next_url)
+
+
+@login_required
+def admin_finance_report(request):
+    """
+    Invoiced / paid / failed / voided totals per month and receivables aging,
+    read from the invoice rollups (see finances/rollups.py). Amounts in cents.
+    """
+    is_admin_user(request.user)
+    try:
+        months = min(max(int(request.GET.get("months", 12)), 1), 120)
+    except ValueError:
+        return JsonResponse({"error": "months must be a number"}, status=400)
+
+    aging = rollups.aging_report()
+    return JsonResponse({
+        "months": [
+            {**row, "period": row["period"].isoformat()}
+            for row in rollups.monthly_totals(months)
+        ],
+        "aging": aging,
+        "outstanding": sum(bucket["amount"] for bucket in aging),
+    })
 
-   # helper attributes so template logic works
-    for inv in invoices:
-        # Convert cents (stripe) to dollars for UI
-        inv.amount_dollars = inv.amount / 100.0 if inv.amount else 0.0
-        # Ensure status is uppercase for templates checks
-        inv.display_status = str(inv.status).upper()    
-    return render(request, "admin/transactions.html", {"invoices": invoices })
 
 @login_required
 def admin_stripe_invoice_detail(request, stripe_invoice_id):
     """
     Admin-only: Retrieve a Stripe invoice by stripe invoice ID
-    Sends invoice info to frontend as JSON
+    Sends invoice info to frontend as JSON (amounts in cents, created as a unix timestamp).
+    Served from the Stripe cache when possible (see finances/stripe_cache.py).
     """
     is_admin_user(request.user)
 
     try: 
-        inv = stripe_get_invoice(stripe_invoice_id)
+        inv = stripe_cache.get_invoice(stripe_invoice_id)
     except stripe.error.StripeError as e:
         return JsonResponse({"error": "Stripe error", "message": str(e)}, status=502)
 
-    return JsonResponse({
-        "id": inv.get("id"),
-        "status": inv.get("status"),
-        "amount_due": inv.get("amount_due"),    #cents
-        "amount_paid": inv.get("amount_paid"),  #cents
-        "currency": inv.get("currency"),
-        "hosted_invoice_url": inv.get("hosted_invoice_url"),
-        "invoice_pdf": inv.get("invoice_pdf"),
-        "created": inv.get("created"),   #unix timestamp
-        "customer": inv.get("customer"),
-    })
+    return JsonResponse(inv)
 
 @login_required
 def admin_stripe_invoices_for_user(request, user_id):
     """
     Admin-only: Retrieve all stripe invoices for a local user id
     Uses user's stripe customer id -> provider_customer_id
-    Sends invoice list to frontend as JSON
+    Streams the invoice list to the frontend as JSON, following Stripe's
+    pagination cursor one cached page at a time.
     """
     is_admin_user(request.user)
 
@@ -317,30 +368,30 @@ def admin_stripe_invoices_for_user(request, user_id):
     if not user.provider_customer_id:
         return JsonResponse({"error": "User has no Stripe customer ID"}, status=400)
     
+    customer_id = user.provider_customer_id
+    # Fetch the first page up front so a Stripe failure can still be a 502.
     try:
-        res = stripe.Invoice.list(customer=user.provider_customer_id, limit=50)
+        first_page = stripe_cache.get_invoice_page(customer_id)
     except stripe.error.StripeError as e:
         return JsonResponse({"error": "Stripe error", "message": str(e)}, status=502)
 
-    invoices = []
-    for inv in res.get("data", []):
-        invoices.append({
-             "id": inv.get("id"),
-            "status": inv.get("status"),
-            "amount_due": inv.get("amount_due"),   
-            "amount_paid": inv.get("amount_paid"),  
-            "currency": inv.get("currency"),
-            "hosted_invoice_url": inv.get("hosted_invoice_url"),
-            "invoice_pdf": inv.get("invoice_pdf"),
-            "created": inv.get("created"),   
-        })
-
-    return JsonResponse({
-        "user_id": user_id,
-        "stripe_customer_id": user.provider_customer_id,
-        "count": len(invoices),
-        "invoices": invoices,
-    })
+    def stream():
+        yield f'{{"user_id": {json.dumps(user_id)}, "stripe_customer_id": {json.dumps(customer_id)}, "invoices": ['
+        count = 0
+        error = None
+        try:
+            for inv in stripe_cache.iter_customer_invoices(customer_id, first_page=first_page):
+                yield ("," if count else "") + json.dumps(inv)
+                count += 1
+        except stripe.error.StripeError as e:
+            logger.warning("Stripe invoice list interrupted. customer=%s error=%s", customer_id, e)
+            error = str(e)
+        tail = f'], "count": {count}'
+        if error:
+            tail += f', "error": "Stripe error", "message": {json.dumps(error)}'
+        yield tail + "}"
+
+    return StreamingHttpResponse(stream(), content_type="application/json")
 
 @login_required
 def void_invoice(request, stripe_invoice_id):
@@ -354,7 +405,7 @@ def void_invoice(request, stripe_invoice_id):
         return JsonResponse({"error": "Method not allowed"}, status=405)
 
     try:
-        invoice = Invoice.objects.get(stripe_invoice_id=stripe_invoice_id)
+        invoice = Invoice.objects.select_related("user").get(stripe_invoice_id=stripe_invoice_id)
     except Invoice.DoesNotExist:
         return JsonResponse({"error": "Invoice not found"}, status=404)
 
@@ -368,8 +419,9 @@ def void_invoice(request, stripe_invoice_id):
     except stripe.error.StripeError as e:
         return JsonResponse({"error": "Stripe error", "message": str(e)}, status=502)
 
-    invoice.status = Invoice.Status.VOIDED
-    invoice.save(update_fields=["status"])
+    set_invoice_status(invoice, Invoice.Status.VOIDED)
+    stripe_cache.invalidate_invoice(stripe_invoice_id, invoice.user.provider_customer_id)
+    expire_invoice_sessions([invoice.id])
 
     logger.info(
         "Invoice voided. invoice_id=%s stripe_invoice_id=%s admin=%s",
@@ -387,23 +439,15 @@ def create_checkout_session(request, invoice_id):
 
     if invoice.status == Invoice.Status.PAID or invoice.paid:
         return JsonResponse({"error": "Invoice already paid"}, status=400)
+    if invoice.status == Invoice.Status.VOIDED:
+        return JsonResponse({"error": "Invoice has been voided"}, status=400)
+
+    # Reuses the invoice's open session when it can (see finances/checkout.py).
+    try:
+        url = get_checkout_url(invoice)
+    except InvoiceAlreadyPaid:
+        return JsonResponse({"error": "Invoice already paid"}, status=400)
+    except stripe.error.StripeError as e:
+        return JsonResponse({"error": "Stripe error", "message": str(e)}, status=502)
 
-    session = stripe.checkout.Session.create(
-        mode="payment",
-        payment_method_types=["card"],
-        line_items=[{
-            "price_data": {
-                "currency": "usd",
-                "product_data": {
-                    "name": f"Invoice #{invoice.id}",
-                },
-                "unit_amount": invoice.amount,
-            },
-            "quantity": 1,
-        }],
-        metadata={"invoice_id": str(invoice.id)},
-        success_url="http://localhost:8000/payment/success/",
-		cancel_url="http://localhost:8000/dashboard/",
-	)
-
-    return redirect(session.url)
\ No newline at end of file
+    return redirect(url)
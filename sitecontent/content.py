@@ -0,0 +1,51 @@
+"""
+Cached WebsiteContent lookups.
+
+Nearly every page reads a WebsiteContent row: the latest version for the page
+body and the first one for the footer (context_processors.footer_content).
+Both stay cached until a WebsiteContent row is saved or deleted
+(sitecontent/signals.py). Entries are wrapped in a 1-tuple so "no content
+yet" is cached as well.
+
+With a per-process cache (settings.CACHE_IS_SHARED false) a save would only
+invalidate one worker's copy, so the lookups go to the database instead.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .models import WebsiteContent
+
+CACHE_PREFIX = "sitecontent"
+LATEST_KEY = f"{CACHE_PREFIX}:latest"
+FIRST_KEY = f"{CACHE_PREFIX}:first"
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _cached(key, query):
+    if not settings.CACHE_IS_SHARED:
+        return query()
+    entry = cache.get(key)
+    if entry is None:
+        entry = (query(),)
+        cache.set(key, entry, CACHE_TIMEOUT)
+    return entry[0]
+
+
+def latest_website_content():
+    return _cached(LATEST_KEY, lambda: WebsiteContent.objects.order_by("-versionNumber").first())
+
+
+def first_website_content():
+    return _cached(FIRST_KEY, lambda: WebsiteContent.objects.order_by("created_at").first())
+
+
+def _delete():
+    cache.delete_many([LATEST_KEY, FIRST_KEY])
+
+
+def invalidate_website_content():
+    _delete()
+    # A reader between this write and COMMIT could re-cache the old row.
+    if connection.in_atomic_block:
+        transaction.on_commit(_delete)
@@ -1,4 +1,4 @@
-from .models import WebsiteContent
+from .content import first_website_content
 
 """
 Context Processor to make website content available globally
@@ -6,7 +6,7 @@ Ensures the footer renders dynamically on every page
 """
 def footer_content(request):
     try:
-        content = WebsiteContent.objects.order_by('created_at').first()
+        content = first_website_content()
     except Exception:
         content = None
         
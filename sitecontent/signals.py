@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .content import invalidate_website_content
+from .models import WebsiteContent
+
+
+@receiver(post_save, sender=WebsiteContent)
+@receiver(post_delete, sender=WebsiteContent)
+def invalidate_cached_content(sender, instance, **kwargs):
+    invalidate_website_content()
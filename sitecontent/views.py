@@ -1,5 +1,6 @@
 from django.shortcuts import render
 from .models import WebsiteContent
+from .content import latest_website_content
 from django.contrib.auth import get_user_model
 from django.http import HttpResponseServerError
 from django.conf import settings
@@ -7,7 +8,8 @@ from django.conf import settings
 # Create your views here.
 
 def get_latest_website_content():
-    return WebsiteContent.objects.order_by("-versionNumber").first()
+    # Cached until WebsiteContent changes (sitecontent/content.py).
+    return latest_website_content()
 
 # Home Page request
 def home(request):
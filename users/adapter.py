@@ -1,7 +1,36 @@
 from allauth.account.adapter import DefaultAccountAdapter
+from allauth.core import context as allauth_context
+from django.contrib.sites.shortcuts import get_current_site
 from django.shortcuts import redirect
 
+from appointments.models import Notification
+from core.outbox import enqueue_email
+
+# allauth email templates tracked as Notifications once delivered.
+NOTIFICATION_TYPES = {
+    "account/email/email_confirmation": Notification.Type.EMAIL_CONFIRM,
+    "account/email/email_confirmation_signup": Notification.Type.EMAIL_CONFIRM,
+    "account/email/password_reset_key": Notification.Type.PASSWORD_RESET,
+}
+
 class MyAccountAdapter(DefaultAccountAdapter):
+    def send_mail(self, template_prefix, email, context):
+        """
+        Render the email as allauth does, but queue it for the
+        send_queued_email worker instead of sending it during the request.
+        """
+        request = allauth_context.request
+        ctx = {"request": request, "email": email, "current_site": get_current_site(request)}
+        ctx.update(context)
+        message = self.render_mail(template_prefix, email, ctx)
+        user = context.get("user")
+        enqueue_email(
+            message,
+            user=user if getattr(user, "pk", None) else None,
+            notification_type=NOTIFICATION_TYPES.get(template_prefix, ""),
+            payload={"template": template_prefix},
+        )
+
     def respond_user_inactive(self, request, user):
         return redirect('confirmation_page')
 
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
-from .models import User
+from .models import AdminProfile, User
 
 # Allows admin access to view users
 @admin.register(User)
@@ -8,7 +8,7 @@ class UserAdmin(DjangoUserAdmin):
     fieldsets = (
         (None, {"fields": ("email", "password")}),
         ("Personal info", {"fields": ("first_name", "last_name", "phone_number")}),
-        ("Roles & Provider", {"fields": ("role", "payment_provider", "provider_customer_id", "retainer_balance")}),
+        ("Roles & Provider", {"fields": ("role", "payment_provider", "provider_customer_id", "retainer_balance", "balance_due")}),
         ("Permissions", {"fields": ("is_active", "is_staff", "is_superuser", "groups", "user_permissions")}),
         ("Important dates", {"fields": ("last_login", "date_joined")}),
     )
@@ -18,3 +18,12 @@ class UserAdmin(DjangoUserAdmin):
     list_display = ("email", "first_name", "last_name", "role", "is_staff")
     search_fields = ("email", "first_name", "last_name")
     ordering = ("email",)
+    # Maintained by finances.ledger; repair drift with the reconcile_balances command.
+    readonly_fields = ("balance_due",)
+
+
+# Hourly rates used by month-end billing (finances/billing.py)
+@admin.register(AdminProfile)
+class AdminProfileAdmin(admin.ModelAdmin):
+    list_display = ("user", "hourly_rate")
+    search_fields = ("user__email",)
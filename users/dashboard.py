@@ -0,0 +1,88 @@
+"""
+Per-user snapshot behind the client dashboard.
+
+The dashboard shows the client's balance and their next three appointments.
+The balance is User.balance_due, which finances.ledger keeps current on the
+user row that the auth middleware has already loaded, so it costs nothing.
+The appointments come from a per-user cache entry:
+
+- The snapshot holds the next SNAPSHOT_ROWS upcoming, non-cancelled
+  appointments. Reads drop the ones that have started since, so a snapshot
+  keeps serving until fewer than UPCOMING_LIMIT are left (and the user may
+  have more than it holds).
+- Any change to one of the user's appointments deletes their snapshot: the
+  post_save/post_delete receivers in appointments/signals.py, plus the
+  set-based updates in appointments/bulk.py and appointments/reattach.py.
+  Other users' snapshots are untouched.
+- A miss is rebuilt with one query.
+
+A steady-state dashboard load therefore runs only the auth middleware's user
+query, when sessions come from a shared cache (core/sessions.py).
+
+Invalidation only reaches every worker through a shared cache, so with a
+per-process one (settings.CACHE_IS_SHARED false) snapshots are not cached and
+each load runs the one query.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from appointments.models import Appointments
+
+CACHE_PREFIX = "users:dashboard"
+CACHE_TIMEOUT = 60 * 60 * 24
+UPCOMING_LIMIT = 3
+# Rows kept beyond UPCOMING_LIMIT so appointments passing don't force a rebuild.
+SNAPSHOT_ROWS = 6
+
+
+def _snapshot_key(user_id) -> str:
+    return f"{CACHE_PREFIX}:{user_id}"
+
+
+def _delete(user_ids):
+    cache.delete_many([_snapshot_key(pk) for pk in user_ids])
+
+
+def invalidate_dashboards(user_ids):
+    """Drop the cached snapshots of these users (None is ignored)."""
+    user_ids = {pk for pk in user_ids if pk is not None}
+    if not user_ids:
+        return
+    _delete(user_ids)
+    # A reader between this write and COMMIT could re-cache the old rows.
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _delete(user_ids))
+
+
+def _build(user_id, now):
+    rows = list(
+        Appointments.objects
+        .filter(user_id=user_id, start_time__gte=now)
+        .exclude(status=Appointments.Status.CANCELLED)
+        .order_by("start_time")
+        .only("start_time", "status", "comments")[:SNAPSHOT_ROWS]
+    )
+    return {"appointments": rows, "complete": len(rows) < SNAPSHOT_ROWS}
+
+
+def upcoming_appointments(user_id, now=None):
+    """
+    The user's next UPCOMING_LIMIT non-cancelled appointments, soonest first,
+    from their snapshot (rebuilt on a miss).
+    """
+    now = now or timezone.now()
+    if not settings.CACHE_IS_SHARED:
+        return _build(user_id, now)["appointments"][:UPCOMING_LIMIT]
+    key = _snapshot_key(user_id)
+
+    snapshot = cache.get(key)
+    if snapshot is not None:
+        upcoming = [appt for appt in snapshot["appointments"] if appt.start_time >= now]
+        if len(upcoming) >= UPCOMING_LIMIT or snapshot["complete"]:
+            return upcoming[:UPCOMING_LIMIT]
+
+    snapshot = _build(user_id, now)
+    cache.set(key, snapshot, CACHE_TIMEOUT)
+    return snapshot["appointments"][:UPCOMING_LIMIT]
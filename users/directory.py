@@ -0,0 +1,88 @@
+"""
+Admin client directory: clients with their appointment count, next
+appointment, open invoices and balance.
+
+A page is one query. The per-client numbers are correlated subqueries over
+the appointments and invoices user_id indexes, and the balance is the
+ledger-maintained balance_due column. Each sort order has a matching index on
+users (see User.Meta), so keyset paging reads one page of index entries and
+only those rows run the subqueries, however many clients there are.
+"""
+from decimal import Decimal
+
+from django.db.models import (
+    Count, DecimalField, ExpressionWrapper, F, IntegerField, Min, OuterRef, Q, Subquery, Value,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from appointments.models import Appointments
+from core.pagination import keyset_paginate
+from finances.ledger import OUTSTANDING_STATUSES
+from finances.models import Invoice
+
+from .emails import normalize_email
+from .models import User
+
+PAGE_SIZE = 50
+
+# Sort key -> (label, keyset ordering). Each ordering is an index on users.
+SORTS = {
+    "name": ("Name", ("last_name", "first_name", "id")),
+    "email": ("Email", ("email",)),
+    "balance": ("Balance", ("-balance_due", "-id")),
+    "joined": ("Newest", ("-date_joined", "-id")),
+}
+DEFAULT_SORT = "name"
+
+
+def clients():
+    return User.objects.filter(is_staff=False, is_superuser=False)
+
+
+def _per_client(qs, owner, aggregate):
+    return Subquery(
+        qs.filter(**{owner: OuterRef("pk")})
+        .order_by()
+        .values(owner)
+        .annotate(value=aggregate)
+        .values("value")[:1]
+    )
+
+
+def directory_queryset(search="", now=None):
+    now = now or timezone.now()
+    qs = clients()
+    search = (search or "").strip()
+    if search:
+        # Prefix matches, so both use an index.
+        qs = qs.filter(
+            Q(email_normalized__startswith=normalize_email(search)) | Q(last_name__istartswith=search)
+        )
+
+    upcoming = Q(start_time__gte=now) & ~Q(status=Appointments.Status.CANCELLED)
+    return qs.only(
+        "id", "email", "first_name", "last_name", "phone_number", "balance_due", "date_joined",
+    ).annotate(
+        balance_dollars=ExpressionWrapper(
+            F("balance_due") * Value(Decimal("0.01")),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+        appointment_count=Coalesce(
+            _per_client(Appointments.objects.all(), "user_id", Count("pk")),
+            Value(0),
+            output_field=IntegerField(),
+        ),
+        next_appointment=_per_client(Appointments.objects.all(), "user_id", Min("start_time", filter=upcoming)),
+        open_invoice_count=Coalesce(
+            _per_client(Invoice.objects.filter(status__in=OUTSTANDING_STATUSES), "user", Count("pk")),
+            Value(0),
+            output_field=IntegerField(),
+        ),
+    )
+
+
+def client_directory_page(sort=DEFAULT_SORT, search="", after=None, before=None, page_size=PAGE_SIZE, now=None):
+    """One page of the directory in `sort` order (unknown sorts fall back to name)."""
+    ordering = SORTS.get(sort, SORTS[DEFAULT_SORT])[1]
+    return keyset_paginate(directory_queryset(search, now), ordering, page_size, after=after, before=before)
@@ -0,0 +1,17 @@
+def normalize_email(value):
+    """
+    Canonical form used for email matching: trimmed and lower-cased.
+    (Django's BaseUserManager.normalize_email only lower-cases the domain.)
+    """
+    return (value or "").strip().lower()
+
+
+def users_by_email(email):
+    """
+    Users whose email matches `email` in normalized form (at most one).
+    Every lookup of an account by email should go through here: it is a
+    single probe of the unique email_normalized index.
+    """
+    from django.contrib.auth import get_user_model
+
+    return get_user_model().objects.filter(email_normalized=normalize_email(email))
@@ -0,0 +1,65 @@
+import time
+import uuid
+from unittest import mock
+
+from django.contrib.auth import authenticate
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from users.models import User
+
+
+def _page(request, template, context=None, status=200, **kwargs):
+    # Only the status matters here; keeps template rendering out of the timings.
+    return HttpResponse(status=status)
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test login throttling: fire a burst of wrong-password logins at one "
+        "account from one IP, with throttling off and on, and report password "
+        "checks and CPU time. Runs inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+
+    def _burst(self, count, enabled):
+        # Fresh account and address per run, so no earlier bucket is reused.
+        run = uuid.uuid4().hex[:12]
+        email = f"throttle-bench-{run}@example.invalid"
+        User.objects.create_user(email=email, password="correct horse", is_active=True)
+
+        checks = 0
+
+        def counted(*args, **kwargs):
+            nonlocal checks
+            checks += 1
+            return authenticate(*args, **kwargs)
+
+        client = Client(REMOTE_ADDR=f"bench-{run}")
+        statuses = {}
+        with override_settings(AUTH_THROTTLE_ENABLED=enabled, ALLOWED_HOSTS=["testserver"]), \
+                mock.patch("users.views.authenticate", side_effect=counted), \
+                mock.patch("users.views.render", side_effect=_page):
+            started = time.process_time()
+            for _ in range(count):
+                response = client.post(reverse("login"), {"email": email, "password": "wrong"})
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            cpu = time.process_time() - started
+        return checks, cpu, statuses
+
+    def handle(self, *args, **options):
+        count = options["requests"]
+        with transaction.atomic():
+            for enabled in (False, True):
+                checks, cpu, statuses = self._burst(count, enabled)
+                self.stdout.write(
+                    f"Throttle {'on ' if enabled else 'off'}: {count} requests, {checks} password checks, "
+                    f"CPU {cpu:.2f} s ({cpu / count * 1000:.1f} ms/request), "
+                    f"statuses {dict(sorted(statuses.items()))}"
+                )
+            transaction.set_rollback(True)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_adminprofile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='balance_due',
+            field=models.BigIntegerField(default=0, help_text='minor units (cents)'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:56
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def check_email_collisions(apps, schema_editor):
+    # Runs before the column is added, so the migration can simply be re-run
+    # once the duplicates are merged or renamed.
+    User = apps.get_model("users", "User")
+    accounts = defaultdict(list)
+    for pk, email in User.objects.values_list("pk", "email").order_by("pk").iterator(chunk_size=1000):
+        accounts[(email or "").strip().lower()].append((pk, email))
+    collisions = [rows for rows in accounts.values() if len(rows) > 1]
+    if collisions:
+        listing = "\n".join(
+            "  " + ", ".join(f"#{pk} {email}" for pk, email in rows) for rows in collisions
+        )
+        raise RuntimeError(
+            "These accounts differ only in email case and can't share the unique "
+            "normalized email. Merge or rename them, then run migrate again:\n" + listing
+        )
+
+
+def backfill_email_normalized(apps, schema_editor):
+    User = apps.get_model("users", "User")
+    batch = []
+    for user in User.objects.only("pk", "email").order_by("pk").iterator(chunk_size=1000):
+        user.email_normalized = (user.email or "").strip().lower() or None
+        batch.append(user)
+        if len(batch) >= 1000:
+            User.objects.bulk_update(batch, ["email_normalized"])
+            batch = []
+    if batch:
+        User.objects.bulk_update(batch, ["email_normalized"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_balance_due'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_email_collisions, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='user',
+            name='email_normalized',
+            field=models.CharField(editable=False, max_length=254, null=True),
+        ),
+        migrations.RunPython(backfill_email_normalized, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='user',
+            name='email_normalized',
+            field=models.CharField(editable=False, max_length=254, null=True, unique=True),
+        ),
+    ]
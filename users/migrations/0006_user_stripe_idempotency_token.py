@@ -0,0 +1,38 @@
+import uuid
+
+from django.db import migrations, models
+
+
+def fill_idempotency_tokens(apps, schema_editor):
+    # One token per row; AddField would give every existing user the same one.
+    User = apps.get_model("users", "User")
+    batch = []
+    for user in User.objects.only("pk").order_by("pk").iterator(chunk_size=1000):
+        user.stripe_idempotency_token = uuid.uuid4()
+        batch.append(user)
+        if len(batch) >= 1000:
+            User.objects.bulk_update(batch, ["stripe_idempotency_token"])
+            batch = []
+    if batch:
+        User.objects.bulk_update(batch, ["stripe_idempotency_token"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_directory_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='stripe_idempotency_token',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_idempotency_tokens, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='user',
+            name='stripe_idempotency_token',
+            field=models.UUIDField(default=uuid.uuid4, editable=False),
+        ),
+    ]
@@ -1,8 +1,12 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from allauth.account.models import EmailAddress
 from django.conf import settings
 
+from .emails import normalize_email
+
 class UserManager(BaseUserManager):
     use_in_migrations = True
     def _create_user(self, email, password, **extra_fields):
@@ -28,11 +32,18 @@ class UserManager(BaseUserManager):
         if extra_fields.get("is_superuser") is not True:
             raise ValueError("Superuser must have is_superuser=True.")
         return self._create_user(email, password, **extra_fields)
+
+    def get_by_natural_key(self, username):
+        # Login matches the email case-insensitively, through the unique index.
+        return self.get(email_normalized=normalize_email(username))
     
 # Create your models here.
 class User(AbstractUser):
     username = None
     email = models.EmailField("email address", unique=True)
+    # Trimmed, lower-cased copy of email for lookups (kept in sync in save()).
+    # Migration 0004 refuses to run while two accounts differ only in case.
+    email_normalized = models.CharField(max_length=254, unique=True, null=True, editable=False)
     class Role(models.TextChoices):
         GUEST = "GUEST", "Guest"
         CLIENT = "CLIENT", "Client"
@@ -44,13 +55,33 @@ class User(AbstractUser):
     phone_number = models.CharField(max_length=20, blank=True, null=True)
     payment_provider = models.CharField(max_length=50, blank=True, null=True)
     provider_customer_id = models.CharField(max_length=100,blank=True, null=True)
+    # Random part of the Stripe customer idempotency key (finances/customers.py).
+    stripe_idempotency_token = models.UUIDField(default=uuid.uuid4, editable=False)
     retainer_balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Total of outstanding invoices, maintained by finances.ledger.
+    balance_due = models.BigIntegerField(default=0, help_text="minor units (cents)")
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS=[]
 
     objects = UserManager()
 
+    class Meta(AbstractUser.Meta):
+        # Sort orders of the admin client directory (users/directory.py),
+        # each ending in the primary key for keyset paging.
+        indexes = [
+            models.Index(fields=["last_name", "first_name", "id"], name="user_name_idx"),
+            models.Index(fields=["balance_due", "id"], name="user_balance_idx"),
+            models.Index(fields=["date_joined", "id"], name="user_joined_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.email_normalized = normalize_email(self.email) or None
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "email" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "email_normalized"}
+        super().save(*args, **kwargs)
+
     @property
     def email_address(self):
         return EmailAddress.objects.get(user=self, email=self.email)
@@ -65,4 +96,4 @@ class AdminProfile(models.Model):
     hourly_rate = models.DecimalField(max_digits=8, decimal_places=2)
 
     def __str__(self):
-        return f"{self.email} ({self.role})"
\ No newline at end of file
+        return f"{self.user.email} (${self.hourly_rate}/h)"
\ No newline at end of file
@@ -1,3 +1,273 @@
-from django.test import TestCase
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth import authenticate
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.http import Http404, HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from appointments.bulk import bulk_update_status
+from appointments.models import Appointments
+from finances.ledger import create_invoice_record, set_invoice_status
+from finances.models import Invoice
+from sitecontent.content import latest_website_content
+from sitecontent.models import WebsiteContent
+
+from .emails import normalize_email, users_by_email
+from .dashboard import _snapshot_key, upcoming_appointments
+from .models import User
+from .throttle import reset_local_buckets, take_token, throttle_rates
+from .views import instant_email_confirm_view
+
+
+class NormalizedEmailTests(TestCase):
+    def test_save_keeps_normalized_email_in_step(self):
+        user = User.objects.create_user(email=" Ada@Example.COM ", password="pw")
+        self.assertEqual(user.email_normalized, "ada@example.com")
+
+        user.email = "Ada.Lovelace@Example.com"
+        user.save(update_fields=["email"])
+        user.refresh_from_db()
+        self.assertEqual(user.email_normalized, "ada.lovelace@example.com")
+
+    def test_case_variants_cannot_both_exist(self):
+        User.objects.create_user(email="ada@example.com", password="pw")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user(email="ADA@example.com", password="pw")
+
+    def test_lookup_is_one_query_on_the_normalized_column(self):
+        user = User.objects.create_user(email="ada@example.com", password="pw")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(users_by_email("  ADA@Example.com").get(), user)
+        self.assertEqual(len(queries.captured_queries), 1)
+        self.assertIn("email_normalized", queries.captured_queries[0]["sql"])
+
+    def test_login_ignores_email_case(self):
+        User.objects.create_user(email="ada@example.com", password="pw", is_active=True)
+        self.assertIsNotNone(authenticate(email="ADA@example.com ", password="pw"))
+
+        response = self.client.post(reverse("login"), {"email": "Ada@Example.com", "password": "pw"})
+        self.assertEqual(response.status_code, 302)
+
+    def test_signup_rejects_an_existing_email_in_another_case(self):
+        User.objects.create_user(email="ada@example.com", password="pw")
+        # The signup template needs the Google SocialApp configured; only the view matters here.
+        with mock.patch("users.views.render", return_value=HttpResponse()):
+            response = self.client.post(reverse("signup"), {
+                "first-name": "Ada", "last-name": "L", "email": "ADA@EXAMPLE.COM",
+                "password1": "long-enough-pw-1", "password2": "long-enough-pw-1",
+            })
+        self.assertEqual(
+            [str(m) for m in get_messages(response.wsgi_request)],
+            ["An account with that email already exists."],
+        )
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_backfill_fills_blanks(self):
+        user = User.objects.create_user(email="ada@example.com", password="pw")
+        User.objects.filter(pk=user.pk).update(email=" Ada@Example.com", email_normalized=None)
+
+        migration = import_module("users.migrations.0004_user_email_normalized")
+        migration.check_email_collisions(apps, None)
+        migration.backfill_email_normalized(apps, None)
+
+        user.refresh_from_db()
+        self.assertEqual(user.email_normalized, "ada@example.com")
+        user.save()
+
+    def test_migration_stops_on_case_collisions(self):
+        first = User.objects.create_user(email="ada@example.com", password="pw")
+        second = User.objects.create_user(email="grace@example.com", password="pw")
+        User.objects.create_user(email="alan@example.com", password="pw")
+        # Rows from before the column existed, one a case variant of another.
+        User.objects.filter(pk=first.pk).update(email="Ada@Example.com", email_normalized=None)
+        User.objects.filter(pk=second.pk).update(email="ADA@example.com", email_normalized=None)
+
+        migration = import_module("users.migrations.0004_user_email_normalized")
+        with self.assertRaises(RuntimeError) as raised:
+            migration.check_email_collisions(apps, None)
+
+        message = str(raised.exception)
+        self.assertIn(f"#{first.pk} Ada@Example.com, #{second.pk} ADA@example.com", message)
+        self.assertNotIn("alan@example.com", message)
+
+
+class AuthThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_local_buckets()
+        self.addCleanup(cache.clear)
+        self.addCleanup(reset_local_buckets)
+        User.objects.create_user(email="ada@example.com", password="pw", is_active=True)
+
+    def _login(self, email="ada@example.com", password="wrong", ip="203.0.113.7"):
+        return self.client.post(reverse("login"), {"email": email, "password": password}, REMOTE_ADDR=ip)
+
+    def test_burst_of_bad_logins_hashes_at_most_the_bucket_size(self):
+        # The load the limiter exists for: every password check is a full hash.
+        with mock.patch("users.views.authenticate", wraps=authenticate) as checks, \
+                mock.patch("users.views.render", side_effect=lambda *a, status=200, **k: HttpResponse(status=status)):
+            statuses = [self._login().status_code for _ in range(50)]
+
+        capacity = throttle_rates()["login-email"][0]
+        self.assertEqual(checks.call_count, capacity)
+        self.assertEqual(statuses, [401] * capacity + [429] * (50 - capacity))
+
+    @override_settings(AUTH_THROTTLE_RATES={"login-ip": (3, 60)})
+    def test_ip_bucket_covers_every_email_and_sets_retry_after(self):
+        with mock.patch("users.views.render", side_effect=lambda *a, status=200, **k: HttpResponse(status=status)):
+            statuses = [self._login(email=f"user{n}@example.com").status_code for n in range(4)]
+            other_ip = self._login(email="user9@example.com", ip="198.51.100.1")
+            blocked = self._login(email="someone@example.com")
+
+        self.assertEqual(statuses, [401, 401, 401, 429])
+        self.assertEqual(other_ip.status_code, 401)
+        self.assertEqual(blocked.status_code, 429)
+        # A token every 20 s; the hashes above already took part of that.
+        self.assertIn(int(blocked["Retry-After"]), range(1, 21))
+
+    @override_settings(AUTH_THROTTLE_RATES={"login-email": (2, 60)})
+    def test_email_bucket_ignores_case(self):
+        for email in ("ada@example.com", "ADA@example.com"):
+            take_token("login-email", normalize_email(email))
+        self.assertEqual(take_token("login-email", normalize_email(" Ada@Example.com")), 30)
+
+    def test_bucket_refills_over_time(self):
+        now = 1_000_000.0
+        capacity, period = throttle_rates()["signup-ip"]
+        for _ in range(capacity):
+            self.assertEqual(take_token("signup-ip", "203.0.113.7", now=now), 0)
+        self.assertGreater(take_token("signup-ip", "203.0.113.7", now=now), 0)
+        self.assertEqual(take_token("signup-ip", "203.0.113.7", now=now + period / capacity), 0)
+
+    def test_falls_back_to_local_buckets_when_the_cache_is_down(self):
+        with mock.patch("users.throttle.cache.get", side_effect=ConnectionError("down")), \
+                mock.patch("users.throttle.cache.set", side_effect=ConnectionError("down")):
+            capacity = throttle_rates()["confirm-ip"][0]
+            results = [take_token("confirm-ip", "203.0.113.7") for _ in range(capacity + 1)]
+        self.assertEqual(results[:capacity], [0] * capacity)
+        self.assertGreater(results[-1], 0)
+
+    @override_settings(AUTH_THROTTLE_RATES={"confirm-ip": (1, 60)})
+    def test_email_confirmation_is_throttled(self):
+        factory = RequestFactory()
+        with self.assertRaises(Http404):
+            instant_email_confirm_view(factory.get("/"), "not-a-key")
+        self.assertEqual(instant_email_confirm_view(factory.get("/"), "not-a-key").status_code, 429)
+
+    @override_settings(AUTH_THROTTLE_RATES={"confirm-ip": (1, 60)})
+    def test_confirm_email_url_is_throttled(self):
+        for path in ("/accounts/confirm-email/not-a-key/", "/users/accounts/confirm-email/not-a-key/"):
+            self.assertIs(resolve(path).func, instant_email_confirm_view)
+        self.assertEqual(self.client.get("/accounts/confirm-email/not-a-key/").status_code, 404)
+        self.assertEqual(self.client.get("/accounts/confirm-email/not-a-key/").status_code, 429)
+
+
+# Snapshots are only cached with a shared cache; locmem stands in here.
+@override_settings(CACHE_IS_SHARED=True)
+class ClientDashboardSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="ada@example.com", first_name="Ada", is_active=True)
+        self.other = User.objects.create_user(email="grace@example.com", is_active=True)
+        self.client.force_login(self.user)
+        self.url = reverse("client_dashboard")
+
+    def _appointment(self, user=None, days=1, **fields):
+        return Appointments.objects.create(
+            user_id=user or self.user, start_time=timezone.now() + timedelta(days=days), **fields
+        )
+
+    @override_settings(SESSION_ENGINE="core.sessions")
+    def test_steady_state_load_runs_only_the_user_query(self):
+        WebsiteContent.objects.create(footerDescription="Footer")
+        self._appointment(comments="Intake call")
+        self.client.get(self.url)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Intake call")
+        self.assertEqual(len(ctx.captured_queries), 1, [q["sql"] for q in ctx.captured_queries])
+
+    def test_miss_is_rebuilt_with_one_query(self):
+        self._appointment()
+        with self.assertNumQueries(1):
+            self.assertEqual(len(upcoming_appointments(self.user.pk)), 1)
+        with self.assertNumQueries(0):
+            upcoming_appointments(self.user.pk)
+
+    def test_appointment_changes_invalidate_only_the_owners_snapshot(self):
+        upcoming_appointments(self.user.pk)
+        upcoming_appointments(self.other.pk)
+
+        appt = self._appointment(comments="New booking")
+        self.assertIsNone(cache.get(_snapshot_key(self.user.pk)))
+        self.assertIsNotNone(cache.get(_snapshot_key(self.other.pk)))
+        self.assertContains(self.client.get(self.url), "New booking")
+
+        # Bulk status changes use a set-based UPDATE, which skips the signals.
+        bulk_update_status([appt.pk], Appointments.Status.CANCELLED, reason="Client request")
+        self.assertNotContains(self.client.get(self.url), "New booking")
+
+    def test_moving_an_appointment_invalidates_both_owners(self):
+        appt = self._appointment()
+        upcoming_appointments(self.user.pk)
+        upcoming_appointments(self.other.pk)
+
+        appt = Appointments.objects.get(pk=appt.pk)
+        appt.user_id = self.other
+        appt.save()
+
+        self.assertEqual(upcoming_appointments(self.user.pk), [])
+        self.assertEqual([a.pk for a in upcoming_appointments(self.other.pk)], [appt.pk])
+
+    def test_snapshot_drops_started_appointments_and_refills_when_short(self):
+        appts = [self._appointment(days=day) for day in range(1, 9)]
+        upcoming_appointments(self.user.pk)
+
+        later = timezone.now() + timedelta(days=2, hours=1)
+        with self.assertNumQueries(0):
+            self.assertEqual([a.pk for a in upcoming_appointments(self.user.pk, now=later)],
+                             [a.pk for a in appts[2:5]])
+
+        # Only three of the six cached rows are left after day 4; rebuild.
+        later = timezone.now() + timedelta(days=4, hours=1)
+        with self.assertNumQueries(1):
+            self.assertEqual([a.pk for a in upcoming_appointments(self.user.pk, now=later)],
+                             [a.pk for a in appts[4:7]])
+
+    def test_balance_follows_invoice_changes(self):
+        self.client.get(self.url)
+        invoice = create_invoice_record(user=self.user, amount=12345, stripe_invoice_id="in_dash")
+        self.assertContains(self.client.get(self.url), "$123.45")
+
+        set_invoice_status(invoice, Invoice.Status.PAID)
+        self.assertContains(self.client.get(self.url), "$0.00")
+
+    def test_website_content_changes_invalidate_the_cached_content(self):
+        content = WebsiteContent.objects.create(footerDescription="Old footer")
+        self.assertContains(self.client.get(self.url), "Old footer")
+
+        content.footerDescription = "New footer"
+        content.save()
+        self.assertContains(self.client.get(self.url), "New footer")
+
+    @override_settings(CACHE_IS_SHARED=False)
+    def test_per_process_cache_reads_the_database(self):
+        self._appointment()
+        WebsiteContent.objects.create(footerDescription="Footer")
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.assertEqual(len(upcoming_appointments(self.user.pk)), 1)
+            with self.assertNumQueries(1):
+                latest_website_content()
+        self.assertIsNone(cache.get(_snapshot_key(self.user.pk)))
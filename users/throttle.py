@@ -0,0 +1,127 @@
+"""
+Token-bucket throttling for the login, signup and email confirmation views.
+
+Each scope ("login-ip", "login-email", ...) keeps one bucket per key (client
+IP or normalized email). A bucket holds up to `capacity` tokens and refills
+evenly over `period` seconds; every attempt takes a token and an empty bucket
+means 429. The views check before authenticating or hashing anything, so a
+burst of bad logins costs a cache round trip per request instead of a PBKDF2
+hash.
+
+Buckets live in the default cache so every worker shares them. If the cache
+can't be reached they fall back to this process's memory, which still caps
+what one worker will hash. Two workers updating the same bucket at the same
+moment can both take the last token, so the shared limit is approximate by
+that much.
+
+Rates come from AUTH_THROTTLE_RATES ({scope: (capacity, period seconds)}),
+merged over DEFAULT_RATES. AUTH_THROTTLE_ENABLED=False turns throttling off.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .emails import normalize_email
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATES = {
+    "login-ip": (20, 60),
+    "login-email": (5, 300),
+    "signup-ip": (5, 3600),
+    "confirm-ip": (20, 300),
+}
+
+# In-memory fallback, used while the cache is down.
+_LOCAL_MAX = 10000
+_local = OrderedDict()
+_lock = threading.Lock()
+
+
+def throttle_rates():
+    return {**DEFAULT_RATES, **getattr(settings, "AUTH_THROTTLE_RATES", {})}
+
+
+def throttling_enabled() -> bool:
+    return bool(getattr(settings, "AUTH_THROTTLE_ENABLED", True))
+
+
+def client_ip(request):
+    return request.META.get("REMOTE_ADDR") or "unknown"
+
+
+def _bucket_key(scope, key):
+    # Hashed: keeps emails out of the cache and keys within memcached's limits.
+    return f"throttle:{scope}:{hashlib.sha256(key.encode()).hexdigest()[:32]}"
+
+
+def _load(bucket_key):
+    """(state, shared): the stored (tokens, stamp) or None, and whether it came from the cache."""
+    try:
+        return cache.get(bucket_key), True
+    except Exception as exc:
+        logger.warning("Throttle cache unavailable; using local buckets. error=%s", exc)
+        return _local.get(bucket_key), False
+
+
+def _store(bucket_key, state, timeout, shared):
+    if shared:
+        try:
+            cache.set(bucket_key, state, timeout)
+            return
+        except Exception as exc:
+            logger.warning("Throttle cache unavailable; using local buckets. error=%s", exc)
+    _local[bucket_key] = state
+    _local.move_to_end(bucket_key)
+    while len(_local) > _LOCAL_MAX:
+        _local.popitem(last=False)
+
+
+def take_token(scope, key, now=None):
+    """
+    Take one token from `scope`'s bucket for `key`.
+    Returns 0 when allowed, otherwise the seconds until a token is available.
+    """
+    capacity, period = throttle_rates()[scope]
+    rate = capacity / period
+    now = time.time() if now is None else now
+    bucket_key = _bucket_key(scope, key)
+
+    with _lock:
+        state, shared = _load(bucket_key)
+        tokens, stamp = state if state else (capacity, now)
+        tokens = min(capacity, tokens + max(now - stamp, 0) * rate)
+        if tokens < 1:
+            return math.ceil((1 - tokens) / rate)
+        # An untouched bucket is full again after `period`, so it can expire then.
+        _store(bucket_key, (tokens - 1, now), period, shared)
+    return 0
+
+
+def throttle(request, scope, email=None):
+    """
+    Take a token for the client's IP ("<scope>-ip") and, when `email` is given
+    and the scope has an email rate, for the email ("<scope>-email").
+    Returns 0 when the request may proceed, otherwise seconds until retry.
+    """
+    if not throttling_enabled():
+        return 0
+    rates = throttle_rates()
+    ip = client_ip(request)
+    wait = take_token(f"{scope}-ip", ip)
+    if not wait and email and f"{scope}-email" in rates:
+        wait = take_token(f"{scope}-email", normalize_email(email))
+    if wait:
+        logger.info("Auth request throttled. scope=%s ip=%s retry_after=%s", scope, ip, wait)
+    return wait
+
+
+def reset_local_buckets():
+    with _lock:
+        _local.clear()
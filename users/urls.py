@@ -9,6 +9,8 @@ urlpatterns = [
     path("signup/", views.signup, name="signup"),
     path("confirmation-page/", views.confirmation_page, name="confirmation_page"),
     path("client/dashboard", client_dashboard, name="client_dashboard"),
+    # Ahead of allauth.urls, which has its own (unthrottled) confirm-email view.
+    path("accounts/confirm-email/<str:key>/", views.instant_email_confirm_view, name="account_confirm_email"),
     path("accounts/", include("allauth.urls")),
  #   path('dashboard/', views.client_dashboard, name='client_dashboard'),
 
@@ -11,14 +11,17 @@ from allauth.account.models import EmailAddress, EmailConfirmation, get_emailcon
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.http import Http404
-from finances.models import Invoice
-from django.db.models import Sum
-from django.db.models.functions import Coalesce
+from .dashboard import upcoming_appointments
+from .emails import users_by_email
+from .throttle import throttle
+from .models import User
 from decimal import ROUND_HALF_UP, Decimal
 from appointments.models import Appointments
 from django.utils import timezone
 from django.core.exceptions import PermissionDenied
 from sitecontent.views import get_latest_website_content
+from finances.rollups import receivables_summary
+from core.kpis import dashboard_kpis
 
 
 # Directs to login page
@@ -38,10 +41,15 @@ def login_view(request):
         return render(request, "users/login.html", {"role": role})
 
     # POST
-    email = (request.POST.get("email") or "").strip().lower()
+    email = (request.POST.get("email") or "").strip()
     password = request.POST.get("password") or ""
 
-    # authenticate() will look up by USERNAME_FIELD (email in our model)
+    # Rate limit before authenticate(): every check costs a full password hash.
+    wait = throttle(request, "login", email=email)
+    if wait:
+        return _too_many_attempts(request, "users/login.html", wait, {"role": request.GET.get("role", "guest")})
+
+    # authenticate() looks the user up by normalized email (UserManager.get_by_natural_key)
     user = authenticate(request, email=email, password=password)
 
     if user is None:
@@ -60,6 +68,12 @@ def login_view(request):
         return redirect("admin_dashboard")
     return redirect("client_dashboard")
 
+def _too_many_attempts(request, template, wait, context=None):
+    messages.error(request, "Too many attempts. Please try again in a few minutes.")
+    response = render(request, template, context or {}, status=429)
+    response["Retry-After"] = str(wait)
+    return response
+
 def signup_page(r):
     return render(r, "users/signup.html")
 
@@ -68,6 +82,11 @@ def signup_page(r):
 def signup(r):
     User = get_user_model()
     if r.method == 'POST':
+        # Rate limit before anything is hashed or emailed.
+        wait = throttle(r, "signup")
+        if wait:
+            return _too_many_attempts(r, 'users/signup.html', wait)
+
         first_name = (r.POST.get('first-name') or "").strip()
         last_name = (r.POST.get('last-name') or "").strip()
         email = (r.POST.get('email') or "").strip()
@@ -85,7 +104,7 @@ def signup(r):
             messages.error(r, "Password cannot start or end with spaces.")
             return render(r, 'users/signup.html')
 
-        if User.objects.filter(email__iexact=email).exists():
+        if users_by_email(email).exists():
             messages.error(r, "An account with that email already exists.")
             return render(r, 'users/signup.html')
 
@@ -143,21 +162,16 @@ def confirmation_page(r):
     return render(r, 'users/confirmation-page.html')
 
 # Caclulate user balance helper function
-def get_user_balance_dollars(user_id):
+def get_user_balance_dollars(user):
     """
-    Calculates total unpaid invoice amount for the given user.
-    Converts from cents to dollars and rounds to 2 decimal places.
+    Returns the user's unpaid invoice total in dollars, rounded to 2 decimal places.
+    The total is kept up to date by finances.ledger on the user row, which
+    request.user has already loaded, so this runs no query.
     """
-    # get all unpaid invoices for this user
-    total_cents = (
-        # Any invoice that is not PAID counts toward the unpaid balance.
-        Invoice.objects.filter(user_id=user_id)
-        .exclude(status=Invoice.Status.PAID)
-        .aggregate(total=Coalesce(Sum("amount"), 0))["total"]
-    )
+    balance_cents = user.balance_due or 0
 
     # convert to dollars and round to 2 decimal places
-    balance_dollars = (Decimal(total_cents) / Decimal("100")).quantize(
+    balance_dollars = (Decimal(balance_cents) / Decimal("100")).quantize(
         Decimal("0.01"), rounding=ROUND_HALF_UP
     )
     return balance_dollars
@@ -166,16 +180,10 @@ def get_user_balance_dollars(user_id):
 def get_next_three_appointments(user_id):
     """
     Return the next 3 upcoming (non-cancelled) appointments for this user,
-    ordered soonest-first.
+    ordered soonest-first. Served from the user's cached dashboard snapshot
+    (users/dashboard.py).
     """
-    now = timezone.now()
-    qs = (
-        Appointments.objects
-        .filter(user_id=user_id, start_time__gte=now)
-        .exclude(status=Appointments.Status.CANCELLED)
-        .order_by("start_time")
-    )
-    return list(qs[:3])
+    return upcoming_appointments(user_id)
 
 # Get next three appointments admin helper function
 def admin_get_next_three_appointments(user=None):
@@ -205,7 +213,7 @@ def admin_get_next_three_appointments(user=None):
 def client_dashboard(request):
     user = request.user
     content = get_latest_website_content()
-    balance_dollars = get_user_balance_dollars(user.id)
+    balance_dollars = get_user_balance_dollars(user)
     upcoming_appts = get_next_three_appointments(user.id)   
     return render(request, "client/dashboard.html", {
         "user": user,
@@ -225,14 +233,34 @@ def is_admin_user(user):
 def admin_dashboard(r): 
     content = get_latest_website_content()
     upcoming_appts = admin_get_next_three_appointments(r.user)
+    # Receivables cards read the invoice rollups, not the invoices table.
+    receivables = receivables_summary()
+    # Appointment, invoice and client counts come from one maintained row.
+    kpis = dashboard_kpis()
     return render(r, "admin/dashboard.html", {
         "upcoming_appts": upcoming_appts,
-        "content": content
+        "content": content,
+        "kpis": kpis,
+        "outstanding_dollars": Decimal(receivables["outstanding"]) / 100,
+        "outstanding_count": receivables["outstanding_count"],
+        "month_invoiced_dollars": Decimal(receivables["month"]["invoiced"]) / 100,
+        "month_paid_dollars": Decimal(receivables["month"]["paid"]) / 100,
+        "aging": [
+            {**bucket, "amount_dollars": Decimal(bucket["amount"]) / 100}
+            for bucket in receivables["aging"]
+        ],
     })
 
 
 # Email confirmation redirection view
 def instant_email_confirm_view(r, key):
+    # Keeps key guessing slow.
+    wait = throttle(r, "confirm")
+    if wait:
+        response = HttpResponse("Too many attempts. Please try again later.", status=429)
+        response["Retry-After"] = str(wait)
+        return response
+
     confirmation = EmailConfirmationHMAC.from_key(key)
     if not confirmation:
         try: